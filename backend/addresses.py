@@ -0,0 +1,30 @@
+"""Process-wide cache of checksummed addresses.
+
+``to_checksum_address`` runs a keccak hash on every call, and the same few
+account and contract addresses are checksummed over and over. Results are
+memoized here so the shared strings are reused across requests.
+"""
+import os
+from functools import lru_cache
+
+from eth_utils import to_checksum_address
+
+CHECKSUM_CACHE_SIZE = int(os.getenv('CHECKSUM_CACHE_SIZE', '65536'))
+
+
+@lru_cache(maxsize=CHECKSUM_CACHE_SIZE)
+def checksum_address(address):
+    """``to_checksum_address`` with memoization; raises ValueError for invalid input."""
+    return to_checksum_address(address)
+
+
+def checksum_cache_stats():
+    info = checksum_address.cache_info()
+    lookups = info.hits + info.misses
+    return {
+        'entries': info.currsize,
+        'max_entries': info.maxsize,
+        'hits': info.hits,
+        'misses': info.misses,
+        'hit_ratio': round(info.hits / lookups, 4) if lookups else None
+    }
@@ -0,0 +1,403 @@
+"""Loyalty analytics over columnar NumPy copies of the event index.
+
+Vouchers and redemptions come from the indexer's database, which holds the
+``VoucherCreated`` and ``VoucherRedeemed`` logs (with ``redemptionTime``, the
+block timestamp ``getRedemptionDetails`` reports) and the blocks in which
+redemptions were marked fulfilled. Fulfilments are read by the index's change
+sequence rather than by block, since they can be recorded well after their
+block has been indexed. They are kept here as parallel NumPy
+arrays, with business and customer addresses dictionary-encoded as small
+integers, so every grouped aggregate is a vectorized ``np.bincount`` over
+those codes rather than a loop over rows. Each refresh appends only what
+was indexed since the previous one, and results are cached until new rows
+arrive.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+SORT_KEYS = ('points', 'redemptions', 'uniqueCustomers')
+
+
+class _Column:
+    """A NumPy array that grows by doubling, so appends are amortized O(1)."""
+
+    __slots__ = ('data', 'size')
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=self.data.dtype)
+        needed = self.size + len(values)
+        if needed > len(self.data):
+            grown = np.empty(max(needed, 2 * len(self.data)), dtype=self.data.dtype)
+            grown[:self.size] = self.data[:self.size]
+            self.data = grown
+        self.data[self.size:needed] = values
+        self.size = needed
+
+    @property
+    def values(self):
+        return self.data[:self.size]
+
+
+class _Codes:
+    """Dictionary encoding of addresses as consecutive integers."""
+
+    __slots__ = ('codes', 'addresses')
+
+    def __init__(self):
+        self.codes = {}
+        self.addresses = []
+
+    def encode(self, address):
+        code = self.codes.get(address)
+        if code is None:
+            code = self.codes[address] = len(self.addresses)
+            self.addresses.append(address)
+        return code
+
+    def __len__(self):
+        return len(self.addresses)
+
+
+def _lag_summary(lags):
+    if not len(lags):
+        return {'count': 0, 'meanSeconds': None, 'p50Seconds': None, 'p95Seconds': None, 'maxSeconds': None}
+    p50, p95 = np.percentile(lags, [50, 95])
+    return {
+        'count': int(len(lags)),
+        'meanSeconds': round(float(lags.mean()), 1),
+        'p50Seconds': round(float(p50), 1),
+        'p95Seconds': round(float(p95), 1),
+        'maxSeconds': int(lags.max())
+    }
+
+
+def _time_pattern(times, points, utc_offset):
+    """Redemptions and points by hour of day and by weekday (Monday first) in ``utc_offset`` minutes."""
+    local = times + utc_offset * 60
+    hours = (local // 3600) % 24
+    # 1 January 1970 was a Thursday
+    weekdays = (local // 86400 + 3) % 7
+    return {
+        'byHour': {
+            'redemptions': np.bincount(hours, minlength=24).tolist(),
+            'points': np.bincount(hours, weights=points, minlength=24).astype(np.int64).tolist()
+        },
+        'byWeekday': {
+            'redemptions': np.bincount(weekdays, minlength=7).tolist(),
+            'points': np.bincount(weekdays, weights=points, minlength=7).astype(np.int64).tolist()
+        }
+    }
+
+
+class LoyaltyAnalytics:
+    """Grouped redemption aggregates per voucher, business, time of day and fulfilment lag."""
+
+    def __init__(self, indexer, cache_size=256):
+        self.indexer = indexer
+        self.cache_size = cache_size
+        self._lock = threading.Lock()
+        self._cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.refreshes = 0
+        self.refresh_seconds = 0.0
+        indexer.rollback_listeners.append(self.invalidate)
+        self._reset()
+
+    def _reset(self):
+        self.block = self.indexer.start_block - 1
+        # Last fulfilment change read, and fulfilments of redemptions not loaded yet
+        self.fulfilment_seq = -1
+        self._unmatched = []
+        self.version = 0
+        self._businesses = _Codes()
+        self._customers = _Codes()
+        self._block_times = {}
+        self._cache.clear()
+        # Vouchers, in id order
+        self._v_id = _Column(np.int64)
+        self._v_business = _Column(np.int32)
+        self._v_cost = _Column(np.int64)
+        self._v_active = _Column(np.bool_)
+        self._v_title = []
+        # Redemptions, in id order; fulfilled_time is -1 until fulfilled
+        self._r_id = _Column(np.int64)
+        self._r_voucher = _Column(np.int32)
+        self._r_business = _Column(np.int32)
+        self._r_customer = _Column(np.int32)
+        self._r_points = _Column(np.int64)
+        self._r_time = _Column(np.int64)
+        self._r_fulfilled_time = _Column(np.int64)
+
+    def start(self, head):
+        """Refresh in the background on every new block, so queries find the arrays current."""
+        wake = threading.Event()
+        head.subscribe(lambda block_number: wake.set())
+
+        def run():
+            while True:
+                wake.wait()
+                wake.clear()
+                if not self.indexer.is_ready():
+                    continue
+                try:
+                    with self._lock:
+                        self._refresh()
+                except Exception as e:
+                    print(f"Analytics: refresh failed: {e}")
+
+        threading.Thread(target=run, name='analytics', daemon=True).start()
+        return self
+
+    def invalidate(self):
+        """Drop everything after a reorg rolled the index back; the next query reloads."""
+        with self._lock:
+            self._reset()
+
+    # Loading
+
+    def _refresh(self):
+        until = self.indexer.last_block
+        if until < self.block:
+            self._reset()
+        start = time.perf_counter()
+        changed = False
+        advanced = until > self.block
+        if advanced:
+            changed |= self._load_vouchers(self.block, until)
+            changed |= self._load_redemptions(self.block, until)
+            self.block = until
+        # Fulfilments may be recorded without a new block being indexed
+        changed |= self._load_fulfilments()
+        if changed:
+            self.version += 1
+            self._cache.clear()
+        if advanced or changed:
+            self.refreshes += 1
+            self.refresh_seconds += time.perf_counter() - start
+
+    def _load_vouchers(self, since, until):
+        rows = self.indexer.vouchers_between(since, until)
+        if rows:
+            self._v_id.extend([row['id'] for row in rows])
+            self._v_business.extend([self._businesses.encode(row['business']) for row in rows])
+            self._v_cost.extend([row['point_cost'] for row in rows])
+            self._v_active.extend([bool(row['is_active']) for row in rows])
+            self._v_title.extend(row['title'] for row in rows)
+        changes = self.indexer.status_changes_between(since, until)
+        if changes:
+            ids = np.array([row['voucher_id'] for row in changes], dtype=np.int64)
+            positions, found = self._positions(self._v_id.values, ids)
+            # Later changes come later in the list, so the last assignment wins
+            self._v_active.values[positions[found]] = np.array([bool(row['is_active']) for row in changes])[found]
+        return bool(rows or changes)
+
+    def _load_redemptions(self, since, until):
+        rows = self.indexer.redemptions_between(since, until)
+        if not rows:
+            return False
+        voucher_ids = np.array([row['voucher_id'] for row in rows], dtype=np.int64)
+        positions, found = self._positions(self._v_id.values, voucher_ids)
+        if not found.all():
+            print(f"Analytics: {int((~found).sum())} redemptions of unindexed vouchers skipped")
+        rows = [row for row, ok in zip(rows, found) if ok]
+        positions = positions[found]
+        self._r_id.extend([row['id'] for row in rows])
+        self._r_voucher.extend(positions)
+        self._r_business.extend(self._v_business.values[positions])
+        self._r_points.extend(self._v_cost.values[positions])
+        self._r_customer.extend([self._customers.encode(row['customer']) for row in rows])
+        self._r_time.extend([row['redemption_time'] for row in rows])
+        self._r_fulfilled_time.extend(np.full(len(rows), -1, dtype=np.int64))
+        return True
+
+    def _load_fulfilments(self):
+        rows = self.indexer.fulfilments_after(self.fulfilment_seq)
+        if rows:
+            self.fulfilment_seq = rows[-1]['seq']
+        rows = self._unmatched + [(row['redemption_id'], row['block_number']) for row in rows]
+        if not rows:
+            return False
+        missing = {block_number for _, block_number in rows} - self._block_times.keys()
+        if missing:
+            self._block_times.update(self.indexer.block_timestamps(missing))
+        ids = np.array([redemption_id for redemption_id, _ in rows], dtype=np.int64)
+        positions, found = self._positions(self._r_id.values, ids)
+        # Redemptions above the last loaded id are in blocks indexed after this refresh began
+        last_id = self._r_id.values[-1] if len(self._r_id.values) else 0
+        self._unmatched = [row for row, ok in zip(rows, found) if not ok and row[0] > last_id]
+        times = np.array([self._block_times[block_number] for _, block_number in rows], dtype=np.int64)
+        # New fulfilments land in the newest block seen or later ones, so older timestamps are only kept for
+        # fulfilments still waiting on their redemption (a rollback drops them all with the rest)
+        keep = {block_number for _, block_number in self._unmatched}
+        keep.add(max(block_number for _, block_number in rows))
+        self._block_times = {block_number: timestamp for block_number, timestamp in self._block_times.items()
+                             if block_number in keep}
+        column = self._r_fulfilled_time.values
+        changed = (column[positions[found]] != times[found]).any()
+        column[positions[found]] = times[found]
+        return bool(changed)
+
+    @staticmethod
+    def _positions(sorted_ids, ids):
+        """Indexes of ``ids`` in ``sorted_ids``, and which of them are present."""
+        positions = np.searchsorted(sorted_ids, ids)
+        clipped = np.minimum(positions, max(len(sorted_ids) - 1, 0))
+        found = (positions < len(sorted_ids)) & (sorted_ids[clipped] == ids) if len(sorted_ids) else \
+            np.zeros(len(ids), dtype=bool)
+        return clipped, found
+
+    # Queries
+
+    def _cached(self, key, compute):
+        with self._lock:
+            self._refresh()
+            key = (self.version,) + key
+            result = self._cache.get(key)
+            if result is not None:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return result
+            self.misses += 1
+            result = compute()
+            result['block'] = self.block
+            self._cache[key] = result
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return result
+
+    def _window(self, start, end):
+        times = self._r_time.values
+        mask = np.ones(len(times), dtype=bool)
+        if start is not None:
+            mask &= times >= start
+        if end is not None:
+            mask &= times < end
+        return mask
+
+    def business_report(self, address, start=None, end=None, utc_offset=0):
+        """Redemptions of one business's vouchers, per voucher and over time."""
+        return self._cached(('business', address, start, end, utc_offset),
+                            lambda: self._business_report(address, start, end, utc_offset))
+
+    def _business_report(self, address, start, end, utc_offset):
+        code = self._businesses.codes.get(address)
+        if code is None:
+            return {'totals': {'redemptions': 0, 'points': 0, 'uniqueCustomers': 0, 'fulfilled': 0, 'pending': 0},
+                    'vouchers': [], 'fulfilmentLag': _lag_summary(np.empty(0)),
+                    **_time_pattern(np.empty(0, dtype=np.int64), np.empty(0), utc_offset)}
+        mask = self._window(start, end) & (self._r_business.values == code)
+        vouchers = self._r_voucher.values[mask]
+        points = self._r_points.values[mask]
+        times = self._r_time.values[mask]
+        fulfilled_time = self._r_fulfilled_time.values[mask]
+        fulfilled = fulfilled_time >= 0
+        lags = fulfilled_time[fulfilled] - times[fulfilled]
+
+        own = np.flatnonzero(self._v_business.values == code)
+        size = len(self._v_id.values)
+        redemptions = np.bincount(vouchers, minlength=size)[own]
+        fulfilled_counts = np.bincount(vouchers[fulfilled], minlength=size)[own]
+        lag_sums = np.bincount(vouchers[fulfilled], weights=lags, minlength=size)[own]
+        costs = self._v_cost.values[own]
+        return {
+            'totals': {
+                'redemptions': int(mask.sum()),
+                'points': int(points.sum()),
+                'uniqueCustomers': int(len(np.unique(self._r_customer.values[mask]))),
+                'fulfilled': int(fulfilled.sum()),
+                'pending': int((~fulfilled).sum())
+            },
+            'vouchers': [{
+                'id': int(self._v_id.values[position]),
+                'title': self._v_title[position],
+                'pointCost': int(costs[i]),
+                'isActive': bool(self._v_active.values[position]),
+                'redemptions': int(redemptions[i]),
+                'points': int(redemptions[i] * costs[i]),
+                'fulfilled': int(fulfilled_counts[i]),
+                'meanLagSeconds': round(float(lag_sums[i] / fulfilled_counts[i]), 1) if fulfilled_counts[i] else None
+            } for i, position in enumerate(own)],
+            'fulfilmentLag': _lag_summary(lags),
+            **_time_pattern(times, points, utc_offset)
+        }
+
+    def overview(self, start=None, end=None, utc_offset=0, sort='points', limit=100):
+        """Totals across all businesses, and the top ``limit`` businesses by ``sort``."""
+        return self._cached(('overview', start, end, utc_offset, sort, limit),
+                            lambda: self._overview(start, end, utc_offset, sort, limit))
+
+    def _overview(self, start, end, utc_offset, sort, limit):
+        mask = self._window(start, end)
+        businesses = self._r_business.values[mask]
+        customers = self._r_customer.values[mask]
+        points = self._r_points.values[mask]
+        times = self._r_time.values[mask]
+        fulfilled_time = self._r_fulfilled_time.values[mask]
+        fulfilled = fulfilled_time >= 0
+        lags = fulfilled_time[fulfilled] - times[fulfilled]
+
+        size = len(self._businesses)
+        per_business = {
+            'redemptions': np.bincount(businesses, minlength=size),
+            'points': np.bincount(businesses, weights=points, minlength=size).astype(np.int64)
+        }
+        # Distinct (business, customer) pairs, counted per business
+        pairs = np.unique(businesses.astype(np.int64) * max(len(self._customers), 1) + customers)
+        per_business['uniqueCustomers'] = np.bincount(pairs // max(len(self._customers), 1), minlength=size)
+        fulfilled_counts = np.bincount(businesses[fulfilled], minlength=size)
+        lag_sums = np.bincount(businesses[fulfilled], weights=lags, minlength=size)
+        voucher_counts = np.bincount(self._v_business.values, minlength=size)
+        active_counts = np.bincount(self._v_business.values[self._v_active.values], minlength=size)
+
+        ranking = per_business[sort]
+        if limit < size:
+            top = np.argpartition(-ranking, limit)[:limit]
+            top = top[np.argsort(-ranking[top], kind='stable')]
+        else:
+            top = np.argsort(-ranking, kind='stable')
+        return {
+            'totals': {
+                'businesses': size,
+                'customers': int(len(np.unique(customers))),
+                'vouchers': int(len(self._v_id.values)),
+                'activeVouchers': int(self._v_active.values.sum()),
+                'redemptions': int(mask.sum()),
+                'points': int(points.sum()),
+                'fulfilled': int(fulfilled.sum()),
+                'pending': int((~fulfilled).sum())
+            },
+            'businesses': [{
+                'businessAddress': self._businesses.addresses[code],
+                'redemptions': int(per_business['redemptions'][code]),
+                'points': int(per_business['points'][code]),
+                'uniqueCustomers': int(per_business['uniqueCustomers'][code]),
+                'vouchers': int(voucher_counts[code]),
+                'activeVouchers': int(active_counts[code]),
+                'fulfilled': int(fulfilled_counts[code]),
+                'meanLagSeconds': round(float(lag_sums[code] / fulfilled_counts[code]), 1)
+                if fulfilled_counts[code] else None
+            } for code in top.tolist()],
+            'fulfilmentLag': _lag_summary(lags),
+            **_time_pattern(times, points, utc_offset)
+        }
+
+    def stats(self):
+        return {
+            'block': self.block,
+            'vouchers': self._v_id.size,
+            'redemptions': self._r_id.size,
+            'businesses': len(self._businesses),
+            'customers': len(self._customers),
+            'hits': self.hits,
+            'misses': self.misses,
+            'refreshes': self.refreshes,
+            'avg_refresh_ms': round(self.refresh_seconds / self.refreshes * 1000, 2) if self.refreshes else None
+        }
@@ -1,169 +1,324 @@
 import json
 import os
 import secrets
-from flask import Flask, request, jsonify, session
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from flask import Blueprint, Flask, Response, current_app, request, jsonify, session, stream_with_context
 from flask_cors import CORS
-from web3 import Web3
 import jwt
 from datetime import datetime, timedelta
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
 from dotenv import load_dotenv
+from web3.logs import DISCARD
 
-# Load environment variables
+# Load environment variables before the local modules read their settings
 load_dotenv()
+IMPORT_STARTED = time.perf_counter()
 
-app = Flask(__name__)
-CORS(app, supports_credentials=True)
+from addresses import checksum_address, checksum_cache_stats
+from analytics import SORT_KEYS as ANALYTICS_SORT_KEYS, LoyaltyAnalytics
+from chain_head import ChainHead
+from chain_meta import ChainMeta, PreflightError
+from contracts import create_contracts, redemption_dict, voucher_dict
+from dashboard import VoucherDetailsMemo, fan_out
+from event_feed import EventFeed, format_sse
+from export import (EXPORT_FORMATS, REDEMPTION_FIELDS, VOUCHER_FIELDS, RedemptionExport, voucher_batches,
+                    write_csv, write_ndjson)
+from gas_strategy import OUT_OF_GAS, GasStrategy
+from http_cache import compress_responses, conditional, etag
+from indexer import create_indexer
+from metrics import REGISTRY as metrics_registry, instrument_app
+from nonce_manager import NonceManagers
+from pagination import MAX_PAGE_SIZE, iter_pages, list_response, page_args, take_page
+from password_hasher import HasherBusy, create_password_hasher
+from points_issuance import aggregate, iter_raw_rows, validate_rows
+from profiling import RequestProfiler
+from providers import create_web3
+from rpc_batch import batch_call, raise_errors
+from rpc_scheduler import BACKGROUND, SCHEDULER as rpc_scheduler, rpc_priority
+from shared_state import create_shared_state, load_secrets
+import tracing
+from token_cache import TokenCache
+from tx_watcher import TxWatcher
+from user_store import DuplicateUserError, create_user_store
+from view_cache import ViewCache
+from voucher_search import SORT_ORDERS, VoucherSearch
 
-# Generate a random secret key
-app.secret_key = secrets.token_hex(16)
-JWT_SECRET = app.secret_key
-ADMIN_PASSWORD = secrets.token_hex(8)  # Generate admin password
+# Routes live on a blueprint; create_app() builds the Flask app around it
+api = Blueprint('api', __name__)
+
+# Signing secret and admin password: from the environment, a keyfile shared by
+# every worker process (SECRETS_FILE), or random per process
+app_secrets = load_secrets(os.getenv('SECRETS_FILE', ''))
+JWT_SECRET = app_secrets['jwt_secret']
+ADMIN_PASSWORD = app_secrets['admin_password']
+
+# Transaction records, nonces and the indexer lease shared by worker processes
+# (SHARED_STATE_DB); None when running as a single process
+shared_state = create_shared_state()
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}"
+INDEX_LEASE_TTL = float(os.getenv('INDEX_LEASE_TTL', '15'))
+
+# Worker processes for password hashing, started before any background threads
+password_hasher = create_password_hasher()
+PASSWORD_HASH_RETRY_AFTER = os.getenv('PASSWORD_HASH_RETRY_AFTER', '1')
 
 # Connect to blockchain
-w3 = Web3(Web3.HTTPProvider(os.getenv('BLOCKCHAIN_PROVIDER', 'http://127.0.0.1:7545')))  # Use env var with fallback
-
-# Load contract ABIs
-def load_abi(filename):
-    with open(os.path.join('abi', filename)) as f:
-        return json.load(f)
-
-# Contract ABIs
-loyalty_token_abi = load_abi('LoyaltyToken.json')
-business_registry_abi = load_abi('BusinessRegistry.json')
-voucher_abi = load_abi('Voucher.json')
-factory_abi = load_abi('LoyaltySystemFactory.json')
-
-# Set contract addresses (these would be set after deployment)
-factory_address = os.getenv('FACTORY_ADDRESS', '')
-loyalty_token_address = os.getenv('TOKEN_ADDRESS', '')
-business_registry_address = os.getenv('REGISTRY_ADDRESS', '')
-voucher_address = os.getenv('VOUCHER_ADDRESS', '')
-
-print(f"Factory address from env: '{factory_address}'")
-print(f"Token address from env: '{loyalty_token_address}'")
-print(f"Registry address from env: '{business_registry_address}'")
-print(f"Voucher address from env: '{voucher_address}'")
-
-# Convert addresses to checksum format
-if factory_address and factory_address.strip():
-    try:
-        factory_address = w3.toChecksumAddress(factory_address)
-        print(f"Checksum factory address: {factory_address}")
-    except Exception as e:
-        print(f"Error converting factory address: {e}")
-        
-if loyalty_token_address and loyalty_token_address.strip():
-    try:
-        loyalty_token_address = w3.toChecksumAddress(loyalty_token_address)
-        print(f"Checksum token address: {loyalty_token_address}")
-    except Exception as e:
-        print(f"Error converting token address: {e}")
-        
-if business_registry_address and business_registry_address.strip():
-    try:
-        business_registry_address = w3.toChecksumAddress(business_registry_address)
-        print(f"Checksum registry address: {business_registry_address}")
-    except Exception as e:
-        print(f"Error converting registry address: {e}")
-        
-if voucher_address and voucher_address.strip():
-    try:
-        voucher_address = w3.toChecksumAddress(voucher_address)
-        print(f"Checksum voucher address: {voucher_address}")
-    except Exception as e:
-        print(f"Error converting voucher address: {e}")
+w3 = create_web3()  # BLOCKCHAIN_PROVIDER / BLOCKCHAIN_TRANSPORT select the transport
 
-# Initialize contract objects
-if factory_address and factory_address.strip():
-    try:
-        factory_contract = w3.eth.contract(address=factory_address, abi=factory_abi)
-        print(f"Factory contract initialized: {factory_address}")
-        
-        # Try to get the admin address to verify the contract is working
-        try:
-            admin = factory_contract.functions.admin().call()
-            print(f"Factory admin address: {admin}")
-        except Exception as e:
-            print(f"Warning: Could not get factory admin: {e}")
-        
-        if not loyalty_token_address or not business_registry_address or not voucher_address:
-            try:
-                admin, token, registry, voucher = factory_contract.functions.getSystemAddresses().call()
-                loyalty_token_address = w3.toChecksumAddress(token)
-                business_registry_address = w3.toChecksumAddress(registry)
-                voucher_address = w3.toChecksumAddress(voucher)
-                print(f"Got addresses from factory: {token}, {registry}, {voucher}")
-            except Exception as e:
-                print(f"Error getting addresses from factory: {e}")
-    except Exception as e:
-        print(f"Error initializing factory contract: {e}")
-        factory_contract = None
+# One poller for the chain head, shared by the indexer and the receipt watcher
+chain_head = ChainHead(w3, poll_interval=float(os.getenv('HEAD_POLL_INTERVAL', '1')))
 
-token_contract = None
-if loyalty_token_address and loyalty_token_address.strip():
-    try:
-        token_contract = w3.eth.contract(address=loyalty_token_address, abi=loyalty_token_abi)
-        print(f"Token contract initialized: {loyalty_token_address}")
-    except Exception as e:
-        print(f"Error initializing token contract: {e}")
+# Contracts are resolved on first use, so importing the app never waits on the node
+contracts = create_contracts(w3)
+
+# Accounts, chain id, contract admins and business approvals, read once
+chain_meta = ChainMeta(w3, contracts, negative_ttl=float(os.getenv('APPROVAL_CACHE_TTL', '30')))
+
+# Per-block memoization of contract view calls
+view_cache = None
+if os.getenv('VIEW_CACHE_ENABLED', 'true').lower() == 'true':
+    view_cache = ViewCache(
+        chain_head,
+        max_entries=int(os.getenv('VIEW_CACHE_MAX_ENTRIES', '50000')),
+        max_bytes=int(os.getenv('VIEW_CACHE_MAX_MB', '64')) * 1024 * 1024,
+        max_head_age=float(os.getenv('VIEW_CACHE_MAX_HEAD_AGE', '0.5'))
+    )
 
-registry_contract = None
-if business_registry_address and business_registry_address.strip():
+def cached_call(fn):
+    # Time beyond the rpc span under it is view-cache work and ABI encoding and decoding
+    with tracing.span('contract.call', fn.fn_name):
+        return view_cache.call(fn) if view_cache is not None else fn.call()
+
+def cached_batch_call(fns):
+    with tracing.span('contract.batch_call', fns[0].fn_name if fns else None, calls=len(fns)):
+        return view_cache.call_many(w3, fns) if view_cache is not None else batch_call(w3, fns)
+
+# Event indexer serving the catalog, business-voucher and redemption routes,
+# started in the background once the contracts resolve
+indexer = None
+
+# In-memory catalog search, kept up to date by the indexer
+voucher_search = VoucherSearch()
+
+# Columnar redemption history for the analytics routes, created with the indexer
+analytics = None
+
+# create_app() can run more than once per process (tests, reloads), but only one indexer may write the index
+indexer_started = False
+indexer_started_lock = threading.Lock()
+
+def start_indexer_once():
+    global indexer_started
+    with indexer_started_lock:
+        if indexer_started:
+            return
+        indexer_started = True
+    threading.Thread(target=start_indexer, name='indexer-start', daemon=True).start()
+
+def start_indexer():
+    global indexer, analytics
+    while not contracts.resolved:
+        contracts.resolve()
+        if not contracts.resolved:
+            time.sleep(contracts.retry_interval)
+    if contracts.voucher is None or contracts.registry is None:
+        return
     try:
-        registry_contract = w3.eth.contract(address=business_registry_address, abi=business_registry_abi)
-        print(f"Registry contract initialized: {business_registry_address}")
-        
-        # Try to get the admin address to verify the contract is working
-        try:
-            admin = registry_contract.functions.admin().call()
-            print(f"Registry admin address: {admin}")
-        except Exception as e:
-            print(f"Warning: Could not get registry admin: {e}")
+        indexer = create_indexer(w3, contracts.voucher, contracts.registry)
+        if shared_state is not None:
+            # One worker writes the index; the rest follow it
+            indexer.lease = lambda: shared_state.hold_lease('indexer', WORKER_ID, INDEX_LEASE_TTL)
+        indexer.approval_listeners.append(chain_meta.business_approved)
+        voucher_search.attach(indexer)
+        event_feed.attach(indexer)
+        if os.getenv('ANALYTICS_ENABLED', 'true').lower() == 'true':
+            analytics = LoyaltyAnalytics(indexer, cache_size=int(os.getenv('ANALYTICS_CACHE_SIZE', '256')))
+            analytics.start(chain_head)
+        indexer.start(chain_head)
+        print(f"Event indexer started: {indexer.db_path}")
     except Exception as e:
-        print(f"Error initializing registry contract: {e}")
+        print(f"Error starting event indexer: {e}")
+
+def index_ready():
+    return indexer is not None and indexer.is_ready()
+
+def state_tag(scope, indexed=None):
+    # ETag for a read of ``scope`` (see EventIndexer.version); the head block while the index catches up.
+    # ``indexed`` says where the body comes from, when the route has already decided
+    if index_ready() if indexed is None else indexed:
+        return etag('index', scope, *indexer.version(scope))
+    block_number = chain_head.block_number
+    return etag('chain', scope, block_number) if block_number is not None else None
+
+def sync_index(receipt):
+    # Let the index catch up with a write so the next read sees it
+    if indexer is not None:
+        indexer.wait_for_block(receipt.blockNumber)
+
+# Receipt watcher resolving every pending transaction once per block
+tx_watcher = TxWatcher(
+    w3,
+    chain_head,
+    timeout=int(os.getenv('TX_RECEIPT_TIMEOUT', '120')),
+    record_ttl=int(os.getenv('TX_RECORD_TTL', '3600')),
+    store=shared_state
+)
+ASYNC_TRANSACTIONS = os.getenv('ASYNC_TRANSACTIONS', 'false').lower() == 'true'
+
+# Gas limits learned from receipts and EIP-1559 fees read once per block
+priority_fee_gwei = os.getenv('GAS_PRIORITY_FEE_GWEI')
+gas_strategy = GasStrategy(
+    w3,
+    chain_head,
+    margin=float(os.getenv('GAS_LIMIT_MARGIN', '1.3')),
+    base_fee_multiplier=int(os.getenv('GAS_BASE_FEE_MULTIPLIER', '2')),
+    priority_fee=w3.toWei(float(priority_fee_gwei), 'gwei') if priority_fee_gwei else None
+)
+tx_watcher.register_receipt_listener(gas_strategy.observe)
+
+# Local nonce allocation so one account can have many transactions in flight
+nonce_managers = NonceManagers(w3, gas_strategy, shared_state)
+TX_SUBMIT_CONCURRENCY = int(os.getenv('TX_SUBMIT_CONCURRENCY', '8'))
+
+# Threads running the concurrent reads of /api/customer/dashboard, shared by all requests
+dashboard_pool = ThreadPoolExecutor(max_workers=int(os.getenv('DASHBOARD_WORKERS', '16')),
+                                    thread_name_prefix='dashboard')
+
+def resync_dropped_sender(tracked):
+    # A dropped transaction leaves a nonce gap the node will never fill by itself
+    if tracked.context.get('sender'):
+        nonce_managers.resync(tracked.context['sender'])
+
+tx_watcher.register_drop_handler(resync_dropped_sender)
+
+def voucher_created(receipt, tracked):
+    for log in contracts.voucher.events.VoucherCreated().processReceipt(receipt, errors=DISCARD):
+        return {'voucher_id': log['args']['id']}
+
+def voucher_redeemed(receipt, tracked):
+    for log in contracts.voucher.events.VoucherRedeemed().processReceipt(receipt, errors=DISCARD):
+        return {'redemption_id': log['args']['redemptionId']}
+
+def business_approved(receipt, tracked):
+    chain_meta.business_approved(tracked.context['business_address'])
+
+def redemption_fulfilled(receipt, tracked):
+    redemption_id = tracked.context['redemption_id']
+    if indexer is not None:
+        indexer.mark_redeemed(redemption_id, receipt.blockNumber)
+    # markAsRedeemed emits no event, so the feed hears about it from here
+    if not event_feed.has_subscribers():
+        return
+    details = contracts.voucher.functions.getRedemptionDetails(redemption_id).call(block_identifier=receipt.blockNumber)
+    event_feed.publish('redemption_fulfilled', {'id': redemption_id, 'isRedeemed': True},
+                       addresses=(details[1], tracked.context['sender']))
+
+# Live dashboard updates, pushed over /api/events
+event_feed = EventFeed(w3, chain_head, contracts, queue_size=int(os.getenv('EVENT_QUEUE_SIZE', '256')))
+SSE_KEEPALIVE = float(os.getenv('SSE_KEEPALIVE', '15'))
+SSE_TICKET_TTL = int(os.getenv('SSE_TICKET_TTL', '30'))
+# Stream tickets already used, by jti, until they expire
+used_stream_tickets = {}
+used_stream_tickets_lock = threading.Lock()
+
+tx_watcher.register_handler('create_voucher', voucher_created)
+tx_watcher.register_handler('redeem_voucher', voucher_redeemed)
+tx_watcher.register_handler('approve_business', business_approved)
+tx_watcher.register_handler('mark_redeemed', redemption_fulfilled)
 
-voucher_contract = None
-if voucher_address and voucher_address.strip():
+def wants_async():
+    # ?async=true or "Prefer: respond-async" opt in per request, ASYNC_TRANSACTIONS sets the default
+    flag = request.args.get('async')
+    if flag is not None:
+        return flag.lower() in ('1', 'true', 'yes')
+    if 'respond-async' in request.headers.get('Prefer', ''):
+        return True
+    return ASYNC_TRANSACTIONS
+
+def tx_accepted(tracked):
+    return jsonify({
+        'message': 'Transaction submitted',
+        'tx_id': tracked.id,
+        'tx_hash': tracked.tx_hash,
+        'status': tracked.status,
+        'status_url': f'/api/tx/{tracked.id}'
+    }), 202
+
+# Customer and business accounts
+user_store = create_user_store()
+
+def parse_paging():
     try:
-        voucher_contract = w3.eth.contract(address=voucher_address, abi=voucher_abi)
-        print(f"Voucher contract initialized: {voucher_address}")
-    except Exception as e:
-        print(f"Error initializing voucher contract: {e}")
+        return page_args(request.args), None
+    except ValueError as e:
+        return None, (jsonify({'message': f'Invalid pagination parameters: {e}'}), 400)
+
+def hasher_busy():
+    response = jsonify({'message': 'Server busy, please retry'})
+    response.headers['Retry-After'] = PASSWORD_HASH_RETRY_AFTER
+    return response, 503
 
-# In-memory user store (replace with database in production)
-users = {
-    'customers': {},  # username: {password_hash, address}
-    'businesses': {}  # username: {password_hash, address, name}
-}
+# Span trees of requests slower than TRACE_SLOW_MS, and admin-switched request profiling
+slow_requests = tracing.SlowRequestLog(
+    threshold_ms=float(os.getenv('TRACE_SLOW_MS', '500')),
+    size=int(os.getenv('TRACE_SLOW_LOG_SIZE', '100'))
+)
+request_profiler = RequestProfiler(
+    directory=os.getenv('PROFILE_DIR', 'profiles'),
+    interval=float(os.getenv('PROFILE_SAMPLE_INTERVAL_MS', '5')) / 1000
+)
+
+# Users of already-verified tokens, so repeat requests skip jwt.decode
+token_cache = TokenCache(max_entries=int(os.getenv('TOKEN_CACHE_MAX_ENTRIES', '10000')))
+
+def bearer_token():
+    auth_header = request.headers.get('Authorization')
+    if auth_header and auth_header.startswith('Bearer '):
+        return auth_header.split(' ')[1]
+    return None
+
+def authenticate(token):
+    """The user a token was issued to, or None if it does not verify."""
+    start = time.perf_counter()
+    key = token_cache.key(token)
+    current_user = token_cache.get(key)
+    if current_user is not None:
+        token_cache.record(True, time.perf_counter() - start)
+        return dict(current_user)
+        
+    try:
+        data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
+        # Convert address to checksum format
+        address = data['address']
+        if address:
+            address = checksum_address(address)
+            
+        current_user = {
+            'username': data['username'],
+            'role': data['role'],
+            'address': address
+        }
+    except:
+        return None
+        
+    token_cache.put(key, current_user, data.get('exp'))
+    token_cache.record(False, time.perf_counter() - start)
+    return dict(current_user)
 
 # JWT token required decorator
 def token_required(f):
     @wraps(f)
     def decorated(*args, **kwargs):
-        token = None
-        auth_header = request.headers.get('Authorization')
-        
-        if auth_header and auth_header.startswith('Bearer '):
-            token = auth_header.split(' ')[1]
+        token = bearer_token()
             
         if not token:
             return jsonify({'message': 'Token is missing'}), 401
             
-        try:
-            data = jwt.decode(token, JWT_SECRET, algorithms=["HS256"])
-            # Convert address to checksum format
-            address = data['address']
-            if address:
-                address = w3.toChecksumAddress(address)
-                
-            current_user = {
-                'username': data['username'],
-                'role': data['role'],
-                'address': address
-            }
-        except:
+        current_user = authenticate(token)
+        if current_user is None:
             return jsonify({'message': 'Token is invalid'}), 401
             
         return f(current_user, *args, **kwargs)
@@ -171,7 +326,7 @@ def token_required(f):
     return decorated
 
 # User registration and authentication
-@app.route('/api/register/customer', methods=['POST'])
+@api.route('/api/register/customer', methods=['POST'])
 def register_customer():
     data = request.json
     username = data.get('username')
@@ -181,20 +336,23 @@ def register_customer():
     if not username or not password or not address:
         return jsonify({'message': 'Missing required fields'}), 400
         
-    if username in users['customers']:
-        return jsonify({'message': 'Username already exists'}), 409
-        
     # Convert address to checksum format
-    address = w3.toChecksumAddress(address)
+    address = checksum_address(address)
         
-    users['customers'][username] = {
-        'password_hash': generate_password_hash(password),
-        'address': address
-    }
+    # Skip the expensive hash for names that are obviously taken
+    if user_store.get('customer', username) is not None:
+        return jsonify({'message': 'Username already exists'}), 409
+        
+    try:
+        user_store.add('customer', username, password_hasher.hash(password), address)
+    except HasherBusy:
+        return hasher_busy()
+    except DuplicateUserError as e:
+        return jsonify({'message': f'{e.field} already exists'}), 409
     
     return jsonify({'message': 'Customer registered successfully'}), 201
 
-@app.route('/api/register/business', methods=['POST'])
+@api.route('/api/register/business', methods=['POST'])
 def register_business():
     data = request.json
     username = data.get('username')
@@ -205,21 +363,26 @@ def register_business():
     if not username or not password or not address or not name:
         return jsonify({'message': 'Missing required fields'}), 400
         
-    if username in users['businesses']:
+    # Convert address to checksum format
+    address = checksum_address(address)
+        
+    # Skip the expensive hash for names that are obviously taken
+    if user_store.get('business', username) is not None:
         return jsonify({'message': 'Username already exists'}), 409
         
-    # Convert address to checksum format
-    address = w3.toChecksumAddress(address)
+    try:
+        user_id = user_store.add('business', username, password_hasher.hash(password), address, name=name)
+    except HasherBusy:
+        return hasher_busy()
+    except DuplicateUserError as e:
+        return jsonify({'message': f'{e.field} already exists'}), 409
         
-    users['businesses'][username] = {
-        'password_hash': generate_password_hash(password),
-        'address': address,
-        'name': name
-    }
+    event_feed.publish('business_signed_up', {'id': user_id, 'username': username, 'address': address, 'name': name},
+                       roles=('admin',))
     
     return jsonify({'message': 'Business registered successfully'}), 201
 
-@app.route('/api/login', methods=['POST'])
+@api.route('/api/login', methods=['POST'])
 def login():
     data = request.json
     username = data.get('username')
@@ -230,9 +393,7 @@ def login():
         if password != ADMIN_PASSWORD:
             return jsonify({'message': 'Invalid credentials'}), 401
         
-        admin_address = w3.eth.accounts[0] if w3.eth.accounts else None
-        if admin_address:
-            admin_address = w3.toChecksumAddress(admin_address)
+        admin_address = chain_meta.admin_account()
             
         token = jwt.encode({
             'username': 'admin',
@@ -243,25 +404,29 @@ def login():
         
         return jsonify({'token': token, 'role': 'admin'})
         
-    elif role == 'customer':
-        user_dict = users['customers']
-    elif role == 'business':
-        user_dict = users['businesses']
-    else:
+    elif role not in ('customer', 'business'):
         return jsonify({'message': 'Invalid role specified'}), 400
         
-    if username not in user_dict:
+    user = user_store.get(role, username)
+    if user is None:
         return jsonify({'message': 'Invalid credentials'}), 401
-        
-    user = user_dict[username]
     
-    if not check_password_hash(user['password_hash'], password):
-        return jsonify({'message': 'Invalid credentials'}), 401
+    try:
+        if not password_hasher.verify(user['password_hash'], password):
+            return jsonify({'message': 'Invalid credentials'}), 401
+    except HasherBusy:
+        return hasher_busy()
+        
+    # Upgrade hashes made with an older cost setting
+    if password_hasher.needs_rehash(user['password_hash']):
+        password_hasher.rehash_later(
+            password, lambda new_hash: user_store.update_password_hash(role, username, new_hash)
+        )
         
     # Convert address to checksum format
     address = user['address']
     if address:
-        address = w3.toChecksumAddress(address)
+        address = checksum_address(address)
         
     token = jwt.encode({
         'username': username,
@@ -273,27 +438,31 @@ def login():
     return jsonify({'token': token, 'role': role, 'address': address})
 
 # Admin routes
-@app.route('/api/admin/password', methods=['GET'])
+@api.route('/api/admin/password', methods=['GET'])
 def get_admin_password():
     return jsonify({'admin_password': ADMIN_PASSWORD})
 
-@app.route('/api/admin/businesses', methods=['GET'])
+@api.route('/api/admin/businesses', methods=['GET'])
 @token_required
 def get_businesses(current_user):
     if current_user['role'] != 'admin':
         return jsonify({'message': 'Unauthorized'}), 403
         
-    businesses = []
-    for username, data in users['businesses'].items():
-        businesses.append({
-            'username': username,
+    paging, error = parse_paging()
+    if error:
+        return error
+        
+    def businesses_page(after_id, limit):
+        return [{
+            'id': data['id'],
+            'username': data['username'],
             'address': data['address'],
             'name': data['name']
-        })
-    
-    return jsonify(businesses)
+        } for data in user_store.list_users('business', after_id=after_id, limit=limit)]
+        
+    return list_response(lambda after_id, page_size: iter_pages(businesses_page, after_id, page_size), paging)
 
-@app.route('/api/admin/approve-business', methods=['POST'])
+@api.route('/api/admin/approve-business', methods=['POST'])
 @token_required
 def approve_business(current_user):
     if current_user['role'] != 'admin':
@@ -304,16 +473,329 @@ def approve_business(current_user):
     
     # Call the smart contract to approve the business
     try:
-        tx_hash = registry_contract.functions.approveBusiness(business_address).transact({
+        business_address = checksum_address(business_address)
+        approve = contracts.registry.functions.approveBusiness(business_address)
+        tx_hash = nonce_managers.transact(approve, {
             'from': current_user['address']
-        })
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        }, preflight=True)
+        tracked = tx_watcher.track(tx_hash, 'approve_business', owner=current_user,
+                                   sender=current_user['address'], business_address=business_address)
+        if wants_async():
+            return tx_accepted(tracked)
+        receipt = tx_watcher.wait(tracked)
+        if receipt.status != 1:
+            return jsonify({'message': 'Error approving business: Transaction reverted'}), 500
         return jsonify({'message': 'Business approved successfully', 'tx_hash': tx_hash.hex()})
+    except PreflightError as e:
+        return jsonify({'message': e.message}), e.status
     except Exception as e:
         return jsonify({'message': f'Error approving business: {str(e)}'}), 500
 
+# Admin route to approve a batch of businesses, pipelined through the nonce manager
+@api.route('/api/admin/approve-businesses', methods=['POST'])
+@token_required
+def approve_businesses(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+        
+    data = request.json or {}
+    addresses = data.get('addresses') or []
+    
+    if not addresses:
+        return jsonify({'message': 'Missing required fields (addresses)'}), 400
+    
+    def submit(business_address):
+        try:
+            business_address = checksum_address(business_address)
+            # Addresses that would revert (unregistered, already approved) are reported without spending gas
+            approve = contracts.registry.functions.approveBusiness(business_address)
+            tx_hash = nonce_managers.transact(approve, {
+                'from': current_user['address']
+            }, preflight=True)
+            tracked = tx_watcher.track(tx_hash, 'approve_business', owner=current_user,
+                                       sender=current_user['address'], business_address=business_address)
+            return business_address, tracked, None
+        except PreflightError as e:
+            return business_address, None, e.message
+        except Exception as e:
+            return business_address, None, str(e)
+    
+    # Submissions overlap instead of waiting one round trip each
+    with ThreadPoolExecutor(max_workers=TX_SUBMIT_CONCURRENCY) as pool:
+        submitted = list(pool.map(submit, addresses))
+    
+    run_async = wants_async()
+    results = []
+    for business_address, tracked, error in submitted:
+        if tracked is None:
+            results.append({'address': business_address, 'status': 'error', 'error': error})
+            continue
+        receipt = None
+        if not run_async:
+            try:
+                receipt = tx_watcher.wait(tracked)
+            except Exception as e:
+                print(f"Error waiting for approval of {business_address}: {e}")
+        result = dict(tracked.to_dict(), address=business_address)
+        if receipt is not None and receipt.status != 1:
+            result.update(status='failed', error=tracked.error or 'Transaction reverted')
+        results.append(result)
+    
+    return jsonify({
+        'submitted': sum(1 for _, tracked, _ in submitted if tracked is not None),
+        'failed': sum(1 for result in results if result['status'] in ('error', 'failed', 'timeout')),
+        'results': results
+    }), 202 if run_async else 200
+
+@api.route('/api/admin/cache-stats', methods=['GET'])
+@token_required
+def get_cache_stats(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+    return jsonify({
+        'view_cache': view_cache.stats() if view_cache is not None else None,
+        'token_cache': token_cache.stats(),
+        'chain_meta': chain_meta.stats(),
+        'gas': gas_strategy.stats(),
+        'rpc_scheduler': rpc_scheduler.stats(),
+        'voucher_search': voucher_search.stats(),
+        'analytics': analytics.stats() if analytics is not None else None,
+        'checksum_cache': checksum_cache_stats(),
+        'tracing': slow_requests.stats(),
+        'profiler': request_profiler.stats(),
+        'worker': {
+            'id': WORKER_ID,
+            'index_leader': shared_state.lease_holder('indexer') if shared_state is not None else WORKER_ID
+        }
+    })
+
+# Totals across all businesses plus the top `limit` businesses by `sort`
+# (points, redemptions or uniqueCustomers); same time parameters as the business route
+@api.route('/api/admin/analytics', methods=['GET'])
+@token_required
+def get_admin_analytics(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+    try:
+        start, end, utc_offset = analytics_args()
+        sort = request.args.get('sort', 'points')
+        if sort not in ANALYTICS_SORT_KEYS:
+            raise ValueError(f"sort must be one of {', '.join(ANALYTICS_SORT_KEYS)}")
+        limit = max(1, min(int(request.args.get('limit', 100)), MAX_PAGE_SIZE))
+    except ValueError as e:
+        return jsonify({'message': f'Invalid analytics parameters: {e}'}), 400
+    unavailable = analytics_unavailable()
+    if unavailable:
+        return unavailable
+    return jsonify(analytics.overview(start, end, utc_offset, sort, limit))
+
+def export_response(batches, fmt, fields, name, resumed):
+    def generate():
+        # A long export should not hold up customer reads at the node
+        with rpc_priority(BACKGROUND):
+            try:
+                if fmt == 'csv':
+                    yield from write_csv(batches, fields, header=not resumed)
+                else:
+                    yield from write_ndjson(batches)
+            except Exception as e:
+                # Ending without the final chunk tells the client the export is incomplete, so it resumes
+                print(f"Error exporting {name}: {e}")
+                raise
+    
+    return Response(stream_with_context(generate()),
+                    mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+                    headers={'Content-Disposition': f'attachment; filename={name}.{fmt}'})
+
+# Every redemption from from / to (unix seconds, to exclusive) as format=csv (default) or ndjson.
+# Each row has a cursor; ?cursor=<last one received> resumes the same export after that row
+@api.route('/api/admin/export/redemptions', methods=['GET'])
+@token_required
+def export_redemptions(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+    if not contracts.voucher:
+        return jsonify({'message': 'Voucher contract not initialized'}), 500
+    
+    try:
+        since, until = (int(request.args[name]) if name in request.args else None for name in ('from', 'to'))
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        cursor = request.args.get('cursor')
+        export = RedemptionExport(w3, contracts.voucher, since, until, cursor)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid export parameters: {e}'}), 400
+    except Exception as e:
+        return jsonify({'message': f'Error starting export: {str(e)}'}), 500
+    return export_response(export.batches(), fmt, REDEMPTION_FIELDS, 'redemptions', cursor is not None)
+
+# Every voucher, active or not, as format=csv (default) or ndjson; ?cursor= resumes after that voucher
+@api.route('/api/admin/export/vouchers', methods=['GET'])
+@token_required
+def export_vouchers(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+    if not contracts.voucher:
+        return jsonify({'message': 'Voucher contract not initialized'}), 500
+    
+    try:
+        fmt = request.args.get('format', 'csv')
+        if fmt not in EXPORT_FORMATS:
+            raise ValueError(f"format must be one of {', '.join(EXPORT_FORMATS)}")
+        cursor = request.args.get('cursor')
+        if cursor is not None:
+            int(cursor)
+    except ValueError as e:
+        return jsonify({'message': f'Invalid export parameters: {e}'}), 400
+    return export_response(voucher_batches(w3, contracts.voucher, cursor), fmt, VOUCHER_FIELDS, 'vouchers',
+                           cursor is not None)
+
+# Most recent requests slower than TRACE_SLOW_MS, newest first, with their span trees
+@api.route('/api/admin/slow-requests', methods=['GET'])
+@token_required
+def get_slow_requests(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+    try:
+        limit = max(1, int(request.args['limit'])) if 'limit' in request.args else None
+    except ValueError as e:
+        return jsonify({'message': f'Invalid limit: {e}'}), 400
+    return jsonify({'stats': slow_requests.stats(), 'requests': slow_requests.recent(limit)})
+
+# POST {"sample_rate": 0.05, "mode": "cprofile" | "sampling"} starts profiling a share of this
+# worker's requests; DELETE stops it and writes per-route stats files into PROFILE_DIR
+@api.route('/api/admin/profiling', methods=['GET', 'POST', 'DELETE'])
+@token_required
+def admin_profiling(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        try:
+            request_profiler.start(float(data.get('sample_rate', 0.01)), data.get('mode', 'cprofile'))
+        except (TypeError, ValueError) as e:
+            return jsonify({'message': f'Invalid profiling settings: {e}'}), 400
+    elif request.method == 'DELETE':
+        if not request_profiler.active:
+            return jsonify({'message': 'Profiling is not running'}), 409
+        try:
+            files = request_profiler.stop()
+        except OSError as e:
+            return jsonify({'message': f'Error writing profiles: {str(e)}'}), 500
+        return jsonify(dict(request_profiler.stats(), files=files))
+    return jsonify(request_profiler.stats())
+
+# Admin route to issue loyalty points in bulk from a streamed CSV or NDJSON upload
+@api.route('/api/admin/issue-points', methods=['POST'])
+@token_required
+def issue_points(current_user):
+    if current_user['role'] != 'admin':
+        return jsonify({'message': 'Unauthorized'}), 403
+        
+    if not contracts.token:
+        return jsonify({'message': 'Token contract not initialized'}), 500
+    
+    minter = current_user['address']
+    try:
+        if not cached_call(contracts.token.functions.minters(minter)):
+            return jsonify({'message': 'Admin account is not a token minter'}), 403
+    except Exception as e:
+        return jsonify({'message': f'Error checking minter status: {str(e)}'}), 500
+    
+    fmt = request.args.get('format')
+    if not fmt:
+        fmt = 'ndjson' if 'json' in (request.content_type or '') else 'csv'
+    run_async = wants_async()
+    stream = request.stream
+    
+    def submit(recipient, variant):
+        try:
+            tx_hash = nonce_managers.transact(contracts.token.functions.mint(recipient.address, recipient.amount), {
+                'from': minter
+            }, variant)
+            return recipient, tx_watcher.track(tx_hash, 'issue_points', owner=current_user, sender=minter), None
+        except Exception as e:
+            return recipient, None, str(e)
+    
+    def settle(recipient, tracked):
+        try:
+            tx_watcher.wait(tracked)
+        except Exception as e:
+            print(f"Error waiting for mint to {recipient.address}: {e}")
+    
+    def generate():
+        started = time.time()
+        recipients = {}
+        rows = invalid = 0
+        
+        # Invalid rows are reported while the upload is still being read
+        for row_number, address, amount, error in aggregate(validate_rows(iter_raw_rows(stream, fmt)), recipients):
+            rows += 1
+            if error is not None:
+                invalid += 1
+                yield json.dumps({'row': row_number, 'status': 'invalid', 'error': error}) + '\n'
+        parsed = time.time()
+        
+        # Minting to a new holder costs more gas than topping one up, so the two learn separate limits
+        holders = list(recipients.values())
+        try:
+            balances = cached_batch_call([contracts.token.functions.balanceOf(holder.address) for holder in holders])
+        except Exception as e:
+            print(f"Error reading recipient balances: {e}")
+            balances = [None] * len(holders)
+        variants = ['holder' if isinstance(balance, int) and balance > 0 else 'new holder' for balance in balances]
+        
+        with ThreadPoolExecutor(max_workers=TX_SUBMIT_CONCURRENCY) as pool:
+            submitted = list(pool.map(submit, holders, variants))
+        variant_of = dict(zip((holder.address for holder in holders), variants))
+        
+        confirmed = failed = retried = 0
+        for recipient, tracked, error in submitted:
+            result = {'address': recipient.address, 'amount': recipient.amount, 'rows': recipient.rows.tolist()}
+            if tracked is not None and not run_async:
+                settle(recipient, tracked)
+                if tracked.error == OUT_OF_GAS:
+                    # The gas strategy re-estimates mint above the limit that ran out, so one more attempt gets more
+                    retried += 1
+                    result['retried_tx_hash'] = tracked.tx_hash
+                    _, tracked, error = submit(recipient, variant_of[recipient.address])
+                    if tracked is not None:
+                        settle(recipient, tracked)
+            if tracked is None:
+                failed += 1
+                result.update(status='error', error=error)
+            else:
+                result.update(status=tracked.status, tx_id=tracked.id, tx_hash=tracked.tx_hash)
+                if tracked.error:
+                    result['error'] = tracked.error
+                if tracked.status == 'confirmed':
+                    confirmed += 1
+                elif tracked.status != 'pending':
+                    failed += 1
+            yield json.dumps(result) + '\n'
+        
+        finished = time.time()
+        elapsed = finished - started
+        yield json.dumps({
+            'summary': True,
+            'rows': rows,
+            'valid_rows': rows - invalid,
+            'invalid_rows': invalid,
+            'recipients': len(recipients),
+            'transactions': len(submitted),
+            'confirmed': confirmed,
+            'failed': failed,
+            'retried': retried,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(rows / max(parsed - started, 1e-9), 1),
+            'tx_per_second': round(len(submitted) / max(finished - parsed, 1e-9), 1)
+        }) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 # Admin route to register a business directly
-@app.route('/api/admin/register-business', methods=['POST'])
+@api.route('/api/admin/register-business', methods=['POST'])
 @token_required
 def admin_register_business(current_user):
     if current_user['role'] != 'admin':
@@ -332,27 +814,24 @@ def admin_register_business(current_user):
         
         # Convert to checksum address
         try:
-            business_address = w3.toChecksumAddress(business_address)
+            business_address = checksum_address(business_address)
         except Exception as e:
             return jsonify({'message': f'Invalid address: {str(e)}'}), 400
         
-        # Check if business is already registered
+        # Register the business, after checking it would go through
+        register = contracts.registry.functions.registerBusinessByAdmin(business_address, business_name)
         try:
-            is_registered = registry_contract.functions.isBusinessRegistered(business_address).call()
-            if is_registered:
-                return jsonify({'message': 'Business is already registered'}), 400
-        except Exception as e:
-            print(f"Error checking if business is registered: {e}")
-        
-        # Register the business
-        tx_hash = registry_contract.functions.registerBusinessByAdmin(business_address, business_name).transact({
-            'from': current_user['address'],
-            'gas': 1000000
-        })
+            tx_hash = nonce_managers.transact(register, {'from': current_user['address']}, preflight=True)
+        except PreflightError as e:
+            return jsonify({'message': e.message}), e.status
         
         print(f"Transaction sent with hash: {tx_hash.hex()}")
         
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        tracked = tx_watcher.track(tx_hash, 'register_business', owner=current_user,
+                                   sender=current_user['address'])
+        if wants_async():
+            return tx_accepted(tracked)
+        receipt = tx_watcher.wait(tracked)
         
         if receipt.status == 1:
             return jsonify({
@@ -369,7 +848,7 @@ def admin_register_business(current_user):
         return jsonify({'message': f'Error registering business: {str(e)}'}), 500
 
 # Business routes
-@app.route('/api/business/register-on-chain', methods=['POST'])
+@api.route('/api/business/register-on-chain', methods=['POST'])
 @token_required
 def register_business_on_chain(current_user):
     if current_user['role'] != 'business':
@@ -381,60 +860,39 @@ def register_business_on_chain(current_user):
     try:
         print(f"Attempting to register business with name: {name}")
         print(f"Using address: {current_user['address']}")
-        print(f"Registry contract address: {business_registry_address}")
+        print(f"Registry contract address: {contracts.addresses['registry']}")
         
-        if not registry_contract:
+        if not contracts.registry:
             print("Registry contract is not initialized")
             return jsonify({'message': 'Registry contract not initialized'}), 500
         
         # Check if this is the admin address trying to register as a business
         try:
-            admin_address = registry_contract.functions.admin().call()
-            print(f"Admin address from contract: {admin_address}")
+            admin_address = chain_meta.contract_admin('registry')
             
-            if current_user['address'].lower() == admin_address.lower():
+            if current_user['address'] == admin_address:
                 return jsonify({'message': 'Admin accounts cannot register as businesses. Please use a different address.'}), 400
         except Exception as e:
             print(f"Error checking admin address: {e}")
-        
-        # Check if user address is a valid address
-        try:
-            balance = w3.eth.get_balance(current_user['address'])
-            print(f"Address is valid, balance: {balance}")
-            
-            if balance == 0:
-                return jsonify({'message': 'Account has no ETH balance to pay for gas'}), 400
-                
-        except Exception as e:
-            print(f"Error checking address: {e}")
-            return jsonify({'message': f'Invalid address: {str(e)}'}), 400
             
         # Check if the user address is configured in MetaMask/Ganache
-        if current_user['address'] not in w3.eth.accounts:
+        if current_user['address'] not in chain_meta.accounts():
             print(f"Warning: Address {current_user['address']} not found in local accounts")
-            print(f"Available accounts: {w3.eth.accounts}")
             
-        # Check if the business is already registered
-        try:
-            is_registered = registry_contract.functions.isBusinessRegistered(current_user['address']).call()
-            if is_registered:
-                print(f"Business is already registered: {current_user['address']}")
-                return jsonify({'message': 'Business is already registered'}), 400
-        except Exception as e:
-            print(f"Error checking if business is registered: {e}")
-        
+        # The preflight covers the registration checks (already registered, empty name)
+        register = contracts.registry.functions.registerBusiness(name)
         print(f"Sending transaction to register business from {current_user['address']} with name '{name}'")
         
-        # Try with a higher gas limit
         try:
-            tx_hash = registry_contract.functions.registerBusiness(name).transact({
-                'from': current_user['address'],
-                'gas': 1000000  # Set a higher gas limit
-            })
+            tx_hash = nonce_managers.transact(register, {'from': current_user['address']}, preflight=True)
             
             print(f"Transaction sent with hash: {tx_hash.hex()}")
             
-            receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+            tracked = tx_watcher.track(tx_hash, 'register_business', owner=current_user,
+                                       sender=current_user['address'])
+            if wants_async():
+                return tx_accepted(tracked)
+            receipt = tx_watcher.wait(tracked)
             
             print(f"Transaction receipt status: {receipt.status}")
             
@@ -445,11 +903,16 @@ def register_business_on_chain(current_user):
             print(f"Transaction successful: {receipt}")
             return jsonify({'message': 'Business registered on chain successfully', 'tx_hash': tx_hash.hex()})
             
+        except PreflightError as e:
+            print(f"Registration would revert: {e.message}")
+            return jsonify({'message': e.message}), e.status
         except ValueError as e:
             error_str = str(e)
             print(f"Transaction error: {error_str}")
             
-            if "execution reverted" in error_str:
+            if "insufficient funds" in error_str.lower():
+                return jsonify({'message': 'Account has no ETH balance to pay for gas'}), 400
+            elif "execution reverted" in error_str:
                 if "OnlyAdmin" in error_str:
                     return jsonify({'message': 'Error: Only admin can perform this action'}), 403
                 elif "AlreadyRegistered" in error_str:
@@ -465,7 +928,7 @@ def register_business_on_chain(current_user):
         traceback.print_exc()
         return jsonify({'message': f'Error registering business: {str(e)}'}), 500
 
-@app.route('/api/business/create-voucher', methods=['POST'])
+@api.route('/api/business/create-voucher', methods=['POST'])
 @token_required
 def create_voucher(current_user):
     if current_user['role'] != 'business':
@@ -478,218 +941,490 @@ def create_voucher(current_user):
     
     # Check if business is approved
     try:
-        is_approved = registry_contract.functions.isBusinessApproved(current_user['address']).call()
+        is_approved = chain_meta.is_business_approved(
+            current_user['address'],
+            lambda: cached_call(contracts.registry.functions.isBusinessApproved(current_user['address']))
+        )
         
         if not is_approved:
             return jsonify({'message': 'Business not approved yet'}), 403
             
-        tx_hash = voucher_contract.functions.createVoucher(title, description, point_cost).transact({
+        create = contracts.voucher.functions.createVoucher(title, description, point_cost)
+        tx_hash = nonce_managers.transact(create, {
             'from': current_user['address']
-        })
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        # Get the voucher ID from the event logs
-        voucher_id = None
-        for log in voucher_contract.events.VoucherCreated().process_receipt(receipt):
-            voucher_id = log['args']['id']
+        }, preflight=True)
+        tracked = tx_watcher.track(tx_hash, 'create_voucher', owner=current_user,
+                                   sender=current_user['address'])
+        if wants_async():
+            return tx_accepted(tracked)
+        receipt = tx_watcher.wait(tracked)
+        if receipt.status != 1:
+            return jsonify({'message': 'Error creating voucher: Transaction reverted'}), 500
+        sync_index(receipt)
         
+        # The watcher extracts the voucher ID from the VoucherCreated log
         return jsonify({
             'message': 'Voucher created successfully', 
             'tx_hash': tx_hash.hex(),
-            'voucher_id': voucher_id
+            'voucher_id': tracked.result.get('voucher_id')
         })
+    except PreflightError as e:
+        return jsonify({'message': e.message}), e.status
     except Exception as e:
         return jsonify({'message': f'Error creating voucher: {str(e)}'}), 500
 
-@app.route('/api/business/vouchers', methods=['GET'])
+def analytics_args():
+    """``(start, end, utc_offset)`` from the query string; raises ValueError."""
+    start, end = (int(request.args[name]) if name in request.args else None for name in ('from', 'to'))
+    utc_offset = int(request.args.get('utc_offset', 0))
+    if not -14 * 60 <= utc_offset <= 14 * 60:
+        raise ValueError('utc_offset must be in minutes, between -840 and 840')
+    return start, end, utc_offset
+
+def analytics_unavailable():
+    if analytics is None:
+        return jsonify({'message': 'Analytics are not enabled'}), 503
+    if not index_ready():
+        response = jsonify({'message': 'Event index is still catching up, please retry'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    return None
+
+# Redemptions of the business's vouchers: per voucher, by hour and weekday, and fulfilment lag.
+# Optional from / to (unix seconds) and utc_offset (minutes) for the time-of-day buckets
+@api.route('/api/business/analytics', methods=['GET'])
+@token_required
+def get_business_analytics(current_user):
+    if current_user['role'] != 'business':
+        return jsonify({'message': 'Unauthorized'}), 403
+    try:
+        start, end, utc_offset = analytics_args()
+    except ValueError as e:
+        return jsonify({'message': f'Invalid analytics parameters: {e}'}), 400
+    unavailable = analytics_unavailable()
+    if unavailable:
+        return unavailable
+    return jsonify(analytics.business_report(current_user['address'], start, end, utc_offset))
+
+@api.route('/api/business/vouchers', methods=['GET'])
 @token_required
 def get_business_vouchers(current_user):
     if current_user['role'] != 'business':
         return jsonify({'message': 'Unauthorized'}), 403
         
-    try:
-        voucher_ids = voucher_contract.functions.getBusinessVouchers(current_user['address']).call()
+    paging, error = parse_paging()
+    if error:
+        return error
         
-        vouchers = []
-        for voucher_id in voucher_ids:
-            details = voucher_contract.functions.getVoucherDetails(voucher_id).call()
-            vouchers.append({
-                'id': voucher_id,
-                'title': details[0],
-                'description': details[1],
-                'pointCost': details[2],
-                'businessAddress': details[3],
-                'isActive': details[4]
-            })
+    business_address = current_user['address']
+    
+    def chain_vouchers(after_id, page_size):
+        voucher_ids = [voucher_id for voucher_id in
+                       cached_call(contracts.voucher.functions.getBusinessVouchers(business_address))
+                       if voucher_id > after_id]
+        for start in range(0, len(voucher_ids), page_size):
+            chunk = voucher_ids[start:start + page_size]
+            all_details = raise_errors(cached_batch_call([
+                contracts.voucher.functions.getVoucherDetails(voucher_id) for voucher_id in chunk
+            ]))
+            for voucher_id, details in zip(chunk, all_details):
+                yield voucher_dict(voucher_id, details)
+    
+    def build():
+        if index_ready():
+            return list_response(lambda after_id, page_size: iter_pages(
+                lambda a, n: indexer.business_vouchers(business_address, a, n), after_id, page_size
+            ), paging)
         
-        return jsonify(vouchers)
+        return list_response(chain_vouchers, paging)
+    
+    try:
+        tag = state_tag(f'business:{business_address}') if paging[2] is None else None
+        return conditional(tag, build)
     except Exception as e:
         return jsonify({'message': f'Error getting vouchers: {str(e)}'}), 500
 
-@app.route('/api/business/toggle-voucher/<int:voucher_id>', methods=['POST'])
+@api.route('/api/business/toggle-voucher/<int:voucher_id>', methods=['POST'])
 @token_required
 def toggle_voucher(current_user, voucher_id):
     if current_user['role'] != 'business':
         return jsonify({'message': 'Unauthorized'}), 403
         
     try:
-        tx_hash = voucher_contract.functions.toggleVoucherStatus(voucher_id).transact({
+        toggle = contracts.voucher.functions.toggleVoucherStatus(voucher_id)
+        # Activating writes a storage slot that deactivating clears for a refund, so each learns its own gas limit
+        variant = None
+        if index_ready():
+            indexed = indexer.vouchers([voucher_id])
+            if indexed:
+                variant = 'deactivate' if indexed[0]['isActive'] else 'activate'
+        tx_hash = nonce_managers.transact(toggle, {
             'from': current_user['address']
-        })
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        }, variant, preflight=True)
+        tracked = tx_watcher.track(tx_hash, 'toggle_voucher', owner=current_user,
+                                   sender=current_user['address'])
+        if wants_async():
+            return tx_accepted(tracked)
+        receipt = tx_watcher.wait(tracked)
+        if receipt.status != 1:
+            return jsonify({'message': f"Error toggling voucher status: {tracked.error or 'Transaction reverted'}"}), 500
+        sync_index(receipt)
         return jsonify({'message': 'Voucher status toggled successfully', 'tx_hash': tx_hash.hex()})
+    except PreflightError as e:
+        return jsonify({'message': e.message}), e.status
     except Exception as e:
         return jsonify({'message': f'Error toggling voucher status: {str(e)}'}), 500
 
-@app.route('/api/business/mark-redeemed/<int:redemption_id>', methods=['POST'])
+@api.route('/api/business/mark-redeemed/<int:redemption_id>', methods=['POST'])
 @token_required
 def mark_as_redeemed(current_user, redemption_id):
     if current_user['role'] != 'business':
         return jsonify({'message': 'Unauthorized'}), 403
         
     try:
-        tx_hash = voucher_contract.functions.markAsRedeemed(redemption_id).transact({
+        mark = contracts.voucher.functions.markAsRedeemed(redemption_id)
+        tx_hash = nonce_managers.transact(mark, {
             'from': current_user['address']
-        })
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
+        }, preflight=True)
+        tracked = tx_watcher.track(tx_hash, 'mark_redeemed', owner=current_user,
+                                   sender=current_user['address'], redemption_id=redemption_id)
+        if wants_async():
+            return tx_accepted(tracked)
+        receipt = tx_watcher.wait(tracked)
+        if receipt.status != 1:
+            return jsonify({'message': f"Error marking redemption: {tracked.error or 'Transaction reverted'}"}), 500
         return jsonify({'message': 'Redemption marked as fulfilled', 'tx_hash': tx_hash.hex()})
+    except PreflightError as e:
+        return jsonify({'message': e.message}), e.status
     except Exception as e:
         return jsonify({'message': f'Error marking redemption: {str(e)}'}), 500
 
 # Customer routes
-@app.route('/api/customer/balance', methods=['GET'])
+@api.route('/api/customer/balance', methods=['GET'])
 @token_required
 def get_balance(current_user):
     if current_user['role'] != 'customer':
         return jsonify({'message': 'Unauthorized'}), 403
         
     try:
-        balance = token_contract.functions.balanceOf(current_user['address']).call()
+        balance = cached_call(contracts.token.functions.balanceOf(current_user['address']))
         return jsonify({'balance': balance})
     except Exception as e:
         return jsonify({'message': f'Error getting balance: {str(e)}'}), 500
 
-@app.route('/api/customer/available-vouchers', methods=['GET'])
+@api.route('/api/customer/available-vouchers', methods=['GET'])
 def get_available_vouchers():
     # We don't need authentication for viewing available vouchers
+    paging, error = parse_paging()
+    if error:
+        return error
+    
     try:
-        if not voucher_contract:
+        if not contracts.voucher:
             print("Voucher contract is not initialized")
             return jsonify({'message': 'Voucher contract not initialized'}), 500
+        
+        def build():
+            if index_ready():
+                return list_response(lambda after_id, page_size: iter_pages(
+                    indexer.active_vouchers, after_id, page_size
+                ), paging)
             
-        available_vouchers = []
+            return list_response(chain_active_vouchers, paging)
         
-        # This is simplified - in a real app we'd query for all businesses and their vouchers
-        # For demo purposes, we just check the first few voucher IDs
-        for i in range(1, 100):  # Arbitrary limit
-            try:
-                details = voucher_contract.functions.getVoucherDetails(i).call()
-                if details[4]:  # isActive
-                    available_vouchers.append({
-                        'id': i,
-                        'title': details[0],
-                        'description': details[1],
-                        'pointCost': details[2],
-                        'businessAddress': details[3],
-                        'isActive': details[4]
-                    })
-            except ValueError as e:
-                error_str = str(e)
-                if "Voucher does not exist" in error_str:
-                    # This is expected - we've reached the end of vouchers
-                    break
-                else:
-                    print(f"Error getting voucher {i}: {e}")
-            except Exception as e:
-                # Assume we've reached the end of vouchers
-                print(f"Error getting voucher {i}: {e}")
-                break
-                
-        return jsonify(available_vouchers)
+        return conditional(state_tag('vouchers') if paging[2] is None else None, build)
     except Exception as e:
         print(f"Error getting vouchers: {e}")
         import traceback
         traceback.print_exc()
         return jsonify({'message': f'Error getting vouchers: {str(e)}'}), 500
 
-@app.route('/api/customer/redeem-voucher/<int:voucher_id>', methods=['POST'])
+@api.route('/api/customer/vouchers/search', methods=['GET'])
+def search_vouchers():
+    # Filters: q (every word must appear in the title or description), min_cost,
+    # max_cost, business, approved=true; sort=id (default) or pointCost
+    paging, error = parse_paging()
+    if error:
+        return error
+    
+    try:
+        min_cost, max_cost = (int(request.args[name]) if name in request.args else None
+                              for name in ('min_cost', 'max_cost'))
+        if any(cost is not None and cost < 0 for cost in (min_cost, max_cost)):
+            raise ValueError('costs must not be negative')
+        business = request.args.get('business')
+        if business is not None:
+            business = checksum_address(business)
+        sort = request.args.get('sort', 'id')
+        if sort not in SORT_ORDERS:
+            raise ValueError(f"sort must be one of {', '.join(SORT_ORDERS)}")
+    except ValueError as e:
+        return jsonify({'message': f'Invalid search parameters: {e}'}), 400
+    
+    if not index_ready():
+        response = jsonify({'message': 'Search index is still being built, please retry'})
+        response.headers['Retry-After'] = '5'
+        return response, 503
+    
+    after_id = paging[0]
+    if sort == 'pointCost' and after_id and not voucher_search.has_voucher(after_id):
+        return jsonify({'message': f'Invalid search parameters: after_id {after_id} is not a known voucher'}), 400
+    
+    voucher_ids = voucher_search.match(
+        request.args.get('q', ''),
+        min_cost=min_cost,
+        max_cost=max_cost,
+        business=business,
+        approved_only=request.args.get('approved', 'false').lower() == 'true'
+    )
+    # With sort=pointCost the cursor is still the last voucher's id
+    return list_response(lambda after_id, page_size: iter_pages(
+        lambda a, n: voucher_search.page(voucher_ids, a, n, sort), after_id, page_size
+    ), paging)
+
+def fetch_voucher_details(voucher_ids):
+    return cached_batch_call([contracts.voucher.functions.getVoucherDetails(i) for i in voucher_ids])
+
+def chain_active_vouchers(after_id, page_size, voucher_details=fetch_voucher_details):
+    # Voucher IDs are sequential, so the catalog is read in batches of consecutive IDs
+    next_voucher_id = cached_call(contracts.voucher.functions.nextVoucherId())
+    for start in range(after_id + 1, next_voucher_id, page_size):
+        voucher_ids = range(start, min(start + page_size, next_voucher_id))
+        all_details = voucher_details(voucher_ids)
+        for i, details in zip(voucher_ids, all_details):
+            if isinstance(details, Exception):
+                print(f"Error getting voucher {i}: {details}")
+                continue
+            if details[4]:  # isActive
+                yield voucher_dict(i, details)
+
+@api.route('/api/customer/redeem-voucher/<int:voucher_id>', methods=['POST'])
 @token_required
 def redeem_voucher(current_user, voucher_id):
     if current_user['role'] != 'customer':
         return jsonify({'message': 'Unauthorized'}), 403
         
     try:
-        # Check balance first
-        details = voucher_contract.functions.getVoucherDetails(voucher_id).call()
-        balance = token_contract.functions.balanceOf(current_user['address']).call()
-        
-        if balance < details[2]:  # pointCost
-            return jsonify({'message': 'Insufficient token balance'}), 400
-            
         # Approve token transfer first (not implemented in our simple token)
         # In a real ERC20, you'd need token_contract.functions.approve(voucher_address, details[2]).transact
         
-        # Redeem the voucher
-        tx_hash = voucher_contract.functions.redeemVoucher(voucher_id).transact({
+        # Redeem the voucher; the preflight checks it exists, is active and the balance covers it
+        redeem = contracts.voucher.functions.redeemVoucher(voucher_id)
+        tx_hash = nonce_managers.transact(redeem, {
             'from': current_user['address']
-        })
-        receipt = w3.eth.wait_for_transaction_receipt(tx_hash)
-        
-        # Get the redemption ID from the event logs
-        redemption_id = None
-        for log in voucher_contract.events.VoucherRedeemed().process_receipt(receipt):
-            redemption_id = log['args']['redemptionId']
+        }, preflight=True)
+        tracked = tx_watcher.track(tx_hash, 'redeem_voucher', owner=current_user,
+                                   sender=current_user['address'])
+        if wants_async():
+            return tx_accepted(tracked)
+        receipt = tx_watcher.wait(tracked)
+        if receipt.status != 1:
+            return jsonify({'message': 'Error redeeming voucher: Transaction reverted'}), 500
+        sync_index(receipt)
         
+        # The watcher extracts the redemption ID from the VoucherRedeemed log
         return jsonify({
             'message': 'Voucher redeemed successfully', 
             'tx_hash': tx_hash.hex(),
-            'redemption_id': redemption_id
+            'redemption_id': tracked.result.get('redemption_id')
         })
+    except PreflightError as e:
+        return jsonify({'message': e.message}), e.status
     except Exception as e:
         return jsonify({'message': f'Error redeeming voucher: {str(e)}'}), 500
 
-@app.route('/api/customer/redemptions', methods=['GET'])
+def chain_customer_redemptions(customer_address, after_id, page_size, voucher_details=fetch_voucher_details):
+    redemption_ids = [redemption_id for redemption_id in
+                      cached_call(contracts.voucher.functions.getCustomerRedemptions(customer_address))
+                      if redemption_id > after_id]
+    for start in range(0, len(redemption_ids), page_size):
+        chunk = redemption_ids[start:start + page_size]
+        all_details = raise_errors(cached_batch_call([
+            contracts.voucher.functions.getRedemptionDetails(redemption_id) for redemption_id in chunk
+        ]))
+        # Several redemptions usually share a voucher, so each one is fetched once
+        voucher_ids = sorted({details[0] for details in all_details})
+        vouchers_by_id = dict(zip(voucher_ids, raise_errors(voucher_details(voucher_ids))))
+        
+        for redemption_id, details in zip(chunk, all_details):
+            yield redemption_dict(redemption_id, details, vouchers_by_id[details[0]])
+
+@api.route('/api/customer/redemptions', methods=['GET'])
 @token_required
 def get_customer_redemptions(current_user):
     if current_user['role'] != 'customer':
         return jsonify({'message': 'Unauthorized'}), 403
         
-    try:
-        redemption_ids = voucher_contract.functions.getCustomerRedemptions(current_user['address']).call()
+    paging, error = parse_paging()
+    if error:
+        return error
         
-        redemptions = []
-        for redemption_id in redemption_ids:
-            details = voucher_contract.functions.getRedemptionDetails(redemption_id).call()
-            voucher_details = voucher_contract.functions.getVoucherDetails(details[0]).call()
-            
-            redemptions.append({
-                'id': redemption_id,
-                'voucherId': details[0],
-                'voucherTitle': voucher_details[0],
-                'voucherDescription': voucher_details[1],
-                'pointCost': voucher_details[2],
-                'businessAddress': voucher_details[3],
-                'redemptionTime': details[2],
-                'isRedeemed': details[3]
-            })
+    customer_address = current_user['address']
+    
+    def build():
+        if index_ready():
+            return list_response(lambda after_id, page_size: iter_pages(
+                lambda a, n: indexer.customer_redemptions(customer_address, a, n), after_id, page_size
+            ), paging)
         
-        return jsonify(redemptions)
+        return list_response(lambda after_id, page_size: chain_customer_redemptions(
+            customer_address, after_id, page_size
+        ), paging)
+    
+    try:
+        tag = state_tag(f'customer:{customer_address}') if paging[2] is None else None
+        return conditional(tag, build)
     except Exception as e:
         return jsonify({'message': f'Error getting redemptions: {str(e)}'}), 500
 
+# Balance plus the first page of the catalog and of the customer's redemptions, read concurrently.
+# nextAfterId holds each list's X-Next-After-Id, to continue it on its own route
+@api.route('/api/customer/dashboard', methods=['GET'])
+@token_required
+def get_customer_dashboard(current_user):
+    if current_user['role'] != 'customer':
+        return jsonify({'message': 'Unauthorized'}), 403
+    if not contracts.voucher or not contracts.token:
+        return jsonify({'message': 'Contracts not initialized'}), 500
+        
+    customer_address = current_user['address']
+    indexed = index_ready()
+    # Catalog and redemptions both need voucher details off the index; each is read once
+    voucher_details = VoucherDetailsMemo(fetch_voucher_details)
+    
+    def balance():
+        return cached_call(contracts.token.functions.balanceOf(customer_address))
+    
+    def available_vouchers():
+        if indexed:
+            return take_page(lambda a, n: iter_pages(indexer.active_vouchers, a, n), 0, MAX_PAGE_SIZE)
+        return take_page(lambda a, n: chain_active_vouchers(a, n, voucher_details.get_many), 0, MAX_PAGE_SIZE)
+    
+    def redemptions():
+        if indexed:
+            return take_page(lambda after_id, page_size: iter_pages(
+                lambda a, n: indexer.customer_redemptions(customer_address, a, n), after_id, page_size
+            ), 0, MAX_PAGE_SIZE)
+        return take_page(lambda a, n: chain_customer_redemptions(
+            customer_address, a, n, voucher_details.get_many
+        ), 0, MAX_PAGE_SIZE)
+    
+    try:
+        results = fan_out(dashboard_pool, {
+            'balance': balance,
+            'availableVouchers': available_vouchers,
+            'redemptions': redemptions
+        })
+    except Exception as e:
+        return jsonify({'message': f'Error loading dashboard: {str(e)}'}), 500
+    
+    vouchers, next_voucher = results['availableVouchers']
+    customer_redemptions, next_redemption = results['redemptions']
+    return jsonify({
+        'balance': results['balance'],
+        'availableVouchers': vouchers,
+        'redemptions': customer_redemptions,
+        'nextAfterId': {'availableVouchers': next_voucher, 'redemptions': next_redemption}
+    })
+
+def redeem_stream_ticket(ticket):
+    """The user a stream ticket was issued to, or None if it is invalid, expired or already used."""
+    try:
+        data = jwt.decode(ticket, JWT_SECRET, algorithms=["HS256"], audience='events')
+    except jwt.InvalidTokenError:
+        return None
+    now = time.time()
+    with used_stream_tickets_lock:
+        for jti, expires in list(used_stream_tickets.items()):
+            if expires < now:
+                del used_stream_tickets[jti]
+        if data['jti'] in used_stream_tickets:
+            return None
+        used_stream_tickets[data['jti']] = data['exp']
+    address = data['address']
+    return {
+        'username': data['username'],
+        'role': data['role'],
+        'address': checksum_address(address) if address else address
+    }
+
+# EventSource cannot send an Authorization header, so browsers open /api/events with a ticket
+# from here: valid for SSE_TICKET_TTL seconds, for one connection, and for nothing but the stream
+@api.route('/api/events/ticket', methods=['POST'])
+@token_required
+def event_stream_ticket(current_user):
+    ticket = jwt.encode({
+        'username': current_user['username'],
+        'role': current_user['role'],
+        'address': current_user['address'],
+        'aud': 'events',
+        'jti': secrets.token_hex(16),
+        'exp': datetime.utcnow() + timedelta(seconds=SSE_TICKET_TTL)
+    }, JWT_SECRET)
+    return jsonify({'ticket': ticket, 'expires_in': SSE_TICKET_TTL})
+
+# Server-sent events with the changes relevant to the signed-in user
+@api.route('/api/events', methods=['GET'])
+def event_stream():
+    token = bearer_token()
+    if token:
+        current_user = authenticate(token)
+    else:
+        ticket = request.args.get('ticket')
+        current_user = redeem_stream_ticket(ticket) if ticket else None
+    if current_user is None:
+        return jsonify({'message': 'Token or ticket is missing or invalid'}), 401
+        
+    subscription = event_feed.subscribe(current_user)
+    
+    def stream():
+        try:
+            yield 'retry: 3000\n\n'
+            while True:
+                event = subscription.get(timeout=SSE_KEEPALIVE)
+                # Comments keep proxies from closing an idle stream and reveal disconnected clients
+                yield format_sse(event) if event is not None else ': keepalive\n\n'
+        finally:
+            event_feed.unsubscribe(subscription)
+            
+    return Response(stream(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+# Transaction status for routes called in async mode
+@api.route('/api/tx/<tx_id>', methods=['GET'])
+@token_required
+def get_tx_status(current_user, tx_id):
+    tracked = tx_watcher.get(tx_id)
+    is_owner = tracked is not None and tracked.owner is not None and \
+        (tracked.owner['role'], tracked.owner['username']) == (current_user['role'], current_user['username'])
+    if tracked is None or (current_user['role'] != 'admin' and not is_owner):
+        return jsonify({'message': 'Transaction not found'}), 404
+    return jsonify(tracked.to_dict())
+
 # Common routes
-@app.route('/api/voucher/<int:voucher_id>', methods=['GET'])
+@api.route('/api/voucher/<int:voucher_id>', methods=['GET'])
 def get_voucher_details(voucher_id):
     try:
         print(f"Getting details for voucher ID: {voucher_id}")
-        print(f"Voucher contract address: {voucher_address}")
+        print(f"Voucher contract address: {contracts.addresses['voucher']}")
         
-        if not voucher_contract:
+        if not contracts.voucher:
             print("Voucher contract is not initialized")
             return jsonify({'message': 'Voucher contract not initialized'}), 500
         
-        try:
-            details = voucher_contract.functions.getVoucherDetails(voucher_id).call()
+        scope = f'voucher:{voucher_id}'
+        if index_ready():
+            # Tag before reading, so the body is never older than the tag
+            tag = state_tag(scope, indexed=True)
+            found = indexer.vouchers([voucher_id])
+            if found:
+                return conditional(tag, lambda: jsonify(found[0]))
+        
+        # Not indexed yet: read it live, tagged with the head block
+        def build():
+            details = cached_call(contracts.voucher.functions.getVoucherDetails(voucher_id))
             print(f"Successfully got voucher details: {details}")
             
             return jsonify({
@@ -700,6 +1435,9 @@ def get_voucher_details(voucher_id):
                 'businessAddress': details[3],
                 'isActive': details[4]
             })
+        
+        try:
+            return conditional(state_tag(scope, indexed=False), build)
         except ValueError as e:
             error_str = str(e)
             if "Voucher does not exist" in error_str:
@@ -714,30 +1452,53 @@ def get_voucher_details(voucher_id):
         return jsonify({'message': f'Error getting voucher details: {str(e)}'}), 500
 
 # API endpoint to check contract status
-@app.route('/api/contract-status', methods=['GET'])
+@api.route('/api/contract-status', methods=['GET'])
 def contract_status():
-    status = {
-        'blockchain_connected': w3.isConnected(),
-        'factory_contract': {
-            'address': factory_address if factory_address else None,
-            'initialized': factory_contract is not None
-        },
-        'token_contract': {
-            'address': loyalty_token_address if loyalty_token_address else None,
-            'initialized': token_contract is not None
-        },
-        'registry_contract': {
-            'address': business_registry_address if business_registry_address else None,
-            'initialized': registry_contract is not None
-        },
-        'voucher_contract': {
-            'address': voucher_address if voucher_address else None,
-            'initialized': voucher_contract is not None
-        }
+    status = {'blockchain_connected': w3.isConnected()}
+    status.update(contracts.status())
+    status['startup'] = {
+        'import_ms': round(IMPORT_SECONDS * 1000, 2),
+        'create_app_ms': round(current_app.config['STARTUP_SECONDS'] * 1000, 2),
+        'contracts_source': contracts.source,
+        'contracts_resolve_ms': round(contracts.resolve_seconds * 1000, 2) if contracts.resolve_seconds is not None else None
     }
     
     return jsonify(status)
 
+# Prometheus scrape endpoint; set METRICS_TOKEN to require it as a bearer token
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', '')
+
+@api.route('/api/metrics', methods=['GET'])
+def get_metrics():
+    if METRICS_TOKEN and not secrets.compare_digest(bearer_token() or '', METRICS_TOKEN):
+        return jsonify({'message': 'Unauthorized'}), 401
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Module setup time, not counting third-party imports
+IMPORT_SECONDS = time.perf_counter() - IMPORT_STARTED
+
+def create_app():
+    """Build the Flask app; contracts and the indexer come up in the background."""
+    start = time.perf_counter()
+    app = Flask(__name__)
+    app.secret_key = JWT_SECRET
+    CORS(app, supports_credentials=True, expose_headers=['X-Next-After-Id', 'ETag'])
+    app.register_blueprint(api)
+    instrument_app(app)
+    if os.getenv('TRACE_ENABLED', 'true').lower() == 'true':
+        slow_requests.instrument(app)
+    request_profiler.instrument(app)
+    if os.getenv('COMPRESS_RESPONSES', 'true').lower() == 'true':
+        compress_responses(app, min_size=int(os.getenv('COMPRESS_MIN_SIZE', '1024')),
+                           level=int(os.getenv('COMPRESS_LEVEL', '5')))
+    
+    if os.getenv('INDEXER_ENABLED', 'true').lower() == 'true':
+        start_indexer_once()
+    
+    app.config['STARTUP_SECONDS'] = time.perf_counter() - start
+    print(f"App ready in {(IMPORT_SECONDS + app.config['STARTUP_SECONDS']) * 1000:.1f} ms")
+    return app
+
 if __name__ == '__main__':
     print(f"Admin password: {ADMIN_PASSWORD}")
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    create_app().run(debug=True, port=5000) 
@@ -0,0 +1,720 @@
+"""Benchmark: throughput, latency and RPC calls of every API route against a local chain.
+
+Deploys the contracts to an in-process eth-tester chain (or to an existing
+node given with --provider), seeds businesses, vouchers, customers and
+redemptions through the API itself, then drives each route with concurrent
+workers through the Flask test client, a real threaded WSGI server, or
+gunicorn with --workers processes sharing state the way a multi-worker
+deployment does (SECRETS_FILE and SHARED_STATE_DB). The
+app talks to the chain through a small JSON-RPC proxy that counts calls, so
+every route is reported with throughput, p50/p95/p99 latency and RPC calls
+(and HTTP round trips) per request. Results can be saved as a JSON baseline
+and later runs compared against it.
+
+    python benchmarks/bench_endpoints.py --businesses 5 --vouchers 20 --customers 20 \\
+        --redemptions 40 --requests 500 --threads 8 --save baseline.json
+    python benchmarks/bench_endpoints.py --compare baseline.json --max-regression 20
+    for n in 1 2 4; do python benchmarks/bench_endpoints.py --workers $n --save workers-$n.json; done
+
+Contracts are compiled from ../contracts with py-solc-x, or loaded with
+--artifacts from a JSON file of ``{"LoyaltyToken": {"abi": [...], "bin": "0x..."},
+"BusinessRegistry": ..., "Voucher": ...}``. They are wired together the way
+LoyaltySystemFactory does it, but deployed from the first account so that it
+stays the registry admin the app logs in as. /api/events is not driven: its
+responses never end.
+"""
+import argparse
+import contextlib
+import json
+import os
+import platform
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests  # noqa: E402
+from web3 import Web3  # noqa: E402
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+CONTRACTS_DIR = os.path.join(BACKEND_DIR, '..', 'contracts')
+
+# Source unit names the imports use, and the files that hold them
+CONTRACT_SOURCES = {
+    'LoyaltyToken.sol': 'LoyaltyToken.Sol',
+    'BusinessRegistry.sol': 'BusinessRegistry.sol',
+    'Voucher.sol': 'Voucher.sol'
+}
+
+# Seeded accounts use these private keys onwards, clear of eth-tester's defaults
+ACCOUNT_KEY_OFFSET = 0x10000
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+# Chain
+
+def _hexify(value):
+    if isinstance(value, bool) or value is None:
+        return value
+    if isinstance(value, int):
+        return hex(value)
+    if isinstance(value, (bytes, bytearray)):
+        return '0x' + bytes(value).hex()
+    if isinstance(value, (list, tuple)):
+        return [_hexify(item) for item in value]
+    if hasattr(value, 'items'):
+        return {key: _hexify(item) for key, item in value.items()}
+    return value
+
+
+class TesterChain:
+    """In-process eth-tester chain answering JSON-RPC requests like a node would."""
+
+    def __init__(self):
+        from web3 import EthereumTesterProvider
+
+        self.provider = EthereumTesterProvider()
+        self._request = self.provider.request_func(Web3(self.provider), ())
+        # py-evm is not thread safe
+        self._lock = threading.Lock()
+
+    def handle(self, call):
+        with self._lock:
+            try:
+                response = dict(self._request(call['method'], call.get('params', [])))
+            except Exception as e:
+                # Code 3 is how geth reports a revert, which web3 turns into ContractLogicError
+                response = {'error': {'code': 3 if 'revert' in str(e).lower() else -32000, 'message': str(e)}}
+        if 'result' in response:
+            response['result'] = _hexify(response['result'])
+        response.update(jsonrpc='2.0', id=call.get('id'))
+        return response
+
+    def forward(self, body):
+        payload = json.loads(body)
+        if isinstance(payload, list):
+            return json.dumps([self.handle(call) for call in payload]).encode()
+        return json.dumps(self.handle(payload)).encode()
+
+    def add_account(self, private_key):
+        return self.provider.ethereum_tester.add_account(private_key)
+
+
+class UpstreamChain:
+    """An existing node; seeded accounts must already be unlocked on it."""
+
+    def __init__(self, uri):
+        self.uri = uri
+        self.session = requests.Session()
+
+    def forward(self, body):
+        return self.session.post(self.uri, data=body, headers={'Content-Type': 'application/json'}).content
+
+    def add_account(self, private_key):
+        return None
+
+
+class RpcCounter:
+    """HTTP JSON-RPC endpoint in front of the chain that counts calls and round trips."""
+
+    def __init__(self, chain):
+        self.calls = 0
+        self.round_trips = 0
+        self._lock = threading.Lock()
+        counter = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, *args):
+                pass
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if not body:
+                    # The app process went away mid-request, as gunicorn workers do on shutdown
+                    return
+                payload = json.loads(body)
+                with counter._lock:
+                    counter.round_trips += 1
+                    counter.calls += len(payload) if isinstance(payload, list) else 1
+                data = chain.forward(body)
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.server.daemon_threads = True
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def snapshot(self):
+        with self._lock:
+            return self.calls, self.round_trips
+
+
+def load_artifacts(path, solc_version):
+    """``{name: {'abi': ..., 'bin': ...}}`` from ``path``, or compiled from ../contracts."""
+    if path:
+        with open(path) as f:
+            return json.load(f)
+
+    import solcx
+
+    if solc_version not in [str(version) for version in solcx.get_installed_solc_versions()]:
+        solcx.install_solc(solc_version)
+    sources = {}
+    for unit, filename in CONTRACT_SOURCES.items():
+        with open(os.path.join(CONTRACTS_DIR, filename)) as f:
+            sources[unit] = {'content': f.read()}
+    output = solcx.compile_standard({
+        'language': 'Solidity',
+        'sources': sources,
+        'settings': {'outputSelection': {'*': {'*': ['abi', 'evm.bytecode.object']}}}
+    }, solc_version=solc_version)
+    return {
+        name: {'abi': compiled['abi'], 'bin': compiled['evm']['bytecode']['object']}
+        for unit in CONTRACT_SOURCES
+        for name, compiled in output['contracts'][unit].items()
+    }
+
+
+def deploy_system(w3, artifacts):
+    admin = w3.eth.accounts[0]
+
+    def deploy(name, *args):
+        contract = w3.eth.contract(abi=artifacts[name]['abi'], bytecode=artifacts[name]['bin'])
+        receipt = w3.eth.wait_for_transaction_receipt(contract.constructor(*args).transact({'from': admin}))
+        return receipt.contractAddress
+
+    token = deploy('LoyaltyToken')
+    registry = deploy('BusinessRegistry')
+    voucher = deploy('Voucher', token, registry)
+    token_contract = w3.eth.contract(address=token, abi=artifacts['LoyaltyToken']['abi'])
+    w3.eth.wait_for_transaction_receipt(token_contract.functions.setMinter(voucher, True).transact({'from': admin}))
+    return {'TOKEN_ADDRESS': token, 'REGISTRY_ADDRESS': registry, 'VOUCHER_ADDRESS': voucher}
+
+
+def seed_accounts(w3, chain, count):
+    """``count`` funded, unlocked accounts besides the admin's."""
+    if isinstance(chain, UpstreamChain):
+        accounts = w3.eth.accounts[1:]
+        if len(accounts) < count:
+            raise SystemExit(f'--provider node has {len(accounts)} spare unlocked accounts, {count} needed')
+        return accounts[:count]
+    accounts = []
+    for i in range(count):
+        address = Web3.toChecksumAddress(chain.add_account(f'0x{ACCOUNT_KEY_OFFSET + i:064x}'))
+        w3.eth.send_transaction({'from': w3.eth.accounts[0], 'to': address, 'value': Web3.toWei(10, 'ether')})
+        accounts.append(address)
+    return accounts
+
+
+# Clients
+
+class TestClient:
+    """Requests through Flask's test client, one per worker thread."""
+
+    name = 'test'
+
+    def __init__(self, app):
+        self.app = app
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, body=None, data=None):
+        client = getattr(self._local, 'client', None)
+        if client is None:
+            client = self._local.client = self.app.test_client()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = client.open(path, method=method, json=body, data=data, headers=headers)
+        return response.status_code, response.get_data()
+
+    def close(self):
+        pass
+
+
+class WsgiClient:
+    """Requests over HTTP to the app served by a threaded werkzeug server."""
+
+    name = 'wsgi'
+
+    def __init__(self, app):
+        from werkzeug.serving import make_server
+
+        self.server = make_server('127.0.0.1', 0, app, threaded=True)
+        self.base_url = f'http://127.0.0.1:{self.server.server_port}'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self._local = threading.local()
+
+    def request(self, method, path, token=None, body=None, data=None):
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = self._local.session = requests.Session()
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        response = session.request(method, self.base_url + path, json=body, data=data, headers=headers)
+        return response.status_code, response.content
+
+    def close(self):
+        self.server.shutdown()
+
+
+class GunicornClient(WsgiClient):
+    """Requests over HTTP to the app run by gunicorn with ``workers`` processes."""
+
+    name = 'gunicorn'
+
+    def __init__(self, workers, threads, workdir, verbose=False):
+        with socket.socket() as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        env = dict(os.environ,
+                   SECRETS_FILE=os.path.join(workdir, 'secrets.json'),
+                   SHARED_STATE_DB=os.path.join(workdir, 'state.db'))
+        output = None if verbose else subprocess.DEVNULL
+        self.process = subprocess.Popen([
+            sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--worker-class', 'gthread',
+            '--threads', str(threads), '--bind', f'127.0.0.1:{port}', '--chdir', BACKEND_DIR, 'app:create_app()'
+        ], env=env, stdout=output, stderr=output)
+        self.base_url = f'http://127.0.0.1:{port}'
+        self._local = threading.local()
+        deadline = time.time() + 60
+        while True:
+            if self.process.poll() is not None:
+                raise SystemExit(f'gunicorn exited with status {self.process.returncode}')
+            try:
+                if requests.get(self.base_url + '/api/contract-status', timeout=5).status_code == 200:
+                    return
+            except requests.ConnectionError:
+                pass
+            if time.time() > deadline:
+                self.close()
+                raise SystemExit('gunicorn did not start within 60 seconds')
+            time.sleep(0.2)
+
+    def wait_until_indexed(self, timeout=60):
+        """Wait until several requests in a row, spread over the workers, find the index ready."""
+        deadline = time.time() + timeout
+        ready = 0
+        while ready < 20 and time.time() < deadline:
+            status, _ = self.request('GET', '/api/customer/vouchers/search?limit=1')
+            ready = ready + 1 if status != 503 else 0
+            if not ready:
+                time.sleep(0.2)
+
+    def close(self):
+        self.process.terminate()
+        self.process.wait()
+
+
+# Measurement
+
+class Recorder:
+    def __init__(self, counter):
+        self.counter = counter
+        self.results = {}
+
+    def run(self, name, send, count, threads, phase='load'):
+        """Send ``count`` requests over ``threads`` workers; ``send(i)`` returns the status code."""
+        errors = []
+
+        def timed(i):
+            start = time.perf_counter()
+            try:
+                status = send(i)
+            except Exception as e:
+                status = repr(e)
+            elapsed = time.perf_counter() - start
+            if not isinstance(status, int) or status >= 400:
+                errors.append(status)
+            return elapsed
+
+        calls, round_trips = self.counter.snapshot()
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            latencies = sorted(executor.map(timed, range(count)))
+        elapsed = time.perf_counter() - start
+        end_calls, end_round_trips = self.counter.snapshot()
+        if not latencies:
+            return
+        self.results[name] = {
+            'phase': phase,
+            'requests': count,
+            'threads': threads,
+            'errors': len(errors),
+            'error_statuses': sorted({str(status) for status in errors}),
+            'throughput_rps': round(count / elapsed, 2),
+            'mean_ms': round(sum(latencies) / count * 1000, 3),
+            'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+            'rpc_per_request': round((end_calls - calls) / count, 2),
+            'round_trips_per_request': round((end_round_trips - round_trips) / count, 2)
+        }
+
+
+def idle_rpc_rate(counter, seconds=2.0):
+    """RPC calls per second the app's background threads make with no traffic."""
+    calls, _ = counter.snapshot()
+    time.sleep(seconds)
+    return round((counter.snapshot()[0] - calls) / seconds, 2)
+
+
+def json_body(data):
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def until_accepted(send):
+    """``send()`` again while the app sheds load with 503, as a well-behaved client would."""
+    while True:
+        status, data = send()
+        if status != 503:
+            return status, data
+        time.sleep(0.2)
+
+
+def seed(client, recorder, accounts, args):
+    """Create the data the load phase reads, timing each route used on the way."""
+    state = {'businesses': [], 'customers': [], 'vouchers': [], 'redemptions': []}
+    password = 'bench-password'
+    run_id = int(time.time())
+
+    status, data = client.request('GET', '/api/admin/password')
+    status, data = client.request('POST', '/api/login', body={'role': 'admin', 'password': json_body(data)['admin_password']})
+    state['admin_token'] = json_body(data)['token']
+
+    def login(role, username):
+        status, data = until_accepted(lambda: client.request('POST', '/api/login', body={
+            'role': role, 'username': username, 'password': password
+        }))
+        return status, json_body(data) or {}
+
+    business_accounts = accounts[:args.businesses]
+    customer_accounts = accounts[args.businesses:]
+
+    def register_business(i):
+        username = f'bench-business-{run_id}-{i}'
+        status, _ = until_accepted(lambda: client.request('POST', '/api/register/business', body={
+            'username': username, 'password': password, 'address': business_accounts[i], 'name': f'Business {i}'
+        }))
+        state['businesses'].append({'username': username, 'address': business_accounts[i]})
+        return status
+
+    def register_on_chain(i):
+        business = state['businesses'][i]
+        status, data = login('business', business['username'])
+        business['token'] = data.get('token')
+        status, _ = client.request('POST', '/api/business/register-on-chain', business['token'], body={'name': f'Business {i}'})
+        return status
+
+    recorder.run('POST /api/register/business', register_business, args.businesses, 1, phase='seed')
+    state['businesses'].sort(key=lambda business: business['username'])
+    recorder.run('POST /api/business/register-on-chain', register_on_chain, args.businesses, 1, phase='seed')
+    recorder.run('POST /api/admin/approve-business', lambda i: client.request(
+        'POST', '/api/admin/approve-business', state['admin_token'], body={'address': state['businesses'][0]['address']}
+    )[0], 1, 1, phase='seed')
+    recorder.run('POST /api/admin/approve-businesses', lambda i: client.request(
+        'POST', '/api/admin/approve-businesses', state['admin_token'],
+        body={'addresses': [business['address'] for business in state['businesses'][1:]]}
+    )[0], 1 if args.businesses > 1 else 0, 1, phase='seed')
+
+    def create_voucher(i):
+        business = state['businesses'][i % args.businesses]
+        status, data = client.request('POST', '/api/business/create-voucher', business['token'], body={
+            'title': f'Voucher {i}', 'description': 'Benchmark voucher', 'pointCost': args.point_cost
+        })
+        voucher_id = (json_body(data) or {}).get('voucher_id')
+        if voucher_id is not None:
+            state['vouchers'].append({'id': voucher_id, 'business': business})
+        return status
+
+    recorder.run('POST /api/business/create-voucher', create_voucher, args.vouchers, args.threads, phase='seed')
+    state['vouchers'].sort(key=lambda voucher: voucher['id'])
+
+    def register_customer(i):
+        username = f'bench-customer-{run_id}-{i}'
+        status, _ = until_accepted(lambda: client.request('POST', '/api/register/customer', body={
+            'username': username, 'password': password, 'address': customer_accounts[i]
+        }))
+        state['customers'].append({'username': username, 'address': customer_accounts[i]})
+        return status
+
+    recorder.run('POST /api/register/customer', register_customer, args.customers, args.threads, phase='seed')
+    state['customers'].sort(key=lambda customer: customer['username'])
+    for customer in state['customers']:
+        customer['token'] = login('customer', customer['username'])[1].get('token')
+
+    # Enough points for the seeded redemptions and the load phase's
+    points = args.point_cost * (args.redemptions // max(args.customers, 1) + args.write_requests + 1) * 2
+    upload = ''.join(f"{customer['address']},{points}\n" for customer in state['customers'])
+    recorder.run('POST /api/admin/issue-points', lambda i: client.request(
+        'POST', '/api/admin/issue-points?format=csv', state['admin_token'], data=upload
+    )[0], 1, 1, phase='seed')
+
+    def redeem(i):
+        customer = state['customers'][i % args.customers]
+        voucher = state['vouchers'][i % len(state['vouchers'])]
+        status, data = client.request('POST', f"/api/customer/redeem-voucher/{voucher['id']}", customer['token'])
+        redemption_id = (json_body(data) or {}).get('redemption_id')
+        if redemption_id is not None:
+            state['redemptions'].append({'id': redemption_id, 'business': voucher['business']})
+        return status
+
+    if state['vouchers'] and state['customers']:
+        recorder.run('POST /api/customer/redeem-voucher/<id>', redeem, args.redemptions, args.threads, phase='seed')
+
+    # One asynchronous submission, for the transaction status route
+    status, data = client.request('POST', '/api/business/create-voucher?async=true', state['businesses'][0]['token'], body={
+        'title': 'Async voucher', 'description': 'Benchmark voucher', 'pointCost': args.point_cost
+    })
+    state['status_url'] = (json_body(data) or {}).get('status_url')
+    return state
+
+
+def load(client, recorder, state, args):
+    """Drive every route concurrently; reads get --requests each, writes --write-requests."""
+    n, writes, threads = args.requests, args.write_requests, args.threads
+    admin = state['admin_token']
+    businesses, customers = state['businesses'], state['customers']
+    vouchers, redemptions = state['vouchers'], state['redemptions']
+    if not (vouchers and customers):
+        print('Seeding produced no vouchers or customers; only unauthenticated routes are driven')
+
+    def get(path, token=None):
+        return lambda i: client.request('GET', path(i) if callable(path) else path, token(i) if callable(token) else token)[0]
+
+    def business_token(i):
+        return businesses[i % len(businesses)]['token']
+
+    def customer_token(i):
+        return customers[i % len(customers)]['token']
+
+    reads = [
+        ('GET /api/contract-status', get('/api/contract-status')),
+        ('GET /api/admin/password', get('/api/admin/password')),
+        ('GET /api/admin/businesses', get('/api/admin/businesses', admin)),
+        ('GET /api/admin/cache-stats', get('/api/admin/cache-stats', admin)),
+        ('GET /api/customer/available-vouchers', get('/api/customer/available-vouchers')),
+        ('GET /api/customer/available-vouchers?stream=ndjson', get('/api/customer/available-vouchers?stream=ndjson'))
+    ]
+    if vouchers:
+        reads += [
+            ('GET /api/voucher/<id>', get(lambda i: f"/api/voucher/{vouchers[i % len(vouchers)]['id']}")),
+            ('GET /api/business/vouchers', get('/api/business/vouchers', business_token))
+        ]
+    if customers:
+        reads += [
+            ('GET /api/customer/balance', get('/api/customer/balance', customer_token)),
+            ('GET /api/customer/redemptions', get('/api/customer/redemptions', customer_token))
+        ]
+    if state.get('status_url'):
+        reads.append(('GET /api/tx/<id>', get(state['status_url'], businesses[0]['token'])))
+    for name, send in reads:
+        recorder.run(name, send, n, threads)
+
+    run_id = int(time.time())
+    recorder.run('POST /api/login', lambda i: client.request('POST', '/api/login', body={
+        'role': 'customer', 'username': customers[i % len(customers)]['username'], 'password': 'bench-password'
+    })[0], writes if customers else 0, threads)
+    recorder.run('POST /api/register/customer (load)', lambda i: client.request('POST', '/api/register/customer', body={
+        'username': f'bench-load-{run_id}-{i}', 'password': 'bench-password', 'address': f'0x{run_id:020x}{i:020x}'
+    })[0], writes, threads)
+    recorder.run('POST /api/admin/register-business', lambda i: client.request(
+        'POST', '/api/admin/register-business', admin,
+        body={'address': f'0x{run_id + 1:020x}{i:020x}', 'name': f'Walk-in {i}'}
+    )[0], writes, threads)
+    if not (vouchers and customers):
+        return
+
+    recorder.run('POST /api/business/create-voucher (load)', lambda i: client.request(
+        'POST', '/api/business/create-voucher', business_token(i),
+        body={'title': f'Load voucher {i}', 'description': 'Benchmark voucher', 'pointCost': args.point_cost}
+    )[0], writes, threads)
+    recorder.run('POST /api/customer/redeem-voucher/<id> (load)', lambda i: client.request(
+        'POST', f"/api/customer/redeem-voucher/{vouchers[i % len(vouchers)]['id']}", customer_token(i)
+    )[0], writes, threads)
+    # Each voucher is toggled an even number of times, so all end up active again
+    toggles = [vouchers[i % len(vouchers)] for i in range(writes)]
+    toggles += toggles
+    recorder.run('POST /api/business/toggle-voucher/<id>', lambda i: client.request(
+        'POST', f"/api/business/toggle-voucher/{toggles[i]['id']}", toggles[i]['business']['token']
+    )[0], len(toggles), threads)
+    marks = redemptions[:writes]
+    recorder.run('POST /api/business/mark-redeemed/<id>', lambda i: client.request(
+        'POST', f"/api/business/mark-redeemed/{marks[i]['id']}", marks[i]['business']['token']
+    )[0], len(marks), threads)
+
+
+# Baselines
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report):
+    print(f"{'route':<52} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'rpc/req':>8} {'rt/req':>7} {'err':>5}")
+    for name, result in report['routes'].items():
+        label = name if result['phase'] == 'load' else f'{name} [seed]'
+        print(f"{label:<52} {result['throughput_rps']:9.1f} {result['p50_ms']:9.2f} {result['p95_ms']:9.2f} "
+              f"{result['p99_ms']:9.2f} {result['rpc_per_request']:8.2f} {result['round_trips_per_request']:7.2f} "
+              f"{result['errors']:5d}")
+    print(f"idle background RPC: {report['idle_rpc_per_s']} calls/s")
+
+
+def compare(report, baseline, max_regression):
+    """Print the change against ``baseline``; returns the routes that regressed past ``max_regression`` %."""
+    def change(new, old):
+        return (new - old) / old * 100 if old else 0.0
+
+    regressed = []
+    print(f"\nagainst {baseline['meta'].get('git_commit')} ({baseline['meta'].get('created')}):")
+    for key in ('chain', 'client', 'workers', 'threads', 'seed', 'requests', 'write_requests'):
+        # Baselines saved before --workers existed ran one process
+        old = baseline['meta'].get(key, 1 if key == 'workers' else None)
+        if old != report['meta'][key]:
+            print(f"note: {key} differs ({old} in the baseline, {report['meta'][key]} now)")
+    print(f"{'route':<52} {'req/s':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'rpc/req':>9}")
+    for name, result in report['routes'].items():
+        old = baseline['routes'].get(name)
+        if old is None or result['phase'] != 'load':
+            continue
+        deltas = {key: change(result[key], old[key])
+                  for key in ('throughput_rps', 'p50_ms', 'p95_ms', 'p99_ms', 'rpc_per_request')}
+        flag = ''
+        if deltas['p95_ms'] > max_regression or -deltas['throughput_rps'] > max_regression:
+            regressed.append(name)
+            flag = '  REGRESSED'
+        print(f"{name:<52} " + ' '.join(f'{deltas[key]:+8.1f}%' for key in deltas) + flag)
+    return regressed
+
+
+def run_in_process(args, counter, accounts):
+    """Import the app into this process and benchmark it; returns the idle RPC rate and the recorder."""
+    with contextlib.ExitStack() as output:
+        if not args.verbose:
+            devnull = output.enter_context(open(os.devnull, 'w'))
+            output.enter_context(contextlib.redirect_stdout(devnull))
+            output.enter_context(contextlib.redirect_stderr(devnull))
+        import app as app_module
+
+        app = app_module.create_app()
+        client = WsgiClient(app) if args.client == 'wsgi' else TestClient(app)
+        recorder = Recorder(counter)
+        state = seed(client, recorder, accounts, args)
+        # Let the indexer catch up so reads measure the steady state
+        deadline = time.time() + 60
+        while app_module.indexer is not None and not app_module.index_ready() and time.time() < deadline:
+            time.sleep(0.2)
+        load(client, recorder, state, args)
+        idle = idle_rpc_rate(counter)
+        client.close()
+    return idle, recorder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--provider', help='existing node to use instead of an in-process eth-tester chain')
+    parser.add_argument('--artifacts', help='JSON file of compiled contracts (default: compile ../contracts with solcx)')
+    parser.add_argument('--solc-version', default='0.8.19')
+    parser.add_argument('--client', choices=('test', 'wsgi'), default='test',
+                        help='Flask test client, or a threaded WSGI server over HTTP')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='serve the app with gunicorn and this many worker processes instead of --client')
+    parser.add_argument('--worker-threads', type=int, default=4, help='threads per gunicorn worker')
+    parser.add_argument('--businesses', type=int, default=3)
+    parser.add_argument('--vouchers', type=int, default=10)
+    parser.add_argument('--customers', type=int, default=10)
+    parser.add_argument('--redemptions', type=int, default=20)
+    parser.add_argument('--point-cost', type=int, default=10)
+    parser.add_argument('--requests', type=int, default=200, help='requests per read route')
+    parser.add_argument('--write-requests', type=int, default=20, help='requests per write route')
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--save', help='write the results to this JSON file')
+    parser.add_argument('--compare', help='baseline JSON file to compare against')
+    parser.add_argument('--max-regression', type=float, default=20.0,
+                        help='exit non-zero if p95 or throughput is this many percent worse than the baseline')
+    parser.add_argument('--verbose', action='store_true', help="show the app's own output")
+    args = parser.parse_args()
+    if args.businesses < 1:
+        parser.error('--businesses must be at least 1')
+
+    chain = UpstreamChain(args.provider) if args.provider else TesterChain()
+    counter = RpcCounter(chain)
+    w3 = Web3(Web3.HTTPProvider(counter.url))
+    print(f"Deploying contracts to {args.provider or 'eth-tester'}")
+    addresses = deploy_system(w3, load_artifacts(args.artifacts, args.solc_version))
+    accounts = seed_accounts(w3, chain, args.businesses + args.customers)
+
+    # The app reads its configuration when imported
+    workdir = tempfile.mkdtemp(prefix='bench-endpoints-')
+    os.environ.update(addresses)
+    os.environ.update({
+        'BLOCKCHAIN_PROVIDER': counter.url,
+        'BLOCKCHAIN_TRANSPORT': 'http',
+        'FACTORY_ADDRESS': '',
+        'USER_DB_PATH': os.path.join(workdir, 'users.db'),
+        'INDEX_DB_PATH': os.path.join(workdir, 'index.db'),
+        'CONTRACT_CACHE_PATH': os.path.join(workdir, 'contract_cache.json')
+    })
+    if args.workers:
+        client = GunicornClient(args.workers, args.worker_threads, workdir, args.verbose)
+        recorder = Recorder(counter)
+        try:
+            state = seed(client, recorder, accounts, args)
+            client.wait_until_indexed()
+            load(client, recorder, state, args)
+            idle = idle_rpc_rate(counter)
+        finally:
+            client.close()
+    else:
+        idle, recorder = run_in_process(args, counter, accounts)
+
+    report = {
+        'meta': {
+            'created': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_commit': git_commit(),
+            'python': platform.python_version(),
+            'chain': args.provider or 'eth-tester',
+            'client': 'gunicorn' if args.workers else args.client,
+            'workers': args.workers or 1,
+            'threads': args.threads,
+            'seed': {key: getattr(args, key) for key in ('businesses', 'vouchers', 'customers', 'redemptions')},
+            'requests': args.requests,
+            'write_requests': args.write_requests
+        },
+        'idle_rpc_per_s': idle,
+        'routes': recorder.results
+    }
+    print_report(report)
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {args.save}")
+    if args.compare:
+        with open(args.compare) as f:
+            regressed = compare(report, json.load(f), args.max_regression)
+        if regressed:
+            print(f"{len(regressed)} route(s) regressed by more than {args.max_regression}%")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,80 @@
+"""Micro-benchmark: login throughput with inline vs pooled password hashing.
+
+Runs a storm of password verifications from request-like threads, once
+calling werkzeug directly in the thread (the old behaviour) and once through
+``PasswordHasher``, while another thread measures how long a cheap
+pure-Python request takes to get through.
+
+    python benchmarks/bench_password_hash.py --logins 200 --threads 16
+"""
+import argparse
+import os
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from werkzeug.security import check_password_hash, generate_password_hash  # noqa: E402
+
+from password_hasher import PasswordHasher  # noqa: E402
+
+
+def cheap_request():
+    # Stands in for a cached balance read: a little pure-Python work
+    return sum(i * i for i in range(2000))
+
+
+def probe(stop, latencies):
+    while not stop.is_set():
+        start = time.perf_counter()
+        cheap_request()
+        latencies.append(time.perf_counter() - start)
+        time.sleep(0.005)
+
+
+def run(verify, logins, threads):
+    stop = threading.Event()
+    latencies = []
+    prober = threading.Thread(target=probe, args=(stop, latencies))
+    prober.start()
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        assert all(executor.map(lambda _: verify(), range(logins)))
+    elapsed = time.perf_counter() - start
+    stop.set()
+    prober.join()
+    latencies.sort()
+    return {
+        'logins_per_s': logins / elapsed,
+        'probe_p50_ms': statistics.median(latencies) * 1000,
+        'probe_p95_ms': latencies[int(len(latencies) * 0.95) - 1] * 1000 if latencies else 0.0
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--iterations', type=int, default=260000)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    hasher = PasswordHasher(workers=args.workers, max_pending=args.logins, iterations=args.iterations)
+    password_hash = generate_password_hash('correct horse', method=hasher.method)
+    cores = args.workers or 1
+
+    results = {
+        'inline': run(lambda: check_password_hash(password_hash, 'correct horse'), args.logins, args.threads),
+        'pooled': run(lambda: hasher.verify(password_hash, 'correct horse'), args.logins, args.threads)
+    }
+    print(f"{args.logins} logins, {args.threads} threads, {args.iterations} iterations, {cores} workers")
+    for name, result in results.items():
+        print(f"{name:>7}: {result['logins_per_s']:8.1f} logins/s ({result['logins_per_s'] / cores:.1f}/core)  "
+              f"probe p50 {result['probe_p50_ms']:.2f} ms  p95 {result['probe_p95_ms']:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
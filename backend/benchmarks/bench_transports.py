@@ -0,0 +1,75 @@
+"""Benchmark: eth_call latency per provider transport against a local node.
+
+Pass the endpoints to compare; each is built with ``providers.build_provider``
+exactly as the app would build it.
+
+    python benchmarks/bench_transports.py --http http://127.0.0.1:8545 \\
+        --ws ws://127.0.0.1:8546 --ipc ~/.ethereum/geth.ipc --calls 2000 --threads 8
+"""
+import argparse
+import os
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from web3 import Web3  # noqa: E402
+
+from providers import build_provider  # noqa: E402
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def bench(w3, call, calls, threads):
+    def timed(_):
+        start = time.perf_counter()
+        w3.eth.call(call)
+        return time.perf_counter() - start
+
+    w3.eth.call(call)  # connect and warm up
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        latencies = sorted(executor.map(timed, range(calls)))
+    elapsed = time.perf_counter() - start
+    return {
+        'calls_per_s': calls / elapsed,
+        'mean_ms': statistics.mean(latencies) * 1000,
+        'p50_ms': percentile(latencies, 0.50) * 1000,
+        'p95_ms': percentile(latencies, 0.95) * 1000,
+        'p99_ms': percentile(latencies, 0.99) * 1000
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--http')
+    parser.add_argument('--ws')
+    parser.add_argument('--ipc')
+    parser.add_argument('--to', default=os.getenv('TOKEN_ADDRESS', '0x' + '00' * 20),
+                        help='contract to call (defaults to TOKEN_ADDRESS)')
+    parser.add_argument('--data', default='0x18160ddd', help='calldata (defaults to totalSupply())')
+    parser.add_argument('--calls', type=int, default=1000)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--timeout', type=float, default=10)
+    args = parser.parse_args()
+
+    endpoints = [(name, uri) for name, uri in (('http', args.http), ('ws', args.ws), ('ipc', args.ipc)) if uri]
+    if not endpoints:
+        parser.error('give at least one of --http, --ws, --ipc')
+
+    call = {'to': Web3.toChecksumAddress(args.to), 'data': args.data}
+    print(f"{args.calls} eth_calls, {args.threads} threads")
+    for name, uri in endpoints:
+        provider = build_provider(os.path.expanduser(uri), transport=name, timeout=args.timeout,
+                                  pool_size=args.threads)
+        result = bench(Web3(provider), call, args.calls, args.threads)
+        print(f"{name:>5}: {result['calls_per_s']:8.1f} calls/s  mean {result['mean_ms']:.2f} ms  "
+              f"p50 {result['p50_ms']:.2f}  p95 {result['p95_ms']:.2f}  p99 {result['p99_ms']:.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Shared chain-head follower.
+
+One thread polls the node for the latest block number and notifies every
+subscriber when it advances, so background services react to new blocks
+without each running its own polling loop.
+"""
+import threading
+import time
+
+
+class ChainHead:
+    """Tracks the latest block number and fans new blocks out to subscribers."""
+
+    def __init__(self, w3, poll_interval=1.0):
+        self.w3 = w3
+        self.poll_interval = poll_interval
+        self.block_number = None
+        self.polled_at = 0.0
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._force = False
+        self._thread = None
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='chain-head', daemon=True)
+                self._thread.start()
+        return self
+
+    def subscribe(self, callback):
+        """Call ``callback(block_number)`` from the head thread for each new block."""
+        with self._lock:
+            self._subscribers.append(callback)
+        self.start()
+
+    def current(self, max_age):
+        """Latest block number, re-read from the node if the last poll is older than ``max_age``."""
+        if time.time() - self.polled_at > max_age:
+            with self._refresh_lock:
+                if time.time() - self.polled_at > max_age:
+                    block_number = self.w3.eth.block_number
+                    self.polled_at = time.time()
+                    if self.block_number is None or block_number > self.block_number:
+                        self.block_number = block_number
+                        # Subscribers are notified from the head thread, not the caller's
+                        self.poke()
+        return self.block_number
+
+    def poke(self):
+        """Poll again right away and notify subscribers even if no block was added."""
+        self._force = True
+        self._wake.set()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                force, self._force = self._force, False
+                block_number = self.w3.eth.block_number
+                self.polled_at = time.time()
+                if force or block_number != self.block_number:
+                    self.block_number = block_number
+                    self._notify(block_number)
+            except Exception as e:
+                print(f"Chain head: error polling latest block: {e}")
+            self._wake.wait(self.poll_interval)
+
+    def _notify(self, block_number):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback in subscribers:
+            try:
+                callback(block_number)
+            except Exception as e:
+                print(f"Chain head: subscriber {callback} failed on block {block_number}: {e}")
@@ -0,0 +1,136 @@
+"""Chain facts the write routes check before sending a transaction.
+
+The node's accounts, the chain id and the contracts' admin addresses do not
+change while the process runs, so each is read once. Business approval only
+ever goes from false to true: an approval is kept for good, and a "not
+approved" answer is kept until a BusinessApproved log or receipt for that
+address is seen (or ``negative_ttl`` passes, for approvals this process
+cannot hear about). Everything else a transaction depends on is checked by
+simulating the transaction itself, and its revert reason becomes the error
+the client sees. The gas strategy does that with the ``eth_estimateGas`` it
+needs anyway, and with ``dry_run`` (one ``eth_call``) when it already knows
+the gas limit.
+"""
+import threading
+import time
+
+from addresses import checksum_address
+import tracing
+from metrics import revert_reason
+
+# Revert reasons containing these map to these HTTP statuses; anything else is a 400
+REVERT_STATUSES = (
+    ('does not exist', 404),
+    ('Only ', 403)
+)
+
+
+class PreflightError(Exception):
+    """The transaction would revert; carries the reason and the HTTP status to answer with."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def preflight_error(error):
+    """The ``PreflightError`` for a node error from simulating a transaction, or None if it is not a revert."""
+    reason = revert_reason(error)
+    if reason is None:
+        return None
+    if reason == 'unknown':
+        return PreflightError('Transaction would revert')
+    status = next((status for text, status in REVERT_STATUSES if text in reason), 400)
+    return PreflightError(reason, status)
+
+
+def dry_run(contract_function, sender):
+    """Execute ``contract_function`` from ``sender`` as an ``eth_call`` and return its result.
+
+    Raises ``PreflightError`` if the transaction would revert; other errors
+    (the node being unreachable, say) propagate unchanged.
+    """
+    try:
+        with tracing.span('tx.preflight', contract_function.fn_name):
+            return contract_function.call({'from': sender})
+    except ValueError as e:
+        error = preflight_error(e)
+        if error is None:
+            raise
+        raise error
+
+
+class ChainMeta:
+    """Process-lifetime cache of node accounts, chain id, contract admins and business approvals."""
+
+    def __init__(self, w3, contracts, negative_ttl=30.0):
+        self.w3 = w3
+        self.contracts = contracts
+        self.negative_ttl = negative_ttl
+        self._values = {}
+        self._approved = set()
+        self._not_approved = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _once(self, key, read):
+        value = self._values.get(key)
+        if value is not None:
+            self.hits += 1
+            return value
+        with self._lock:
+            if key not in self._values:
+                self.misses += 1
+                self._values[key] = read()
+            return self._values[key]
+
+    def accounts(self):
+        """Accounts the node can sign for, checksummed."""
+        return self._once('accounts', lambda: [checksum_address(account) for account in self.w3.eth.accounts])
+
+    def admin_account(self):
+        accounts = self.accounts()
+        return accounts[0] if accounts else None
+
+    def chain_id(self):
+        return self._once('chain_id', lambda: self.w3.eth.chain_id)
+
+    def contract_admin(self, name):
+        """The ``admin()`` of the contract called ``name``."""
+        return self._once(('admin', name),
+                          lambda: checksum_address(self.contracts.get(name).functions.admin().call()))
+
+    def is_business_approved(self, address, read):
+        """Whether ``address`` is an approved business; ``read()`` asks the chain when not cached."""
+        if address in self._approved:
+            self.hits += 1
+            return True
+        checked_at = self._not_approved.get(address)
+        if checked_at is not None and time.time() - checked_at < self.negative_ttl:
+            self.hits += 1
+            return False
+        self.misses += 1
+        approved = read()
+        if approved:
+            self.business_approved(address)
+        else:
+            self._not_approved[address] = time.time()
+        return approved
+
+    def business_approved(self, address):
+        """Record an approval seen in a BusinessApproved log or receipt."""
+        address = checksum_address(address)
+        self._approved.add(address)
+        self._not_approved.pop(address, None)
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_ratio': round(self.hits / total, 4) if total else 0.0,
+            'approved_businesses': len(self._approved),
+            'unapproved_businesses': len(self._not_approved)
+        }
@@ -0,0 +1,215 @@
+"""Lazy resolution of the loyalty system contracts.
+
+Nothing here touches the node until a contract is first used. Addresses
+come from the *_ADDRESS environment variables; any that are missing are
+asked of the factory's ``getSystemAddresses()`` once and remembered in a
+small JSON file keyed by chain id and factory address, next to the parsed
+ABIs, so later workers start without reading four ABI files or calling
+the factory. If the node is unreachable the contracts stay unresolved and
+resolution is retried on a later access.
+"""
+import json
+import os
+import threading
+import time
+
+import metrics
+from addresses import checksum_address
+
+ABI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'abi')
+
+ABI_FILES = {
+    'factory': 'LoyaltySystemFactory.json',
+    'token': 'LoyaltyToken.json',
+    'registry': 'BusinessRegistry.json',
+    'voucher': 'Voucher.json'
+}
+
+ADDRESS_VARIABLES = {
+    'factory': 'FACTORY_ADDRESS',
+    'token': 'TOKEN_ADDRESS',
+    'registry': 'REGISTRY_ADDRESS',
+    'voucher': 'VOUCHER_ADDRESS'
+}
+
+SYSTEM_CONTRACTS = ('token', 'registry', 'voucher')
+
+
+def voucher_dict(voucher_id, details):
+    """API representation of a ``getVoucherDetails`` result."""
+    return {
+        'id': voucher_id,
+        'title': details[0],
+        'description': details[1],
+        'pointCost': details[2],
+        'businessAddress': details[3],
+        'isActive': details[4]
+    }
+
+
+def redemption_dict(redemption_id, details, voucher_details):
+    """API representation of a ``getRedemptionDetails`` result and its voucher."""
+    return {
+        'id': redemption_id,
+        'voucherId': details[0],
+        'voucherTitle': voucher_details[0],
+        'voucherDescription': voucher_details[1],
+        'pointCost': voucher_details[2],
+        'businessAddress': voucher_details[3],
+        'redemptionTime': details[2],
+        'isRedeemed': details[3]
+    }
+
+
+def _configured_address(variable):
+    address = os.getenv(variable, '').strip()
+    if not address:
+        return None
+    try:
+        return checksum_address(address)
+    except Exception as e:
+        print(f"Error converting {variable} '{address}': {e}")
+        return None
+
+
+class Contracts:
+    """Contract objects for the factory, token, registry and voucher, built on first use."""
+
+    def __init__(self, w3, cache_path='contract_cache.json', abi_dir=ABI_DIR, retry_interval=5.0):
+        self.w3 = w3
+        self.cache_path = cache_path
+        self.abi_dir = abi_dir
+        self.retry_interval = retry_interval
+        self.addresses = {name: _configured_address(variable) for name, variable in ADDRESS_VARIABLES.items()}
+        self.resolved = False
+        self.source = None
+        self.resolve_seconds = None
+        self._contracts = {}
+        self._lock = threading.Lock()
+        self._retry_at = 0.0
+
+    @property
+    def factory(self):
+        return self.get('factory')
+
+    @property
+    def token(self):
+        return self.get('token')
+
+    @property
+    def registry(self):
+        return self.get('registry')
+
+    @property
+    def voucher(self):
+        return self.get('voucher')
+
+    def get(self, name):
+        """The contract called ``name``, or None if it is not (yet) known."""
+        self._maybe_resolve()
+        return self._contracts.get(name)
+
+    def _maybe_resolve(self):
+        if not self.resolved and time.time() >= self._retry_at:
+            self.resolve()
+
+    def resolve(self):
+        with self._lock:
+            if self.resolved:
+                return
+            start = time.perf_counter()
+            cache = self._load_cache()
+            abis = self._load_abis(cache)
+            source = 'env'
+
+            missing = [name for name in SYSTEM_CONTRACTS if not self.addresses[name]]
+            if missing and self.addresses['factory']:
+                try:
+                    key = f"{self.w3.eth.chain_id}:{self.addresses['factory']}"
+                    system = cache.get('systems', {}).get(key)
+                    source = 'cache'
+                    if system is None:
+                        factory = self.w3.eth.contract(address=self.addresses['factory'], abi=abis['factory'])
+                        _, token, registry, voucher = factory.functions.getSystemAddresses().call()
+                        system = {'token': token, 'registry': registry, 'voucher': voucher}
+                        cache.setdefault('systems', {})[key] = system
+                        self._save_cache(cache)
+                        source = 'factory'
+                        print(f"Got addresses from factory: {token}, {registry}, {voucher}")
+                    for name in missing:
+                        self.addresses[name] = checksum_address(system[name])
+                except Exception as e:
+                    print(f"Error getting addresses from factory: {e}")
+                    self._retry_at = time.time() + self.retry_interval
+                    source = None
+
+            for name, address in self.addresses.items():
+                if address and name not in self._contracts:
+                    try:
+                        self._contracts[name] = self.w3.eth.contract(address=address, abi=abis[name])
+                        metrics.register_contract(name, self._contracts[name])
+                        print(f"{name.capitalize()} contract initialized: {address}")
+                    except Exception as e:
+                        print(f"Error initializing {name} contract: {e}")
+
+            if source is not None:
+                self.resolved = True
+                self.source = source
+            self.resolve_seconds = time.perf_counter() - start
+
+    def status(self):
+        self._maybe_resolve()
+        return {
+            f'{name}_contract': {
+                'address': self.addresses[name],
+                'initialized': self._contracts.get(name) is not None
+            }
+            for name in ADDRESS_VARIABLES
+        }
+
+    # Disk cache
+
+    def _abi_signature(self):
+        return [os.stat(os.path.join(self.abi_dir, filename)).st_mtime_ns for filename in ABI_FILES.values()]
+
+    def _load_abis(self, cache):
+        signature = self._abi_signature()
+        cached = cache.get('abis')
+        if cached and cached.get('signature') == signature:
+            return cached['abis']
+        abis = {}
+        for name, filename in ABI_FILES.items():
+            with open(os.path.join(self.abi_dir, filename)) as f:
+                abis[name] = json.load(f)
+        cache['abis'] = {'signature': signature, 'abis': abis}
+        self._save_cache(cache)
+        return abis
+
+    def _load_cache(self):
+        if not self.cache_path:
+            return {}
+        try:
+            with open(self.cache_path) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def _save_cache(self, cache):
+        if not self.cache_path:
+            return
+        tmp_path = f'{self.cache_path}.{os.getpid()}.tmp'
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(cache, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            print(f"Could not write contract cache {self.cache_path}: {e}")
+
+
+def create_contracts(w3):
+    """Build the lazy contract set from the *_ADDRESS and CONTRACT_CACHE_PATH environment variables."""
+    return Contracts(
+        w3,
+        cache_path=os.getenv('CONTRACT_CACHE_PATH', os.path.join(os.path.dirname(os.path.abspath(__file__)), 'contract_cache.json')),
+        retry_interval=float(os.getenv('CONTRACT_RETRY_INTERVAL', '5'))
+    )
@@ -0,0 +1,79 @@
+"""Concurrent reads behind the aggregated customer dashboard.
+
+``fan_out`` runs independent reads of one request on a shared thread pool,
+so the response waits for the slowest read rather than the sum of them.
+The pool threads send their node requests with the request's priority and
+record their spans into its trace. ``VoucherDetailsMemo`` lets those reads
+share ``getVoucherDetails`` lookups: each voucher is fetched once per
+request, and a read asking for one already being fetched waits for that
+result instead of fetching it again.
+"""
+import threading
+from concurrent.futures import Future
+
+import tracing
+from rpc_scheduler import current_priority, rpc_priority
+
+
+def fan_out(pool, parts):
+    """Run the ``{name: fn}`` reads concurrently on ``pool`` and return ``{name: result}``.
+
+    The first read to fail raises its error, once every read has finished.
+    """
+    priority = current_priority()
+    traced = tracing.active()
+
+    def run(name, fn):
+        with rpc_priority(priority), tracing.collect(name, traced) as span:
+            return fn(), span
+
+    futures = {name: pool.submit(run, name, fn) for name, fn in parts.items()}
+    results = {}
+    error = None
+    with tracing.span('fan_out', parts=len(parts)):
+        for name, future in futures.items():
+            try:
+                results[name], span = future.result()
+            except Exception as e:
+                error = error or e
+                continue
+            tracing.attach(span)
+    if error is not None:
+        raise error
+    return results
+
+
+class VoucherDetailsMemo:
+    """``getVoucherDetails`` results shared by the reads of one request."""
+
+    def __init__(self, fetch):
+        # fetch(voucher_ids) -> results in the same order, errors in their slots
+        self.fetch = fetch
+        self._results = {}
+        self._lock = threading.Lock()
+        self.fetched = 0
+        self.shared = 0
+
+    def get_many(self, voucher_ids):
+        owned = []
+        futures = []
+        with self._lock:
+            for voucher_id in voucher_ids:
+                future = self._results.get(voucher_id)
+                if future is None:
+                    future = self._results[voucher_id] = Future()
+                    owned.append((voucher_id, future))
+                else:
+                    self.shared += 1
+                futures.append(future)
+            self.fetched += len(owned)
+        if owned:
+            try:
+                results = self.fetch([voucher_id for voucher_id, _ in owned])
+            except BaseException as e:
+                for _, future in owned:
+                    future.set_exception(e)
+                raise
+            for (_, future), result in zip(owned, results):
+                future.set_result(result)
+        return [future.result() for future in futures]
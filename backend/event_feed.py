@@ -0,0 +1,243 @@
+"""Server-sent event feed of the changes dashboards display.
+
+One ``EventFeed`` serves every connected client. Once ``attach``ed to the
+event indexer it publishes what each newly indexed range of blocks added,
+read from the index's database, so the logs are fetched only once. Without
+an indexer it reads the Voucher and BusinessRegistry logs itself on each new
+block, with the voucher and redemption details the deltas carry fetched in
+one batch. Either way each new block also brings one batched ``balanceOf``
+for the customers that are connected. Each change is queued only for the
+subscribers it concerns. Nothing is read while nobody is connected.
+"""
+import itertools
+import json
+import queue
+import threading
+
+from eth_utils import event_abi_to_log_topic
+
+from contracts import redemption_dict, voucher_dict
+from rpc_batch import batch_call
+
+VOUCHER_EVENTS = ('VoucherCreated', 'VoucherStatusChanged', 'VoucherRedeemed')
+REGISTRY_EVENTS = ('BusinessRegistered', 'BusinessApproved')
+
+
+class Subscription:
+    """Events queued for one connected client."""
+
+    __slots__ = ('user', 'queue', 'overflowed')
+
+    def __init__(self, user, queue_size):
+        self.user = user
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.overflowed = False
+
+    def wants(self, roles, addresses):
+        return self.user['role'] in roles or (self.user['address'] is not None and self.user['address'] in addresses)
+
+    def put(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            # The client is too slow; it will be told to refetch instead
+            self.overflowed = True
+
+    def get(self, timeout):
+        """Next event, a resync marker after an overflow, or None on timeout."""
+        if self.overflowed:
+            self.overflowed = False
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            return (None, 'resync', {})
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+def format_sse(event):
+    event_id, event_type, data = event
+    lines = [f'event: {event_type}', f'data: {json.dumps(data)}']
+    if event_id is not None:
+        lines.insert(0, f'id: {event_id}')
+    return '\n'.join(lines) + '\n\n'
+
+
+class EventFeed:
+    """Turns new blocks into per-user event deltas."""
+
+    def __init__(self, w3, head, contracts, queue_size=256):
+        self.w3 = w3
+        self.head = head
+        self.contracts = contracts
+        self.queue_size = queue_size
+        self._subscriptions = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._subscribed = False
+        self._last_block = None
+        self._balances = {}
+        self._events = None
+        self._indexer = None
+
+    def attach(self, indexer):
+        """Publish voucher, redemption and business changes as ``indexer`` stores them."""
+        self._indexer = indexer
+        indexer.block_listeners.append(self._on_indexed)
+
+    def subscribe(self, user):
+        subscription = Subscription(user, self.queue_size)
+        with self._lock:
+            self._subscriptions.add(subscription)
+            if not self._subscribed:
+                self.head.subscribe(self._on_block)
+                self._subscribed = True
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions.discard(subscription)
+
+    def publish(self, event_type, data, roles=(), addresses=()):
+        """Queue an event for subscribers with one of ``roles`` or one of ``addresses``."""
+        event = (next(self._ids), event_type, data)
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        for subscription in subscriptions:
+            if subscription.wants(roles, addresses):
+                subscription.put(event)
+
+    def has_subscribers(self):
+        return bool(self._subscriptions)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'subscribers': len(self._subscriptions),
+                'last_block': self._last_block,
+                'source': 'index' if self._indexer is not None else 'logs'
+            }
+
+    def _on_block(self, block_number):
+        with self._lock:
+            subscriptions = list(self._subscriptions)
+        if self._last_block is not None and block_number <= self._last_block:
+            return
+        if not subscriptions:
+            self._balances = {}
+            self._last_block = block_number
+            return
+        if self._indexer is None:
+            from_block = block_number if self._last_block is None else self._last_block + 1
+            self._publish_logs(from_block, block_number)
+        # The logs are out, so a failed balance read must not publish them again
+        self._last_block = block_number
+        self._publish_balances(subscriptions, block_number)
+
+    def _on_indexed(self, since, until):
+        # The backfill before the index first catches up is history, not news
+        if not self._subscriptions or not self._indexer.is_ready():
+            return
+        indexer = self._indexer
+        created = [row['id'] for row in indexer.vouchers_between(since, until)]
+        changes = indexer.status_changes_between(since, until)
+        voucher_ids = sorted(set(created) | {row['voucher_id'] for row in changes})
+        vouchers = {voucher['id']: voucher for voucher in indexer.vouchers(voucher_ids)} if voucher_ids else {}
+        for voucher_id in created:
+            voucher = vouchers[voucher_id]
+            self.publish('voucher_created', voucher, roles=('customer',), addresses=(voucher['businessAddress'],))
+        for row in changes:
+            voucher = dict(vouchers[row['voucher_id']], isActive=bool(row['is_active']))
+            self.publish('voucher_status_changed', voucher, roles=('customer',),
+                         addresses=(voucher['businessAddress'],))
+        for redemption in indexer.redemption_details_between(since, until):
+            customer = redemption.pop('customerAddress')
+            self.publish('voucher_redeemed', redemption, addresses=(customer, redemption['businessAddress']))
+        for row in indexer.businesses_between(since, until):
+            self.publish('business_registered', {'address': row['address'], 'name': row['name']},
+                         roles=('admin',), addresses=(row['address'],))
+        for address in indexer.approvals_between(since, until):
+            self.publish('business_approved', {'address': address}, roles=('admin',), addresses=(address,))
+
+    def _event_map(self):
+        if self._events is None:
+            voucher, registry = self.contracts.voucher, self.contracts.registry
+            if voucher is None or registry is None:
+                return None
+            self._events = {}
+            for contract, names in ((voucher, VOUCHER_EVENTS), (registry, REGISTRY_EVENTS)):
+                for name in names:
+                    event = contract.events[name]()
+                    self._events[event_abi_to_log_topic(event.abi)] = (name, event)
+        return self._events
+
+    def _publish_logs(self, from_block, to_block):
+        events = self._event_map()
+        if events is None:
+            return
+        voucher = self.contracts.voucher
+        logs = self.w3.eth.get_logs({
+            'fromBlock': from_block,
+            'toBlock': to_block,
+            'address': [voucher.address, self.contracts.registry.address]
+        })
+        decoded = []
+        for log in logs:
+            if log['topics'] and bytes(log['topics'][0]) in events:
+                name, event = events[bytes(log['topics'][0])]
+                decoded.append((name, event.processLog(log)['args']))
+        if not decoded:
+            return
+
+        # Details the deltas carry, read once for the whole range
+        voucher_ids = sorted({args['id'] for name, args in decoded if name in ('VoucherCreated', 'VoucherStatusChanged')} |
+                             {args['voucherId'] for name, args in decoded if name == 'VoucherRedeemed'})
+        redemption_ids = sorted({args['redemptionId'] for name, args in decoded if name == 'VoucherRedeemed'})
+        results = batch_call(self.w3, [voucher.functions.getVoucherDetails(i) for i in voucher_ids] +
+                             [voucher.functions.getRedemptionDetails(i) for i in redemption_ids],
+                             block_identifier=to_block)
+        vouchers = dict(zip(voucher_ids, results[:len(voucher_ids)]))
+        redemptions = dict(zip(redemption_ids, results[len(voucher_ids):]))
+
+        for name, args in decoded:
+            if name in ('VoucherCreated', 'VoucherStatusChanged'):
+                details = vouchers.get(args['id'])
+                if isinstance(details, Exception):
+                    continue
+                data = voucher_dict(args['id'], details)
+                if name == 'VoucherStatusChanged':
+                    data['isActive'] = args['isActive']
+                event_type = 'voucher_created' if name == 'VoucherCreated' else 'voucher_status_changed'
+                self.publish(event_type, data, roles=('customer',), addresses=(details[3],))
+            elif name == 'VoucherRedeemed':
+                details = redemptions.get(args['redemptionId'])
+                voucher_details = vouchers.get(args['voucherId'])
+                if isinstance(details, Exception) or isinstance(voucher_details, Exception):
+                    continue
+                self.publish('voucher_redeemed', redemption_dict(args['redemptionId'], details, voucher_details),
+                             addresses=(args['customer'], voucher_details[3]))
+            elif name == 'BusinessRegistered':
+                self.publish('business_registered', {'address': args['businessAddress'], 'name': args['name']},
+                             roles=('admin',), addresses=(args['businessAddress'],))
+            elif name == 'BusinessApproved':
+                self.publish('business_approved', {'address': args['businessAddress']},
+                             roles=('admin',), addresses=(args['businessAddress'],))
+
+    def _publish_balances(self, subscriptions, block_number):
+        token = self.contracts.token
+        addresses = sorted({subscription.user['address'] for subscription in subscriptions
+                            if subscription.user['role'] == 'customer' and subscription.user['address']})
+        if token is None or not addresses:
+            self._balances = {}
+            return
+        results = batch_call(self.w3, [token.functions.balanceOf(address) for address in addresses],
+                             block_identifier=block_number)
+        balances = {}
+        for address, balance in zip(addresses, results):
+            if isinstance(balance, Exception):
+                continue
+            balances[address] = balance
+            if self._balances.get(address) != balance:
+                self.publish('balance', {'address': address, 'balance': balance}, addresses=(address,))
+        self._balances = balances
@@ -0,0 +1,167 @@
+"""Streaming redemption and voucher exports for accounting reconciliation.
+
+A redemption export resolves its date range to a block range, then walks
+``VoucherRedeemed`` logs in ``EXPORT_CHUNK_BLOCKS``-block ``eth_getLogs``
+windows. Logs are enriched ``EXPORT_BATCH_SIZE`` at a time with one batched
+``getRedemptionDetails`` round trip, plus ``getVoucherDetails`` for vouchers
+not seen recently, and each batch is written out as CSV or NDJSON before the
+next is fetched. Memory stays bounded by one window of logs whatever the
+range.
+
+Every row carries a ``cursor``. Passing the last one received back as
+``?cursor=`` resumes right after that row, over the block range the export
+started with, so a multi-million-row export survives a dropped connection.
+"""
+import csv
+import io
+import json
+import os
+from collections import OrderedDict
+
+from eth_utils import encode_hex, event_abi_to_log_topic
+
+from contracts import redemption_dict, voucher_dict
+from rpc_batch import batch_call, raise_errors
+
+EXPORT_CHUNK_BLOCKS = int(os.getenv('EXPORT_CHUNK_BLOCKS', '2000'))
+EXPORT_BATCH_SIZE = int(os.getenv('EXPORT_BATCH_SIZE', '500'))
+
+# Voucher details kept while exporting, since most redemptions share a few vouchers
+VOUCHER_CACHE_SIZE = 10000
+
+EXPORT_FORMATS = ('csv', 'ndjson')
+
+REDEMPTION_FIELDS = ('id', 'voucherId', 'voucherTitle', 'voucherDescription', 'pointCost', 'businessAddress',
+                     'customerAddress', 'redemptionTime', 'isRedeemed', 'blockNumber', 'transactionHash', 'cursor')
+VOUCHER_FIELDS = ('id', 'title', 'description', 'pointCost', 'businessAddress', 'isActive', 'cursor')
+
+
+def encode_cursor(end_block, block_number, log_index):
+    return f'{end_block}.{block_number}.{log_index}'
+
+
+def decode_cursor(cursor):
+    """``(end_block, (block_number, log_index))`` from a redemption cursor; raises ValueError."""
+    parts = cursor.split('.')
+    if len(parts) != 3:
+        raise ValueError('malformed cursor')
+    end_block, block_number, log_index = (int(part) for part in parts)
+    return end_block, (block_number, log_index)
+
+
+def first_block_at(w3, timestamp, head_number):
+    """Lowest block number with a timestamp of at least ``timestamp``; ``head_number + 1`` if none."""
+    lo, hi = 0, head_number + 1
+    while lo < hi:
+        mid = (lo + hi) // 2
+        if w3.eth.get_block(mid)['timestamp'] >= timestamp:
+            hi = mid
+        else:
+            lo = mid + 1
+    return lo
+
+
+class RedemptionExport:
+    """Redemptions made from ``since`` (inclusive) to ``until`` (exclusive), unix seconds."""
+
+    def __init__(self, w3, voucher_contract, since=None, until=None, cursor=None):
+        self.w3 = w3
+        self.voucher_contract = voucher_contract
+        self.since = since
+        self.until = until
+        self.after = None
+        if cursor is not None:
+            self.end_block, self.after = decode_cursor(cursor)
+            self.start_block = self.after[0]
+            return
+        head_number = w3.eth.block_number
+        self.start_block = first_block_at(w3, since, head_number) if since is not None else 0
+        self.end_block = first_block_at(w3, until, head_number) - 1 if until is not None else head_number
+
+    def logs(self):
+        """Decoded ``VoucherRedeemed`` events of the range, after the cursor."""
+        event = self.voucher_contract.events.VoucherRedeemed()
+        topic = encode_hex(event_abi_to_log_topic(event.abi))
+        for start in range(self.start_block, self.end_block + 1, EXPORT_CHUNK_BLOCKS):
+            logs = self.w3.eth.get_logs({
+                'fromBlock': start,
+                'toBlock': min(start + EXPORT_CHUNK_BLOCKS - 1, self.end_block),
+                'address': self.voucher_contract.address,
+                'topics': [topic],
+            })
+            for log in logs:
+                if self.after is not None and (log['blockNumber'], log['logIndex']) <= self.after:
+                    continue
+                yield event.processLog(log)
+
+    def batches(self):
+        """Lists of up to ``EXPORT_BATCH_SIZE`` export rows, in log order."""
+        vouchers = OrderedDict()
+        batch = []
+        for event in self.logs():
+            batch.append(event)
+            if len(batch) == EXPORT_BATCH_SIZE:
+                yield self._rows(batch, vouchers)
+                batch = []
+        if batch:
+            yield self._rows(batch, vouchers)
+
+    def _rows(self, events, vouchers):
+        functions = self.voucher_contract.functions
+        all_details = raise_errors(batch_call(self.w3, [
+            functions.getRedemptionDetails(event['args']['redemptionId']) for event in events
+        ]))
+        missing = sorted({details[0] for details in all_details} - vouchers.keys())
+        if missing:
+            vouchers.update(zip(missing, raise_errors(batch_call(self.w3, [
+                functions.getVoucherDetails(voucher_id) for voucher_id in missing
+            ]))))
+            while len(vouchers) > VOUCHER_CACHE_SIZE:
+                vouchers.popitem(last=False)
+        rows = []
+        for event, details in zip(events, all_details):
+            # Block timestamps are whole seconds, so the range's edge blocks may hold a few rows outside it
+            if (self.since is not None and details[2] < self.since) or \
+                    (self.until is not None and details[2] >= self.until):
+                continue
+            row = redemption_dict(event['args']['redemptionId'], details, vouchers[details[0]])
+            row.update(
+                customerAddress=details[1],
+                blockNumber=event['blockNumber'],
+                transactionHash=event['transactionHash'].hex(),
+                cursor=encode_cursor(self.end_block, event['blockNumber'], event['logIndex'])
+            )
+            rows.append(row)
+        return rows
+
+
+def voucher_batches(w3, voucher_contract, cursor=None):
+    """Lists of voucher rows, active or not, after the voucher id ``cursor``; raises ValueError."""
+    after_id = int(cursor) if cursor is not None else 0
+    functions = voucher_contract.functions
+    next_voucher_id = functions.nextVoucherId().call()
+    for start in range(after_id + 1, next_voucher_id, EXPORT_BATCH_SIZE):
+        voucher_ids = range(start, min(start + EXPORT_BATCH_SIZE, next_voucher_id))
+        all_details = raise_errors(batch_call(w3, [functions.getVoucherDetails(i) for i in voucher_ids]))
+        yield [dict(voucher_dict(i, details), cursor=str(i)) for i, details in zip(voucher_ids, all_details)]
+
+
+def write_csv(batches, fields, header=True):
+    """CSV text for each batch of rows, the header row first when ``header`` is set."""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fields, extrasaction='ignore', lineterminator='\n')
+    if header:
+        writer.writeheader()
+    for rows in batches:
+        writer.writerows(rows)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def write_ndjson(batches):
+    for rows in batches:
+        if rows:
+            yield ''.join(json.dumps(row) + '\n' for row in rows)
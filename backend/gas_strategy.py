@@ -0,0 +1,168 @@
+"""Gas limits learned from receipts, and EIP-1559 fees read once per block.
+
+Left to itself web3 runs ``eth_estimateGas`` plus an ``eth_getBlockByNumber``
+for every transaction and reserves the estimate plus 100000 gas. Instead each
+function's gas limit is learned from its receipts: the largest limit one of
+its transactions succeeded with, or the largest ``gasUsed`` seen padded by a
+safety margin if that is more. ``gasUsed`` is net of refunds, so on its own
+it can fall short of what execution needs before them; the first limit comes
+from a live estimate, which does not. A function is estimated live only
+until its first receipt, and again after a transaction of it fails. What a call costs can depend on contract
+state (minting to a new holder writes a fresh storage slot and costs far more
+than minting to an existing one), so callers name such cases with a
+``variant`` and each variant learns its own limit. A transaction that runs
+out of gas anyway is estimated live next time, never below the limit it was
+sent with plus the margin, and its receipt is reported as out of gas so
+callers can send it again.
+
+Given ``preflight``, the transaction is also checked before it is sent:
+the live estimate already simulates it, so its revert becomes a
+``PreflightError``, and only a transaction sent with a learned limit costs a
+separate ``dry_run``. Either way a write simulates its call once.
+
+Fees follow the usual EIP-1559 policy: a priority fee (configured, or the
+node's suggestion) on top of the head block's base fee times a multiplier
+that absorbs a few full blocks of base-fee growth. On chains without a base
+fee the node picks the gas price, as before.
+"""
+import threading
+from collections import OrderedDict
+
+from chain_meta import dry_run, preflight_error
+
+DEFAULT_PRIORITY_FEE = 10 ** 9  # 1 gwei, for nodes without eth_maxPriorityFeePerGas
+
+# Transactions waiting for a receipt to learn from
+MAX_PENDING = 10000
+
+OUT_OF_GAS = 'Transaction ran out of gas'
+
+
+def _hex(value):
+    return value if isinstance(value, str) else '0x' + bytes(value).hex()
+
+
+class GasStrategy:
+    """Fills in ``gas`` and fee fields for outgoing contract transactions."""
+
+    def __init__(self, w3, head, margin=1.3, base_fee_multiplier=2, priority_fee=None):
+        self.w3 = w3
+        self.head = head
+        self.margin = margin
+        self.base_fee_multiplier = base_fee_multiplier
+        self.priority_fee = priority_fee
+        # key -> gas limit learned from receipts
+        self._limits = {}
+        # key -> lowest gas limit to send with after running out of gas
+        self._floors = {}
+        self._pending = OrderedDict()
+        self._fees = (None, None)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.estimates = 0
+        self.out_of_gas = 0
+        self.gas_reserved = 0
+        self.gas_used = 0
+
+    @staticmethod
+    def key(contract_function, variant=None):
+        """The called contract and function selector, and the caller's ``variant``."""
+        data = _hex(contract_function._encode_transaction_data())
+        return (contract_function.address.lower(), data[:10], variant)
+
+    def prepare(self, contract_function, transaction, variant=None, preflight=False):
+        """``transaction`` with gas and fees filled in, for ``contract_function.transact``.
+
+        With ``preflight``, raises ``PreflightError`` if the transaction would revert.
+        """
+        transaction = dict(transaction)
+        limit = transaction.get('gas')
+        if limit is None:
+            key = self.key(contract_function, variant)
+            limit = self._limits.get(key)
+            if limit is not None:
+                self.hits += 1
+            else:
+                self.estimates += 1
+                try:
+                    estimate = contract_function.estimateGas({
+                        name: transaction[name] for name in ('from', 'value') if name in transaction
+                    })
+                except ValueError as e:
+                    error = preflight_error(e) if preflight else None
+                    if error is None:
+                        raise
+                    raise error
+                limit = max(int(estimate * self.margin), self._floors.get(key, 0))
+                preflight = False
+            transaction['gas'] = limit
+        if preflight:
+            dry_run(contract_function, transaction['from'])
+        if 'gasPrice' not in transaction and 'maxFeePerGas' not in transaction:
+            transaction.update(self.fees())
+        return transaction
+
+    def sent(self, tx_hash, contract_function, transaction, variant=None):
+        """Remember which function ``tx_hash`` called, to learn from its receipt."""
+        with self._lock:
+            self._pending[_hex(tx_hash)] = (self.key(contract_function, variant), transaction['gas'])
+            while len(self._pending) > MAX_PENDING:
+                self._pending.popitem(last=False)
+
+    def observe(self, receipt):
+        """Learn from a receipt of a transaction ``sent`` through this strategy.
+
+        Returns ``OUT_OF_GAS`` if the transaction failed for want of gas.
+        """
+        with self._lock:
+            entry = self._pending.pop(_hex(receipt.transactionHash), None)
+            if entry is None:
+                return None
+            key, limit = entry
+            self.gas_reserved += limit
+            self.gas_used += receipt.gasUsed
+            if receipt.status != 1:
+                # The learned limit may no longer fit, so the next transaction is estimated live
+                self._limits.pop(key, None)
+                if receipt.gasUsed >= limit:
+                    self.out_of_gas += 1
+                    self._floors[key] = max(self._floors.get(key, 0), int(limit * self.margin))
+                    return OUT_OF_GAS
+                return None
+            self._limits[key] = max(self._limits.get(key, 0), limit, int(receipt.gasUsed * self.margin))
+            return None
+
+    def fees(self):
+        """EIP-1559 fee fields for the head block, or {} on chains without a base fee."""
+        block_number = self.head.block_number
+        cached_block, fees = self._fees
+        if fees is not None and cached_block == block_number:
+            return fees
+        block = self.w3.eth.get_block(block_number if block_number is not None else 'latest')
+        base_fee = block.get('baseFeePerGas')
+        if base_fee is None:
+            fees = {}
+        else:
+            priority_fee = self.priority_fee
+            if priority_fee is None:
+                try:
+                    priority_fee = self.w3.eth.max_priority_fee
+                except Exception:
+                    priority_fee = DEFAULT_PRIORITY_FEE
+            fees = {
+                'maxPriorityFeePerGas': priority_fee,
+                'maxFeePerGas': base_fee * self.base_fee_multiplier + priority_fee
+            }
+        self._fees = (block.number, fees)
+        return fees
+
+    def stats(self):
+        return {
+            'functions': len(self._limits),
+            'hits': self.hits,
+            'estimates': self.estimates,
+            'out_of_gas': self.out_of_gas,
+            'gas_reserved': self.gas_reserved,
+            'gas_used': self.gas_used,
+            'fees': self._fees[1]
+        }
@@ -0,0 +1,75 @@
+"""Conditional GET and compression for read responses.
+
+A read route names the chain state its body was built from, such as an
+indexed change sequence or the head block number, and ``conditional`` turns
+that into a weak ETag before anything else is computed. A client that sends
+the tag back in ``If-None-Match`` gets a bodiless 304 without the route
+touching the index or the node. ``compress_responses`` gzips (or, with the
+``brotli`` package installed, brotli-encodes) finished bodies above a size
+threshold for clients that accept it. Streamed responses are left alone.
+"""
+import gzip
+import hashlib
+
+from flask import make_response, request
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson', 'text/')
+
+
+def etag(*parts):
+    """A short opaque tag for ``parts``, which identify the state a body was built from."""
+    return hashlib.blake2b(repr(parts).encode(), digest_size=12).hexdigest()
+
+
+def conditional(tag, build):
+    """``build()``'s response tagged with ``tag``, or a 304 when the client already holds it.
+
+    ``tag`` of None means the state could not be named, so the response is built as usual.
+    """
+    if tag is None:
+        return build()
+    if request.if_none_match.contains_weak(tag):
+        response = make_response('', 304)
+    else:
+        response = make_response(build())
+        if response.status_code != 200:
+            return response
+    response.set_etag(tag, weak=True)
+    # Stored, but checked with the server before every reuse
+    response.headers['Cache-Control'] = 'private, no-cache' if 'Authorization' in request.headers else 'no-cache'
+    response.vary.add('Authorization')
+    return response
+
+
+def _encode(data, encoding, level):
+    if encoding == 'br':
+        # Brotli quality runs 0-11 rather than 1-9; scale so the setting means the same effort
+        return brotli.compress(data, quality=min(11, round(level * 11 / 9)))
+    return gzip.compress(data, compresslevel=level)
+
+
+def compress_responses(app, min_size=1024, level=5):
+    """Compress response bodies of at least ``min_size`` bytes for clients that accept it."""
+    encodings = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+    @app.after_request
+    def compress(response):
+        if response.status_code != 200 or response.direct_passthrough or response.is_streamed:
+            return response
+        response.vary.add('Accept-Encoding')
+        if 'Content-Encoding' in response.headers or not response.mimetype.startswith(COMPRESSIBLE_TYPES):
+            return response
+        if (response.content_length or 0) < min_size:
+            return response
+        accepted = request.accept_encodings
+        encoding = max(encodings, key=lambda name: (accepted.quality(name), name == encodings[0]))
+        if not accepted.quality(encoding):
+            return response
+        response.set_data(_encode(response.get_data(), encoding, level))
+        response.headers['Content-Encoding'] = encoding
+        return response
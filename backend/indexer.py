@@ -0,0 +1,663 @@
+"""Background indexer for Voucher and BusinessRegistry event logs.
+
+Backfills the events the read endpoints need into a local SQLite database in
+chunked ``eth_getLogs`` ranges, then follows the chain head. Block hashes of
+indexed ranges are remembered so a reorg rolls the index back to the fork
+point and re-indexes from there.
+
+With several worker processes sharing one database, only the holder of
+``lease`` syncs; the others follow, picking up the last indexed block from
+the database and running their listeners for what changed.
+
+``markAsRedeemed`` emits no event. Its receipts record fulfilments as they
+happen, and the chain's ``isRedeemed`` covers the rest: it is read for every
+redemption as it is indexed, and each new block re-checks a batch of the
+redemptions still pending. That catches ones fulfilled before the index
+existed, while it was down, or by another client.
+
+``version(scope)`` names the state behind one read route: a change sequence
+number bumped whenever the voucher catalog, one business's vouchers, one
+customer's redemptions or one voucher changes, under an epoch that is
+replaced when a rollback or reset discards changes.
+"""
+import os
+import secrets
+import sqlite3
+import threading
+import time
+
+from eth_utils import event_abi_to_log_topic
+from web3.exceptions import BlockNotFound
+
+import tracing
+from rpc_batch import batch_call, batch_request, raise_errors
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS blocks (
+    number INTEGER PRIMARY KEY,
+    hash TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS vouchers (
+    id INTEGER PRIMARY KEY,
+    business TEXT NOT NULL,
+    title TEXT NOT NULL,
+    description TEXT NOT NULL DEFAULT '',
+    point_cost INTEGER NOT NULL,
+    is_active INTEGER NOT NULL DEFAULT 1,
+    block_number INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vouchers_business ON vouchers (business, id);
+CREATE INDEX IF NOT EXISTS vouchers_active ON vouchers (is_active, id);
+CREATE TABLE IF NOT EXISTS voucher_status (
+    voucher_id INTEGER NOT NULL,
+    is_active INTEGER NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE INDEX IF NOT EXISTS voucher_status_voucher ON voucher_status (voucher_id);
+CREATE TABLE IF NOT EXISTS redemptions (
+    id INTEGER PRIMARY KEY,
+    voucher_id INTEGER NOT NULL,
+    customer TEXT NOT NULL,
+    redemption_time INTEGER NOT NULL,
+    block_number INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS redemptions_customer ON redemptions (customer, id);
+CREATE TABLE IF NOT EXISTS fulfilments (
+    redemption_id INTEGER PRIMARY KEY,
+    block_number INTEGER NOT NULL,
+    seq INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS businesses (
+    address TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    registration_time INTEGER NOT NULL,
+    is_approved INTEGER NOT NULL DEFAULT 0,
+    block_number INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS business_approvals (
+    address TEXT NOT NULL,
+    block_number INTEGER NOT NULL,
+    log_index INTEGER NOT NULL,
+    PRIMARY KEY (block_number, log_index)
+);
+CREATE TABLE IF NOT EXISTS versions (
+    scope TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL,
+    block_number INTEGER NOT NULL
+);
+"""
+
+REDEMPTIONS_QUERY = """
+    SELECT r.id, r.voucher_id, r.customer, r.redemption_time, f.redemption_id IS NOT NULL AS is_redeemed,
+           v.title, v.description, v.point_cost, v.business
+    FROM redemptions r JOIN vouchers v ON v.id = r.voucher_id
+    LEFT JOIN fulfilments f ON f.redemption_id = r.id
+"""
+
+# Number of block hashes kept for reorg detection
+REORG_WINDOW = 128
+
+
+class EventIndexer:
+    """Keeps a SQLite copy of voucher, redemption and business events."""
+
+    def __init__(self, w3, voucher_contract, registry_contract, db_path='index.db',
+                 start_block=0, chunk_size=2000, poll_interval=2.0, follow_interval=0.25,
+                 fulfilment_refresh=500):
+        self.w3 = w3
+        self.voucher_contract = voucher_contract
+        self.registry_contract = registry_contract
+        self.db_path = db_path
+        self.start_block = start_block
+        self.chunk_size = chunk_size
+        self.poll_interval = poll_interval
+        self.follow_interval = follow_interval
+        # Pending redemptions re-checked on chain per new block
+        self.fulfilment_refresh = fulfilment_refresh
+        self._refresh_after = 0
+        # Returns whether this process may write the index; None means it always may
+        self.lease = None
+        self._head = None
+
+        self._local = threading.local()
+        self._cond = threading.Condition()
+        self._wake = threading.Event()
+        self._thread = None
+        self._ready = False
+        self.last_block = start_block - 1
+        # Called with each newly approved business address once its block is indexed
+        self.approval_listeners = []
+        # Called with the voucher dict of each created or toggled voucher once its block is indexed
+        self.voucher_listeners = []
+        # Called with (since, until) once the blocks after since up to until are indexed
+        self.block_listeners = []
+        # Called after a reorg rolled the index back
+        self.rollback_listeners = []
+
+        self._handlers = {}
+        for contract, name, handler in (
+            (voucher_contract, 'VoucherCreated', self._on_voucher_created),
+            (voucher_contract, 'VoucherStatusChanged', self._on_voucher_status_changed),
+            (voucher_contract, 'VoucherRedeemed', self._on_voucher_redeemed),
+            (registry_contract, 'BusinessRegistered', self._on_business_registered),
+            (registry_contract, 'BusinessApproved', self._on_business_approved),
+        ):
+            event = contract.events[name]()
+            self._handlers[event_abi_to_log_topic(event.abi)] = (event, handler)
+
+        self._init_db()
+
+    # Storage
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    def _init_db(self):
+        conn = self._conn()
+        conn.executescript(SCHEMA)
+        if 'seq' not in {row['name'] for row in conn.execute("PRAGMA table_info(fulfilments)")}:
+            # Index databases from before fulfilments were numbered
+            conn.execute("ALTER TABLE fulfilments ADD COLUMN seq INTEGER NOT NULL DEFAULT 0")
+        contracts = f"{self.voucher_contract.address},{self.registry_contract.address}"
+        row = conn.execute("SELECT value FROM meta WHERE key = 'contracts'").fetchone()
+        if row and row['value'] != contracts:
+            print(f"Indexer: contract addresses changed, resetting index at {self.db_path}")
+            with conn:
+                for table in ('blocks', 'vouchers', 'voucher_status', 'redemptions', 'fulfilments',
+                              'businesses', 'business_approvals', 'versions', 'meta'):
+                    conn.execute(f"DELETE FROM {table}")
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('contracts', ?)", (contracts,))
+            if conn.execute("SELECT 1 FROM meta WHERE key = 'epoch'").fetchone() is None:
+                self._new_epoch(conn)
+        row = conn.execute("SELECT value FROM meta WHERE key = 'last_block'").fetchone()
+        if row:
+            self.last_block = int(row['value'])
+
+    # Lifecycle
+
+    def start(self, head=None):
+        """Start syncing in the background, woken early by ``head`` on new blocks."""
+        if self._thread is None:
+            self._head = head
+            self._thread = threading.Thread(target=self._run, name='event-indexer', daemon=True)
+            self._thread.start()
+            if head is not None:
+                head.subscribe(lambda block_number: self._wake.set())
+        return self
+
+    def is_ready(self):
+        """True once the index has caught up with the chain head at least once."""
+        return self._ready
+
+    def wait_for_block(self, block_number, timeout=5.0):
+        """Ask the indexer to catch up to ``block_number`` and wait until it has."""
+        deadline = time.time() + timeout
+        self._wake.set()
+        with self._cond, tracing.span('index.wait', block=block_number):
+            while self.last_block < block_number:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+        return True
+
+    def _leading(self):
+        return self.lease is None or self.lease()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            interval = self.poll_interval
+            try:
+                if self._leading():
+                    if self.lease is not None:
+                        # Another process may have indexed further since this one last looked
+                        self.follow_once()
+                    self.sync_once()
+                else:
+                    self.follow_once()
+                    interval = self.follow_interval
+            except Exception as e:
+                print(f"Indexer: error while syncing: {e}")
+            self._wake.wait(interval)
+
+    # Syncing
+
+    def sync_once(self):
+        head = self.w3.eth.get_block('latest')
+        head_number = head['number']
+        head_hash = head['hash'].hex()
+
+        if head_number == self.last_block and self._stored_hash(head_number) == head_hash:
+            self._mark_ready()
+            return
+        if self.last_block >= self.start_block:
+            self._handle_reorg()
+
+        start = self.last_block + 1
+        while start <= head_number:
+            end = min(start + self.chunk_size - 1, head_number)
+            logs = self.w3.eth.get_logs({
+                'fromBlock': start,
+                'toBlock': end,
+                'address': [self.voucher_contract.address, self.registry_contract.address],
+            })
+            end_hash = head_hash if end == head_number else self.w3.eth.get_block(end)['hash'].hex()
+            self._apply(logs, end, end_hash)
+            start = end + 1
+            if start <= head_number and not self._leading():
+                # Lost the lease during a long backfill; the new holder carries on from here
+                return
+
+        self._mark_ready()
+        self._refresh_fulfilments()
+
+    def _refresh_fulfilments(self):
+        """Look up the next batch of pending redemptions on chain and record those since fulfilled."""
+        if not self.fulfilment_refresh:
+            return
+        conn = self._conn()
+        redemption_ids = [row['id'] for row in conn.execute("""
+            SELECT r.id FROM redemptions r LEFT JOIN fulfilments f ON f.redemption_id = r.id
+            WHERE f.redemption_id IS NULL AND r.id > ? ORDER BY r.id LIMIT ?
+        """, (self._refresh_after, self.fulfilment_refresh)).fetchall()]
+        # Start over from the lowest pending id once the end is reached
+        self._refresh_after = redemption_ids[-1] if len(redemption_ids) == self.fulfilment_refresh else 0
+        fulfilled = self._fulfilled(redemption_ids)
+        if fulfilled:
+            with conn:
+                for redemption_id in fulfilled:
+                    self._record_fulfilment(conn, redemption_id, self.last_block)
+
+    def follow_once(self):
+        """Catch up with what the process holding the lease has committed."""
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'last_block'").fetchone()
+        stored = int(row['value']) if row else self.start_block - 1
+        previous = self.last_block
+        if stored < previous:
+            self._advance(stored)
+            for listener in self.rollback_listeners:
+                listener()
+        elif stored > previous:
+            self._advance(stored)
+            self._notify_since(previous)
+        head_block = self._head.block_number if self._head is not None else None
+        if self._head is None or (head_block is not None and stored >= head_block):
+            self._mark_ready()
+
+    def _notify_since(self, block_number):
+        conn = self._conn()
+        if self.approval_listeners:
+            for row in conn.execute("SELECT address FROM business_approvals WHERE block_number > ?",
+                                    (block_number,)).fetchall():
+                for listener in self.approval_listeners:
+                    listener(row['address'])
+        if self.voucher_listeners:
+            voucher_ids = [row['id'] for row in conn.execute("""
+                SELECT id FROM vouchers WHERE block_number > ?
+                UNION SELECT voucher_id FROM voucher_status WHERE block_number > ?
+            """, (block_number, block_number)).fetchall()]
+            if voucher_ids:
+                for voucher in self.vouchers(voucher_ids):
+                    for listener in self.voucher_listeners:
+                        listener(voucher)
+        for listener in self.block_listeners:
+            listener(block_number, self.last_block)
+
+    def _mark_ready(self):
+        if not self._ready:
+            print(f"Indexer: caught up with chain head at block {self.last_block}")
+        self._ready = True
+
+    def _stored_hash(self, number):
+        row = self._conn().execute("SELECT hash FROM blocks WHERE number = ?", (number,)).fetchone()
+        return row['hash'] if row else None
+
+    def _handle_reorg(self):
+        conn = self._conn()
+        stored = conn.execute("SELECT number, hash FROM blocks ORDER BY number DESC").fetchall()
+        for row in stored:
+            try:
+                chain_hash = self.w3.eth.get_block(row['number'])['hash'].hex()
+            except BlockNotFound:
+                chain_hash = None
+            if chain_hash == row['hash']:
+                if row['number'] < self.last_block:
+                    self._rollback(row['number'])
+                return
+            print(f"Indexer: block {row['number']} was reorged out")
+        self._rollback(self.start_block - 1)
+
+    def _rollback(self, block_number):
+        print(f"Indexer: rolling back index to block {block_number}")
+        conn = self._conn()
+        with conn:
+            for table in ('blocks', 'vouchers', 'voucher_status', 'redemptions', 'fulfilments',
+                          'businesses', 'business_approvals', 'versions'):
+                column = 'number' if table == 'blocks' else 'block_number'
+                conn.execute(f"DELETE FROM {table} WHERE {column} > ?", (block_number,))
+            # Recompute derived state from the events that survived
+            conn.execute("""
+                UPDATE vouchers SET is_active = COALESCE((
+                    SELECT s.is_active FROM voucher_status s WHERE s.voucher_id = vouchers.id
+                    ORDER BY s.block_number DESC, s.log_index DESC LIMIT 1), 1)
+            """)
+            conn.execute("""
+                UPDATE businesses SET is_approved = EXISTS (
+                    SELECT 1 FROM business_approvals a WHERE a.address = businesses.address)
+            """)
+            self._set_last_block(conn, block_number)
+            # Blocks after the fork point will be indexed again with other contents
+            self._new_epoch(conn)
+        self._advance(block_number)
+        for listener in self.rollback_listeners:
+            listener()
+
+    def _set_last_block(self, conn, block_number):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('last_block', ?)", (str(block_number),))
+
+    @staticmethod
+    def _new_epoch(conn):
+        conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('epoch', ?)", (secrets.token_hex(4),))
+
+    @staticmethod
+    def _touch(conn, block_number, *scopes):
+        # A global counter rather than the block: fulfilments arrive from receipts, possibly out of order
+        conn.execute("INSERT INTO meta (key, value) VALUES ('seq', 1) "
+                     "ON CONFLICT (key) DO UPDATE SET value = value + 1")
+        seq = int(conn.execute("SELECT value FROM meta WHERE key = 'seq'").fetchone()['value'])
+        conn.executemany("INSERT OR REPLACE INTO versions (scope, seq, block_number) VALUES (?, ?, ?)",
+                         [(scope, seq, block_number) for scope in scopes])
+        return seq
+
+    def _advance(self, block_number):
+        # Only called once the transaction is committed, so waiters see the rows
+        with self._cond:
+            self.last_block = block_number
+            self._cond.notify_all()
+
+    def _apply(self, logs, end_block, end_hash):
+        previous = self.last_block
+        decoded = []
+        for log in logs:
+            if not log['topics']:
+                continue
+            entry = self._handlers.get(bytes(log['topics'][0]))
+            if entry is None:
+                continue
+            event, handler = entry
+            decoded.append((handler, event.processLog(log)))
+
+        self._timestamps = self.block_timestamps(
+            {e['blockNumber'] for handler, e in decoded if handler == self._on_voucher_redeemed})
+        self._details = self._voucher_details(
+            [e['args']['id'] for handler, e in decoded if handler == self._on_voucher_created])
+        fulfilled = self._fulfilled(
+            [e['args']['redemptionId'] for handler, e in decoded if handler == self._on_voucher_redeemed])
+
+        conn = self._conn()
+        with conn:
+            for handler, event in decoded:
+                handler(conn, event)
+                conn.execute("INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)",
+                             (event['blockNumber'], event['blockHash'].hex()))
+            for redemption_id in fulfilled:
+                self._record_fulfilment(conn, redemption_id, end_block)
+            conn.execute("INSERT OR REPLACE INTO blocks (number, hash) VALUES (?, ?)", (end_block, end_hash))
+            conn.execute("""
+                DELETE FROM blocks WHERE number NOT IN (
+                    SELECT number FROM blocks ORDER BY number DESC LIMIT ?)
+            """, (REORG_WINDOW,))
+            self._set_last_block(conn, end_block)
+        self._advance(end_block)
+        for handler, event in decoded:
+            if handler == self._on_business_approved:
+                for listener in self.approval_listeners:
+                    listener(event['args']['businessAddress'])
+        voucher_ids = sorted({e['args']['id'] for handler, e in decoded
+                              if handler in (self._on_voucher_created, self._on_voucher_status_changed)})
+        if voucher_ids and self.voucher_listeners:
+            for voucher in self.vouchers(voucher_ids):
+                for listener in self.voucher_listeners:
+                    listener(voucher)
+        for listener in self.block_listeners:
+            listener(previous, end_block)
+
+    def _voucher_details(self, voucher_ids):
+        # Descriptions are not part of VoucherCreated, so they are read once per new voucher
+        details = {}
+        results = batch_call(self.w3, [
+            self.voucher_contract.functions.getVoucherDetails(voucher_id) for voucher_id in voucher_ids
+        ])
+        for voucher_id, result in zip(voucher_ids, results):
+            if isinstance(result, Exception):
+                print(f"Indexer: could not read details for voucher {voucher_id}: {result}")
+            else:
+                details[voucher_id] = result
+        return details
+
+    def _fulfilled(self, redemption_ids):
+        """The ``redemption_ids`` the chain reports as redeemed now."""
+        results = batch_call(self.w3, [
+            self.voucher_contract.functions.getRedemptionDetails(redemption_id) for redemption_id in redemption_ids
+        ])
+        fulfilled = []
+        for redemption_id, result in zip(redemption_ids, results):
+            if isinstance(result, Exception):
+                print(f"Indexer: could not read redemption {redemption_id}: {result}")
+            elif result[3]:  # isRedeemed
+                fulfilled.append(redemption_id)
+        return fulfilled
+
+    def block_timestamps(self, block_numbers):
+        block_numbers = sorted(block_numbers)
+        blocks = raise_errors(batch_request(self.w3, [
+            ('eth_getBlockByNumber', [hex(number), False]) for number in block_numbers
+        ]))
+        return {number: int(block['timestamp'], 16) for number, block in zip(block_numbers, blocks)}
+
+    # Event handlers
+
+    def _on_voucher_created(self, conn, event):
+        args = event['args']
+        details = self._details.get(args['id'])
+        conn.execute("""
+            INSERT OR REPLACE INTO vouchers
+                (id, business, title, description, point_cost, is_active, block_number)
+            VALUES (?, ?, ?, ?, ?, 1, ?)
+        """, (args['id'], args['business'], args['title'], details[1] if details else '',
+              args['pointCost'], event['blockNumber']))
+        self._touch(conn, event['blockNumber'], 'vouchers', f"business:{args['business']}", f"voucher:{args['id']}")
+
+    def _on_voucher_status_changed(self, conn, event):
+        args = event['args']
+        conn.execute("""
+            INSERT OR REPLACE INTO voucher_status (voucher_id, is_active, block_number, log_index)
+            VALUES (?, ?, ?, ?)
+        """, (args['id'], int(args['isActive']), event['blockNumber'], event['logIndex']))
+        conn.execute("UPDATE vouchers SET is_active = ? WHERE id = ?", (int(args['isActive']), args['id']))
+        row = conn.execute("SELECT business FROM vouchers WHERE id = ?", (args['id'],)).fetchone()
+        scopes = ('vouchers', f"voucher:{args['id']}") + ((f"business:{row['business']}",) if row else ())
+        self._touch(conn, event['blockNumber'], *scopes)
+
+    def _on_voucher_redeemed(self, conn, event):
+        args = event['args']
+        conn.execute("""
+            INSERT OR REPLACE INTO redemptions (id, voucher_id, customer, redemption_time, block_number)
+            VALUES (?, ?, ?, ?, ?)
+        """, (args['redemptionId'], args['voucherId'], args['customer'],
+              self._timestamps[event['blockNumber']], event['blockNumber']))
+        self._touch(conn, event['blockNumber'], f"customer:{args['customer']}")
+
+    def _on_business_registered(self, conn, event):
+        args = event['args']
+        conn.execute("""
+            INSERT OR REPLACE INTO businesses (address, name, registration_time, is_approved, block_number)
+            VALUES (?, ?, ?, COALESCE((SELECT is_approved FROM businesses WHERE address = ?), 0), ?)
+        """, (args['businessAddress'], args['name'], args['timestamp'], args['businessAddress'],
+              event['blockNumber']))
+
+    def _on_business_approved(self, conn, event):
+        args = event['args']
+        conn.execute("""
+            INSERT OR REPLACE INTO business_approvals (address, block_number, log_index)
+            VALUES (?, ?, ?)
+        """, (args['businessAddress'], event['blockNumber'], event['logIndex']))
+        conn.execute("UPDATE businesses SET is_approved = 1 WHERE address = ?", (args['businessAddress'],))
+
+    # Queries
+
+    def mark_redeemed(self, redemption_id, block_number):
+        # The receipt names the fulfilment's block, which replaces the one it was first seen at
+        conn = self._conn()
+        with conn:
+            self._record_fulfilment(conn, redemption_id, block_number, replace=True)
+
+    def _record_fulfilment(self, conn, redemption_id, block_number, replace=False):
+        # Without a receipt, block_number is where the index first saw the fulfilment, at or after it
+        row = conn.execute("SELECT customer FROM redemptions WHERE id = ?", (redemption_id,)).fetchone()
+        seq = self._touch(conn, block_number, *((f"customer:{row['customer']}",) if row is not None else ()))
+        verb = 'INSERT OR REPLACE' if replace else 'INSERT OR IGNORE'
+        conn.execute(f"{verb} INTO fulfilments (redemption_id, block_number, seq) VALUES (?, ?, ?)",
+                     (redemption_id, block_number, seq))
+
+    def version(self, scope):
+        """``(epoch, seq)``: the sequence number of the last change to ``scope``, 0 if none this epoch.
+
+        Scopes are ``vouchers`` (the catalog), ``business:<address>``,
+        ``customer:<address>`` and ``voucher:<id>``.
+        """
+        row = self._conn().execute("""
+            SELECT (SELECT value FROM meta WHERE key = 'epoch') AS epoch,
+                   (SELECT seq FROM versions WHERE scope = ?) AS seq
+        """, (scope,)).fetchone()
+        return row['epoch'], row['seq'] or 0
+
+    # Queries return rows with an id above ``after_id``, at most ``limit`` of them
+
+    def active_vouchers(self, after_id=0, limit=None):
+        rows = self._conn().execute(
+            "SELECT * FROM vouchers WHERE is_active = 1 AND id > ? ORDER BY id LIMIT ?",
+            (after_id, _sql_limit(limit))).fetchall()
+        return [self._voucher_dict(row) for row in rows]
+
+    def vouchers(self, voucher_ids):
+        rows = self._conn().execute(
+            f"SELECT * FROM vouchers WHERE id IN ({','.join('?' * len(voucher_ids))}) ORDER BY id",
+            list(voucher_ids)).fetchall()
+        return [self._voucher_dict(row) for row in rows]
+
+    def all_vouchers(self):
+        rows = self._conn().execute("SELECT * FROM vouchers ORDER BY id").fetchall()
+        return [self._voucher_dict(row) for row in rows]
+
+    def approved_businesses(self):
+        return [row['address'] for row in
+                self._conn().execute("SELECT address FROM businesses WHERE is_approved = 1").fetchall()]
+
+    def business_vouchers(self, business_address, after_id=0, limit=None):
+        rows = self._conn().execute(
+            "SELECT * FROM vouchers WHERE business = ? AND id > ? ORDER BY id LIMIT ?",
+            (business_address, after_id, _sql_limit(limit))).fetchall()
+        return [self._voucher_dict(row) for row in rows]
+
+    def customer_redemptions(self, customer_address, after_id=0, limit=None):
+        rows = self._conn().execute(REDEMPTIONS_QUERY + "WHERE r.customer = ? AND r.id > ? ORDER BY r.id LIMIT ?",
+                                    (customer_address, after_id, _sql_limit(limit))).fetchall()
+        return [self._redemption_dict(row) for row in rows]
+
+    # Rows from blocks after ``since`` up to ``until``, for consumers that follow the index incrementally
+
+    def vouchers_between(self, since, until):
+        return self._conn().execute(
+            "SELECT id, business, title, point_cost, is_active FROM vouchers "
+            "WHERE block_number > ? AND block_number <= ? ORDER BY id", (since, until)).fetchall()
+
+    def status_changes_between(self, since, until):
+        return self._conn().execute(
+            "SELECT voucher_id, is_active FROM voucher_status "
+            "WHERE block_number > ? AND block_number <= ? ORDER BY block_number, log_index", (since, until)).fetchall()
+
+    def redemptions_between(self, since, until):
+        return self._conn().execute(
+            "SELECT id, voucher_id, customer, redemption_time FROM redemptions "
+            "WHERE block_number > ? AND block_number <= ? ORDER BY id", (since, until)).fetchall()
+
+    def redemption_details_between(self, since, until):
+        """Redemption dicts of the range, with the redeeming ``customerAddress``."""
+        rows = self._conn().execute(REDEMPTIONS_QUERY + "WHERE r.block_number > ? AND r.block_number <= ? ORDER BY r.id",
+                                    (since, until)).fetchall()
+        return [dict(self._redemption_dict(row), customerAddress=row['customer']) for row in rows]
+
+    def businesses_between(self, since, until):
+        return self._conn().execute(
+            "SELECT address, name FROM businesses WHERE block_number > ? AND block_number <= ? ORDER BY block_number",
+            (since, until)).fetchall()
+
+    def approvals_between(self, since, until):
+        return [row['address'] for row in self._conn().execute(
+            "SELECT address FROM business_approvals WHERE block_number > ? AND block_number <= ? "
+            "ORDER BY block_number, log_index", (since, until)).fetchall()]
+
+    def fulfilments_after(self, seq):
+        """Fulfilments recorded or changed after change sequence number ``seq``, in sequence order."""
+        return self._conn().execute(
+            "SELECT redemption_id, block_number, seq FROM fulfilments WHERE seq > ? ORDER BY seq", (seq,)).fetchall()
+
+    @staticmethod
+    def _redemption_dict(row):
+        return {
+            'id': row['id'],
+            'voucherId': row['voucher_id'],
+            'voucherTitle': row['title'],
+            'voucherDescription': row['description'],
+            'pointCost': row['point_cost'],
+            'businessAddress': row['business'],
+            'redemptionTime': row['redemption_time'],
+            'isRedeemed': bool(row['is_redeemed'])
+        }
+
+    @staticmethod
+    def _voucher_dict(row):
+        return {
+            'id': row['id'],
+            'title': row['title'],
+            'description': row['description'],
+            'pointCost': row['point_cost'],
+            'businessAddress': row['business'],
+            'isActive': bool(row['is_active'])
+        }
+
+
+def _sql_limit(limit):
+    # SQLite treats a negative LIMIT as no limit
+    return -1 if limit is None else limit
+
+
+def create_indexer(w3, voucher_contract, registry_contract):
+    """Build an indexer from the INDEX_* environment variables."""
+    return EventIndexer(
+        w3,
+        voucher_contract,
+        registry_contract,
+        db_path=os.getenv('INDEX_DB_PATH', 'index.db'),
+        start_block=int(os.getenv('INDEX_START_BLOCK', '0')),
+        chunk_size=int(os.getenv('INDEX_CHUNK_SIZE', '2000')),
+        poll_interval=float(os.getenv('INDEX_POLL_INTERVAL', '2')),
+        follow_interval=float(os.getenv('INDEX_FOLLOW_INTERVAL', '0.25')),
+        fulfilment_refresh=int(os.getenv('INDEX_FULFILMENT_REFRESH', '500')),
+    )
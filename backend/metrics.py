@@ -0,0 +1,291 @@
+"""Prometheus metrics for routes, JSON-RPC calls, contract functions and transactions.
+
+Recording never takes a lock: every thread adds to its own shard, a plain
+dict only that thread writes. A scrape copies and sums the shards, folding
+those of threads that have exited into a retired total. Contract functions
+are recognised from the ``to`` address and selector of each ``eth_call``,
+``eth_estimateGas`` and ``eth_sendTransaction``, so calls are counted the same
+whether they went through web3, the view cache or a JSON-RPC batch.
+"""
+import re
+import threading
+import time
+from bisect import bisect_left
+
+from eth_utils import function_abi_to_4byte_selector
+from flask import g, request
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+CONTRACT_METHODS = ('eth_call', 'eth_estimateGas', 'eth_sendTransaction')
+
+_REVERT_REASON = re.compile(r'revert(?:ed)?:?\s*(.*)', re.IGNORECASE | re.DOTALL)
+
+
+class Registry:
+    """Metric definitions plus the per-thread shards holding their values."""
+
+    def __init__(self):
+        self._metrics = []
+        self._local = threading.local()
+        self._shards = []
+        self._retired = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, documentation, labels=()):
+        return self._add(Counter(self, name, documentation, labels))
+
+    def gauge(self, name, documentation, labels=()):
+        return self._add(Gauge(self, name, documentation, labels))
+
+    def histogram(self, name, documentation, labels=(), buckets=DEFAULT_BUCKETS):
+        return self._add(Histogram(self, name, documentation, labels, buckets))
+
+    def _add(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def shard(self):
+        """The calling thread's values, registered on its first write."""
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = {}
+            with self._lock:
+                self._shards.append((threading.current_thread(), shard))
+                # Thread-per-request servers leave many dead shards between scrapes
+                if len(self._shards) > 2 * threading.active_count() + 16:
+                    self._fold_dead()
+            return shard
+
+    def _fold_dead(self):
+        live = []
+        for thread, shard in self._shards:
+            if thread.is_alive():
+                live.append((thread, shard))
+            else:
+                _merge(self._retired, shard)
+        self._shards = live
+
+    def snapshot(self):
+        with self._lock:
+            self._fold_dead()
+            totals = {}
+            _merge(totals, self._retired)
+            for _, shard in self._shards:
+                # dict.copy() is atomic under the GIL, so the owner can keep writing
+                _merge(totals, shard.copy())
+        return totals
+
+    def render(self):
+        """All metrics in the Prometheus text exposition format."""
+        totals = self.snapshot()
+        lines = []
+        for metric in self._metrics:
+            lines.append(f'# HELP {metric.name} {metric.documentation}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            samples = sorted((labels, value) for (name, labels), value in totals.items() if name == metric.name)
+            for labels, value in samples:
+                lines.extend(metric.render(labels, value))
+        return '\n'.join(lines) + '\n'
+
+
+def _merge(into, shard):
+    for key, value in shard.items():
+        if isinstance(value, list):
+            current = into.get(key)
+            into[key] = list(value) if current is None else [a + b for a, b in zip(current, value)]
+        else:
+            into[key] = into.get(key, 0) + value
+
+
+def _escape(value):
+    return str(value).replace('\\', r'\\').replace('\n', r'\n').replace('"', r'\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in list(zip(names, values)) + list(extra)]
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, registry, name, documentation, labels):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+
+    def inc(self, *labels, amount=1):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        shard[key] = shard.get(key, 0) + amount
+
+    def render(self, labels, value):
+        return [f'{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}']
+
+
+class Gauge(Counter):
+    kind = 'gauge'
+
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, registry, name, documentation, labels, buckets):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, *labels):
+        shard = self.registry.shard()
+        key = (self.name, labels)
+        values = shard.get(key)
+        if values is None:
+            # One count per bucket plus +Inf, then the sum
+            values = shard[key] = [0] * (len(self.buckets) + 2)
+        values[bisect_left(self.buckets, value)] += 1
+        values[-1] += value
+
+    def render(self, labels, values):
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), values):
+            cumulative += count
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, labels, [("le", bound)])} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(float(values[-1]))}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels, labels)} {cumulative}')
+        return lines
+
+
+REGISTRY = Registry()
+
+HTTP_REQUESTS = REGISTRY.counter('http_requests_total', 'HTTP requests by route, method and status.',
+                                 ('route', 'method', 'status'))
+HTTP_LATENCY = REGISTRY.histogram('http_request_duration_seconds', 'HTTP request latency by route and method.',
+                                  ('route', 'method'))
+HTTP_IN_FLIGHT = REGISTRY.gauge('http_requests_in_flight', 'HTTP requests being served, by route.', ('route',))
+RPC_REQUESTS = REGISTRY.counter('rpc_requests_total', 'JSON-RPC calls by method; batched calls are counted one by one.',
+                                ('method', 'batched'))
+RPC_ERRORS = REGISTRY.counter('rpc_errors_total', 'JSON-RPC calls that failed, by method.', ('method', 'batched'))
+RPC_LATENCY = REGISTRY.histogram('rpc_request_duration_seconds', 'JSON-RPC round trip time; a batch is one round trip.',
+                                 ('method',))
+CONTRACT_CALLS = REGISTRY.counter('contract_calls_total', 'Contract function calls sent to the node.',
+                                  ('contract', 'function', 'method'))
+REVERTS = REGISTRY.counter('contract_reverts_total', 'Reverted contract calls and transactions by reason.',
+                           ('source', 'reason'))
+TRANSACTIONS = REGISTRY.counter('transactions_total', 'Tracked transactions by kind and final status.',
+                                ('kind', 'status'))
+RECEIPT_WAIT = REGISTRY.histogram('tx_receipt_wait_seconds', 'Time from submitting a transaction to its receipt.',
+                                  ('kind', 'status'))
+RPC_QUEUE_DEPTH = REGISTRY.gauge('rpc_queue_depth', 'JSON-RPC requests waiting for a node slot, by priority.',
+                                 ('priority',))
+RPC_QUEUE_WAIT = REGISTRY.histogram('rpc_queue_wait_seconds', 'Time JSON-RPC requests waited for a node slot.',
+                                    ('priority',))
+RPC_COALESCED = REGISTRY.counter('rpc_coalesced_total',
+                                 'JSON-RPC reads answered by an identical request already in flight.', ('method',))
+
+# (address, selector) -> (contract name, function name)
+_functions = {}
+
+
+def register_contract(name, contract):
+    """Label calls to ``contract`` by ``name`` and function name."""
+    address = contract.address.lower()
+    for abi in contract.abi:
+        if abi.get('type') == 'function':
+            _functions[(address, '0x' + function_abi_to_4byte_selector(abi).hex())] = (name, abi['name'])
+
+
+def revert_reason(message):
+    """The revert reason in a node error message, or None if it is not a revert."""
+    if isinstance(message, Exception) and message.args and isinstance(message.args[0], dict):
+        # web3 raises ValueError with the node's error object
+        message = message.args[0].get('message', '')
+    match = _REVERT_REASON.search(str(message))
+    if match is None:
+        return None
+    return match.group(1).strip().strip("'\"")[:80] or 'unknown'
+
+
+def contract_function(method, params):
+    """``(contract name, function name)`` a JSON-RPC call runs, or None if it is not a contract call."""
+    if method not in CONTRACT_METHODS or not params or not isinstance(params[0], dict):
+        return None
+    data = params[0].get('data') or params[0].get('input') or ''
+    if not isinstance(data, str):
+        data = '0x' + bytes(data).hex()
+    to = params[0].get('to') or ''
+    return _functions.get((to.lower(), data[:10].lower()), ('unknown', data[:10] or 'none'))
+
+
+def record_rpc(method, params, error=None, batched=False):
+    """Count one JSON-RPC call, the contract function it runs and its revert reason."""
+    flag = 'true' if batched else 'false'
+    RPC_REQUESTS.inc(method, flag)
+    function = contract_function(method, params)
+    if function is not None:
+        CONTRACT_CALLS.inc(function[0], function[1], method)
+    if error is not None:
+        RPC_ERRORS.inc(method, flag)
+        reason = revert_reason(error)
+        if reason is not None:
+            REVERTS.inc(method, reason)
+
+
+def rpc_middleware(make_request, w3):
+    """web3 middleware recording every request that goes through the provider."""
+    def middleware(method, params):
+        start = time.perf_counter()
+        try:
+            response = make_request(method, params)
+        except Exception as e:
+            RPC_LATENCY.observe(time.perf_counter() - start, method)
+            record_rpc(method, params, error=e)
+            raise
+        RPC_LATENCY.observe(time.perf_counter() - start, method)
+        error = response.get('error') if isinstance(response, dict) else None
+        record_rpc(method, params, error=error.get('message', error) if isinstance(error, dict) else error)
+        return response
+    return middleware
+
+
+def record_transaction(tracked):
+    """Count a finished tracked transaction and how long its receipt took."""
+    TRANSACTIONS.inc(tracked.kind, tracked.status)
+    RECEIPT_WAIT.observe(tracked.finished_at - tracked.submitted_at, tracked.kind, tracked.status)
+    if tracked.status == 'failed':
+        REVERTS.inc(f'receipt:{tracked.kind}', 'unknown')
+
+
+def instrument_app(app):
+    """Record latency, status and in-flight count for every request ``app`` serves."""
+    @app.before_request
+    def start_timer():
+        g.metrics_route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        g.metrics_start = time.perf_counter()
+        HTTP_IN_FLIGHT.inc(g.metrics_route)
+
+    @app.after_request
+    def record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def record_request(error):
+        route = g.pop('metrics_route', None)
+        if route is None:
+            return
+        HTTP_IN_FLIGHT.dec(route)
+        HTTP_LATENCY.observe(time.perf_counter() - g.pop('metrics_start'), route, request.method)
+        HTTP_REQUESTS.inc(route, request.method, str(g.pop('metrics_status', 500)))
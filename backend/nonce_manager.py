@@ -0,0 +1,123 @@
+"""Local nonce allocation for the accounts the backend sends from.
+
+Letting the node pick nonces forces transactions from one account to be
+submitted one after another. Each ``NonceManager`` instead hands nonces out
+atomically from a local counter so many transactions from the same account
+can be in flight at once. Nonces of failed submissions are handed out again
+first so no gap stalls the account, and the counter is resynced from the
+node's pending count when a transaction is dropped or replaced. Given a
+``GasStrategy``, transactions also get their gas limit and fees from it,
+and are preflighted through it before a nonce is allocated.
+Given a ``SharedState``, the counter lives there instead, so every worker
+process sending from the same account draws from one sequence.
+"""
+import heapq
+import threading
+
+import tracing
+from chain_meta import dry_run
+from rpc_scheduler import TRANSACTION, rpc_priority
+
+# Node errors meaning our counter disagrees with the node's view of the account
+NONCE_ERRORS = ('nonce too low', 'nonce too high', 'already known', 'replacement transaction underpriced',
+                'known transaction', 'invalid nonce', 'incorrect nonce')
+
+
+class NonceManager:
+    """Atomically allocates nonces for a single sending account."""
+
+    def __init__(self, w3, address, gas_strategy=None, shared=None):
+        self.w3 = w3
+        self.address = address
+        self.gas_strategy = gas_strategy
+        self.shared = shared
+        self._lock = threading.Lock()
+        self._next = None
+        self._released = []
+
+    def _pending_count(self):
+        return self.w3.eth.get_transaction_count(self.address, 'pending')
+
+    def allocate(self):
+        if self.shared is not None:
+            return self.shared.allocate_nonce(self.address, self._pending_count)
+        with self._lock:
+            if self._released:
+                return heapq.heappop(self._released)
+            if self._next is None:
+                self._next = self._pending_count()
+            nonce = self._next
+            self._next += 1
+            return nonce
+
+    def release(self, nonce):
+        """Return the nonce of a transaction that never reached the node."""
+        if self.shared is not None:
+            self.shared.release_nonce(self.address, nonce)
+            return
+        with self._lock:
+            heapq.heappush(self._released, nonce)
+
+    def resync(self):
+        """Forget local state and continue from the node's pending transaction count."""
+        if self.shared is not None:
+            self.shared.reset_nonce(self.address, self._pending_count())
+            print(f"Nonce manager: resynced {self.address} in shared state")
+            return
+        with self._lock:
+            self._next = self._pending_count()
+            self._released = []
+            print(f"Nonce manager: resynced {self.address} at nonce {self._next}")
+
+    def transact(self, contract_function, transaction, variant=None, preflight=False):
+        """Send ``contract_function`` with an allocated nonce and return the tx hash.
+
+        ``variant`` names a state-dependent cost case for the gas strategy. With
+        ``preflight``, raises ``PreflightError`` instead of sending a transaction
+        that would revert.
+        """
+        # Nonce, gas and fee lookups are part of the submission, so they queue with it
+        with rpc_priority(TRANSACTION), tracing.span('tx.submit', contract_function.fn_name):
+            if self.gas_strategy is not None:
+                transaction = self.gas_strategy.prepare(contract_function, transaction, variant, preflight)
+            elif preflight:
+                dry_run(contract_function, transaction['from'])
+            nonce = self.allocate()
+            try:
+                tx_hash = contract_function.transact(dict(transaction, nonce=nonce))
+                if self.gas_strategy is not None:
+                    self.gas_strategy.sent(tx_hash, contract_function, transaction, variant)
+                return tx_hash
+            except Exception as e:
+                if any(error in str(e).lower() for error in NONCE_ERRORS):
+                    self.resync()
+                else:
+                    self.release(nonce)
+                raise
+
+
+class NonceManagers:
+    """One ``NonceManager`` per sending address, created on first use."""
+
+    def __init__(self, w3, gas_strategy=None, shared=None):
+        self.w3 = w3
+        self.gas_strategy = gas_strategy
+        self.shared = shared
+        self._managers = {}
+        self._lock = threading.Lock()
+
+    def get(self, address):
+        with self._lock:
+            manager = self._managers.get(address)
+            if manager is None:
+                manager = self._managers[address] = NonceManager(self.w3, address, self.gas_strategy, self.shared)
+            return manager
+
+    def transact(self, contract_function, transaction, variant=None, preflight=False):
+        return self.get(transaction['from']).transact(contract_function, transaction, variant, preflight)
+
+    def resync(self, address):
+        with self._lock:
+            manager = self._managers.get(address)
+        if manager is not None:
+            manager.resync()
@@ -0,0 +1,96 @@
+"""Cursor pagination and streamed list responses.
+
+List routes take ``after_id`` (exclusive cursor, default 0) and ``limit``.
+A plain request returns one page as a JSON array, plus an
+``X-Next-After-Id`` header when more items follow. With ``?stream=ndjson``
+(one item per line) or ``?stream=json`` (a chunked JSON array) the items are
+written as they are fetched, page by page, so the response is never built
+in memory and the first item goes out after the first page.
+
+Item sources are callables ``items(after_id, page_size)`` returning an
+iterator of dicts with an ascending ``id``.
+"""
+import json
+import os
+from itertools import islice
+
+from flask import Response, jsonify, stream_with_context
+
+MAX_PAGE_SIZE = int(os.getenv('MAX_PAGE_SIZE', '1000'))
+STREAM_PAGE_SIZE = int(os.getenv('STREAM_PAGE_SIZE', '500'))
+
+STREAM_FORMATS = ('ndjson', 'json')
+
+
+def page_args(args):
+    """``(after_id, limit, stream)`` from the query string; raises ValueError."""
+    after_id = int(args.get('after_id', 0))
+    stream = args.get('stream')
+    if stream is not None and stream not in STREAM_FORMATS:
+        raise ValueError(f"stream must be one of {', '.join(STREAM_FORMATS)}")
+    limit = args.get('limit')
+    if limit is not None:
+        limit = max(1, int(limit))
+        if stream is None:
+            limit = min(limit, MAX_PAGE_SIZE)
+    elif stream is None:
+        limit = MAX_PAGE_SIZE
+    return after_id, limit, stream
+
+
+def iter_pages(fetch_page, after_id=0, page_size=STREAM_PAGE_SIZE):
+    """Yield every item of ``fetch_page(after_id, limit)``, following the cursor page by page."""
+    while True:
+        page = fetch_page(after_id, page_size)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_id = page[-1]['id']
+
+
+def take_page(items, after_id, limit):
+    """``(page, next_after_id)``: up to ``limit`` items after ``after_id``, and None if no more follow."""
+    # One extra item tells whether another page follows
+    page = list(islice(items(after_id, limit + 1), limit + 1))
+    if len(page) > limit:
+        return page[:limit], page[limit - 1]['id']
+    return page, None
+
+
+def list_response(items, paging):
+    """Respond with a page of ``items`` or stream them, as ``page_args`` asked."""
+    after_id, limit, stream = paging
+    if stream is None:
+        page, next_after_id = take_page(items, after_id, limit)
+        response = jsonify(page)
+        if next_after_id is not None:
+            response.headers['X-Next-After-Id'] = str(next_after_id)
+        return response
+
+    source = items(after_id, STREAM_PAGE_SIZE)
+    if limit is not None:
+        source = islice(source, limit)
+    if stream == 'ndjson':
+        return Response(stream_with_context(_ndjson(source)), mimetype='application/x-ndjson')
+    return Response(stream_with_context(_json_array(source)), mimetype='application/json')
+
+
+def _ndjson(items):
+    try:
+        for item in items:
+            yield json.dumps(item) + '\n'
+    except Exception as e:
+        print(f"Error streaming list: {e}")
+        yield json.dumps({'error': str(e)}) + '\n'
+
+
+def _json_array(items):
+    yield '['
+    try:
+        for index, item in enumerate(items):
+            yield (',' if index else '') + json.dumps(item)
+    except Exception as e:
+        # Leave the array unterminated so clients cannot mistake it for a complete list
+        print(f"Error streaming list: {e}")
+        return
+    yield ']'
@@ -0,0 +1,102 @@
+"""Password hashing off the request threads.
+
+PBKDF2 is deliberately slow and holds the GIL while it runs, so hashing in
+a request thread stalls every other request the server is handling.
+``PasswordHasher`` runs it in a pool of worker processes instead. The number
+of hashes queued or running is capped; past the cap ``HasherBusy`` is raised
+so the route can answer 503 rather than let the backlog grow without bound.
+
+Workers are forked. Where fork is unavailable (Windows) a thread pool is
+used instead, since spawned workers would re-run the app module on import.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from werkzeug.security import check_password_hash, generate_password_hash
+
+import tracing
+
+DEFAULT_ITERATIONS = 260000
+
+
+class HasherBusy(RuntimeError):
+    """Raised when the hashing queue is full."""
+
+
+def _hash(password, method):
+    return generate_password_hash(password, method=method)
+
+
+def _verify(password_hash, password):
+    return check_password_hash(password_hash, password)
+
+
+def _noop():
+    return None
+
+
+class PasswordHasher:
+    """Hashes and verifies passwords in a bounded process pool."""
+
+    def __init__(self, workers=None, max_pending=None, iterations=DEFAULT_ITERATIONS):
+        self.workers = workers or os.cpu_count() or 1
+        self.max_pending = max_pending or self.workers * 4
+        self.method = f'pbkdf2:sha256:{iterations}'
+        self._slots = threading.BoundedSemaphore(self.max_pending)
+        if 'fork' in multiprocessing.get_all_start_methods():
+            self._pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context('fork'))
+        else:
+            self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='password-hash')
+        # Start the workers now, before the app starts its background threads
+        for future in [self._pool.submit(_noop) for _ in range(self.workers)]:
+            future.result()
+
+    def hash(self, password):
+        with tracing.span('password.hash'):
+            return self._run(_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        with tracing.span('password.verify'):
+            return self._run(_verify, password_hash, password)
+
+    def needs_rehash(self, password_hash):
+        """True if ``password_hash`` was made with a different method or cost."""
+        return password_hash.split('$', 1)[0] != self.method
+
+    def rehash_later(self, password, callback):
+        """Hash ``password`` in the background and pass the result to ``callback``.
+
+        Skipped quietly when the pool is busy; the next login tries again.
+        """
+        if not self._slots.acquire(blocking=False):
+            return
+        future = self._pool.submit(_hash, password, self.method)
+        future.add_done_callback(lambda f: self._rehashed(f, callback))
+
+    def _rehashed(self, future, callback):
+        self._slots.release()
+        try:
+            callback(future.result())
+        except Exception as e:
+            print(f"Password hasher: rehash failed: {e}")
+
+    def _run(self, fn, *args):
+        if not self._slots.acquire(blocking=False):
+            raise HasherBusy('Too many password operations in progress')
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+
+def create_password_hasher():
+    """Build a hasher from the PASSWORD_HASH_* environment variables."""
+    workers = int(os.getenv('PASSWORD_HASH_WORKERS', '0')) or None
+    max_pending = int(os.getenv('PASSWORD_HASH_MAX_PENDING', '0')) or None
+    return PasswordHasher(
+        workers=workers,
+        max_pending=max_pending,
+        iterations=int(os.getenv('PASSWORD_HASH_ITERATIONS', str(DEFAULT_ITERATIONS)))
+    )
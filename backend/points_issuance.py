@@ -0,0 +1,102 @@
+"""Streaming parser for bulk loyalty-point issuance uploads.
+
+Uploads are CSV (``address,amount`` with an optional header row) or NDJSON
+(``{"address": ..., "amount": ...}`` per line). Rows are read straight from
+the request stream and validated in batches, so an upload of any size is
+never held in memory. Valid rows are folded into one total per recipient.
+"""
+import codecs
+import csv
+import json
+from array import array
+
+from eth_utils import is_address, to_checksum_address
+
+VALIDATE_BATCH_SIZE = 1000
+
+# Placeholder address for rows that could not be parsed at all
+MALFORMED = object()
+
+
+class Recipient:
+    """Total amount owed to one address and the upload rows it came from."""
+
+    __slots__ = ('address', 'amount', 'rows')
+
+    def __init__(self, address):
+        self.address = address
+        self.amount = 0
+        self.rows = array('L')
+
+
+def iter_raw_rows(stream, fmt):
+    """Yield ``(row_number, address, amount)`` as read from the upload."""
+    lines = codecs.iterdecode(stream, 'utf-8')
+    if fmt == 'ndjson':
+        for row_number, line in enumerate(lines, 1):
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                item = json.loads(line)
+                yield row_number, item.get('address'), item.get('amount')
+            except (ValueError, AttributeError):
+                yield row_number, MALFORMED, None
+    else:
+        for row_number, row in enumerate(csv.reader(lines), 1):
+            if not row:
+                continue
+            if row_number == 1 and row[0].strip().lower() == 'address':
+                continue
+            yield row_number, row[0] if row else None, row[1] if len(row) > 1 else None
+
+
+def validate_rows(raw_rows, batch_size=VALIDATE_BATCH_SIZE):
+    """Yield ``(row_number, checksum_address, amount, error)`` for each row.
+
+    Rows are checked a batch at a time; ``error`` is None for valid rows.
+    """
+    batch = []
+    for raw in raw_rows:
+        batch.append(raw)
+        if len(batch) >= batch_size:
+            yield from _validate_batch(batch)
+            batch = []
+    if batch:
+        yield from _validate_batch(batch)
+
+
+def _validate_batch(batch):
+    checksums = {}
+    for row_number, address, amount in batch:
+        if address is MALFORMED:
+            yield row_number, None, None, 'Malformed row'
+            continue
+        if not isinstance(address, str) or not is_address(address.strip()):
+            yield row_number, None, None, f'Invalid address: {address}'
+            continue
+        try:
+            amount = int(str(amount).strip())
+        except (TypeError, ValueError):
+            yield row_number, None, None, f'Invalid amount: {amount}'
+            continue
+        if amount <= 0:
+            yield row_number, None, None, f'Amount must be positive: {amount}'
+            continue
+        address = address.strip()
+        key = address.lower()
+        if key not in checksums:
+            checksums[key] = to_checksum_address(key)
+        yield row_number, checksums[key], amount, None
+
+
+def aggregate(valid_rows, recipients):
+    """Fold valid rows into ``recipients`` (address -> Recipient) as they stream past."""
+    for row_number, address, amount, error in valid_rows:
+        if error is None:
+            recipient = recipients.get(address)
+            if recipient is None:
+                recipient = recipients[address] = Recipient(address)
+            recipient.amount += amount
+            recipient.rows.append(row_number)
+        yield row_number, address, amount, error
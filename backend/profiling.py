@@ -0,0 +1,168 @@
+"""On-demand profiling of a sample of requests.
+
+Switched on by an admin for a share of requests. ``cprofile`` runs each
+sampled request under ``cProfile`` and adds its stats to a per-route total;
+``sampling`` instead records the sampled request threads' stacks every few
+milliseconds from a background thread, which costs far less and also shows
+where requests sit waiting. ``dump`` writes one file per route:
+``<route>.prof`` for ``pstats``/snakeviz, or ``<route>.folded`` (collapsed
+stacks with sample counts) for flame graph tools. Each worker process
+profiles and dumps its own requests.
+"""
+import cProfile
+import os
+import pstats
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+
+from flask import g, request
+
+PROFILE_MODES = ('cprofile', 'sampling')
+
+
+def _route_file(route):
+    return re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'root'
+
+
+def _collapse(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+class RequestProfiler:
+    """Profiles ``sample_rate`` of requests while switched on and aggregates the results per route."""
+
+    def __init__(self, directory='profiles', interval=0.005):
+        self.directory = directory
+        self.interval = interval
+        self.mode = None
+        self.sample_rate = 0.0
+        self.started_at = None
+        self._stats = {}
+        self._stacks = {}
+        self._sampled = {}
+        self._lock = threading.Lock()
+        self._sampler = None
+        self.profiled = 0
+        self.skipped = 0
+
+    @property
+    def active(self):
+        return self.mode is not None
+
+    def start(self, sample_rate, mode='cprofile'):
+        """Profile ``sample_rate`` (0 to 1) of requests from now on, discarding earlier results."""
+        if mode not in PROFILE_MODES:
+            raise ValueError(f"mode must be one of {', '.join(PROFILE_MODES)}")
+        if not 0 < sample_rate <= 1:
+            raise ValueError('sample_rate must be above 0 and at most 1')
+        with self._lock:
+            self._stats = {}
+            self._stacks = {}
+            self.profiled = self.skipped = 0
+            self.sample_rate = sample_rate
+            self.mode = mode
+            self.started_at = time.time()
+        if mode == 'sampling' and self._sampler is None:
+            self._sampler = threading.Thread(target=self._sample, name='profile-sampler', daemon=True)
+            self._sampler.start()
+        print(f"Profiler: sampling {sample_rate:.1%} of requests with {mode}")
+
+    def stop(self):
+        """Stop profiling and write what was collected; returns the files written."""
+        self.mode = None
+        files = self.dump()
+        print(f"Profiler: stopped after {self.profiled} requests, wrote {len(files)} files")
+        return files
+
+    def dump(self):
+        """Write the per-route results collected so far into ``directory``."""
+        os.makedirs(self.directory, exist_ok=True)
+        stamp = time.strftime('%Y%m%d-%H%M%S')
+        files = []
+        with self._lock:
+            for route, stats in self._stats.items():
+                path = os.path.join(self.directory, f'{_route_file(route)}-{stamp}.prof')
+                stats.dump_stats(path)
+                files.append(path)
+            for route, stacks in self._stacks.items():
+                path = os.path.join(self.directory, f'{_route_file(route)}-{stamp}.folded')
+                with open(path, 'w') as f:
+                    for stack, count in stacks.most_common():
+                        f.write(f'{stack} {count}\n')
+                files.append(path)
+        return files
+
+    def instrument(self, app):
+        @app.before_request
+        def start_profile():
+            if self.mode is None or random.random() >= self.sample_rate:
+                return
+            route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+            if self.mode == 'cprofile':
+                profile = cProfile.Profile()
+                try:
+                    profile.enable()
+                except ValueError:
+                    # Python 3.12+ allows one active cProfile per process
+                    self.skipped += 1
+                    return
+                g.profile = (route, profile)
+            else:
+                with self._lock:
+                    self._sampled[threading.get_ident()] = route
+                g.profile = (route, None)
+
+        @app.teardown_request
+        def finish_profile(error):
+            entry = g.pop('profile', None)
+            if entry is None:
+                return
+            route, profile = entry
+            if profile is None:
+                with self._lock:
+                    self._sampled.pop(threading.get_ident(), None)
+                    self.profiled += 1
+                return
+            profile.disable()
+            with self._lock:
+                stats = self._stats.get(route)
+                if stats is None:
+                    self._stats[route] = pstats.Stats(profile)
+                else:
+                    stats.add(profile)
+                self.profiled += 1
+
+    def _sample(self):
+        while True:
+            time.sleep(self.interval)
+            if self.mode != 'sampling':
+                continue
+            with self._lock:
+                if not self._sampled:
+                    continue
+                frames = sys._current_frames()
+                for ident, route in self._sampled.items():
+                    frame = frames.get(ident)
+                    if frame is not None:
+                        self._stacks.setdefault(route, Counter())[_collapse(frame)] += 1
+
+    def stats(self):
+        return {
+            'active': self.active,
+            'mode': self.mode,
+            'sample_rate': self.sample_rate if self.active else None,
+            'started_at': self.started_at,
+            'profiled': self.profiled,
+            'skipped': self.skipped,
+            'routes': sorted(set(self._stats) | set(self._stacks)),
+            'directory': os.path.abspath(self.directory)
+        }
@@ -0,0 +1,104 @@
+"""Blockchain provider construction.
+
+The transport is chosen from ``BLOCKCHAIN_PROVIDER`` (or forced with
+``BLOCKCHAIN_TRANSPORT``): ``http(s)://`` gets an HTTP provider with a
+keep-alive connection pool sized for the request threads, ``ws(s)://`` a
+persistent WebSocket and a filesystem path the IPC socket of a co-located
+node. Every transport gets a per-call timeout, and read calls that fail
+with a transient connection error are retried with exponential backoff.
+Every call is also recorded in ``metrics`` and traced, and each attempt
+waits for a slot from the ``rpc_scheduler``.
+"""
+import os
+import random
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+
+import metrics
+import tracing
+from rpc_scheduler import SCHEDULER
+
+try:
+    from websockets.exceptions import ConnectionClosed
+except ImportError:  # pragma: no cover - websockets ships with web3
+    ConnectionClosed = OSError
+
+# Errors worth retrying; requests' connection errors and timeouts are OSErrors
+TRANSIENT_ERRORS = (OSError, TimeoutError, ConnectionClosed)
+
+RPC_RETRIES = int(os.getenv('RPC_RETRIES', '3'))
+RPC_RETRY_BACKOFF = float(os.getenv('RPC_RETRY_BACKOFF', '0.2'))
+
+# Resending these could submit a transaction twice
+NON_RETRYABLE_METHODS = {'eth_sendTransaction', 'eth_sendRawTransaction', 'personal_sendTransaction'}
+
+
+def detect_transport(uri):
+    if uri.startswith(('http://', 'https://')):
+        return 'http'
+    if uri.startswith(('ws://', 'wss://')):
+        return 'ws'
+    return 'ipc'
+
+
+def build_provider(uri, transport='auto', timeout=10, pool_size=32):
+    """Provider for ``uri`` over ``transport`` ('auto', 'http', 'ws' or 'ipc')."""
+    if transport == 'auto':
+        transport = detect_transport(uri)
+    if transport == 'http':
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, pool_block=True)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        return Web3.HTTPProvider(uri, request_kwargs={'timeout': timeout}, session=session)
+    if transport == 'ws':
+        return Web3.WebsocketProvider(uri, websocket_timeout=timeout)
+    if transport == 'ipc':
+        return Web3.IPCProvider(uri, timeout=timeout)
+    raise ValueError(f'Unknown BLOCKCHAIN_TRANSPORT: {transport}')
+
+
+def with_retries(description, fn, *args, retries=None, backoff=None):
+    """Call ``fn(*args)``, retrying transient transport errors with jittered exponential backoff."""
+    retries = RPC_RETRIES if retries is None else retries
+    backoff = RPC_RETRY_BACKOFF if backoff is None else backoff
+    for attempt in range(retries + 1):
+        try:
+            return fn(*args)
+        except TRANSIENT_ERRORS as e:
+            if attempt == retries:
+                raise
+            delay = backoff * 2 ** attempt * random.uniform(0.5, 1.5)
+            print(f"Provider: {description} failed ({e}), retrying in {delay:.2f}s")
+            time.sleep(delay)
+
+
+def retry_middleware(retries=None, backoff=None):
+    """Retry read requests that fail with a transient transport error."""
+    def middleware(make_request, w3):
+        def middleware_fn(method, params):
+            if method in NON_RETRYABLE_METHODS:
+                return make_request(method, params)
+            return with_retries(method, make_request, method, params, retries=retries, backoff=backoff)
+        return middleware_fn
+    return middleware
+
+
+def create_web3():
+    """Build the Web3 instance from the BLOCKCHAIN_* and RPC_* environment variables."""
+    provider = build_provider(
+        os.getenv('BLOCKCHAIN_PROVIDER', 'http://127.0.0.1:7545'),
+        transport=os.getenv('BLOCKCHAIN_TRANSPORT', 'auto'),
+        timeout=float(os.getenv('RPC_TIMEOUT', '10')),
+        pool_size=int(os.getenv('RPC_POOL_SIZE', '32'))
+    )
+    w3 = Web3(provider)
+    # Innermost, so every retry attempt queues again instead of holding a slot while backing off
+    w3.middleware_onion.inject(SCHEDULER.middleware, name='scheduler', layer=0)
+    w3.middleware_onion.add(retry_middleware(), name='retry')
+    w3.middleware_onion.add(metrics.rpc_middleware, name='metrics')
+    w3.middleware_onion.add(tracing.rpc_middleware, name='tracing')
+    return w3
@@ -0,0 +1,151 @@
+"""JSON-RPC batching for contract view calls.
+
+Turns N independent ``eth_call`` requests into a handful of HTTP round trips
+by sending them as JSON-RPC batch arrays, chunked so very long lists do not
+produce oversized requests. Providers that cannot batch fall back to issuing
+the requests one at a time. Each round trip takes a slot from the
+``rpc_scheduler`` like any other request.
+"""
+import itertools
+import json
+import os
+import time
+
+from hexbytes import HexBytes
+from web3 import HTTPProvider
+from web3._utils.request import make_post_request
+
+import metrics
+import tracing
+from addresses import checksum_address
+from providers import with_retries
+from rpc_scheduler import SCHEDULER
+
+DEFAULT_BATCH_SIZE = int(os.getenv('RPC_BATCH_SIZE', '100'))
+
+_request_ids = itertools.count(1)
+
+
+class BatchCallError(ValueError):
+    """Error returned by the node for a single entry of a batch."""
+
+
+def batch_request(w3, requests, batch_size=None):
+    """Send ``(method, params)`` pairs and return their results in order.
+
+    Entries the node rejected are returned as ``BatchCallError`` instances
+    instead of raising, so one reverted call does not fail the whole batch.
+    """
+    requests = list(requests)
+    if not requests:
+        return []
+    provider = w3.provider
+    if not isinstance(provider, HTTPProvider):
+        return [_single_request(provider, method, params) for method, params in requests]
+
+    batch_size = batch_size or DEFAULT_BATCH_SIZE
+    results = []
+    for start in range(0, len(requests), batch_size):
+        chunk = requests[start:start + batch_size]
+        payload = [
+            {'jsonrpc': '2.0', 'id': next(_request_ids), 'method': method, 'params': params}
+            for method, params in chunk
+        ]
+        started = time.perf_counter()
+        with tracing.span('rpc.batch', chunk[0][0], requests=len(chunk)):
+            raw = with_retries(
+                'batch request',
+                _post, provider, json.dumps(payload).encode()
+            )
+        metrics.RPC_LATENCY.observe(time.perf_counter() - started, 'batch')
+        responses = json.loads(raw)
+        if not isinstance(responses, list):
+            # Node does not support batches, send this chunk one by one
+            results.extend(_single_request(provider, method, params) for method, params in chunk)
+            continue
+        by_id = {response.get('id'): response for response in responses}
+        for entry in payload:
+            result = _unwrap(by_id.get(entry['id']))
+            metrics.record_rpc(entry['method'], entry['params'], batched=True,
+                               error=result if isinstance(result, BatchCallError) else None)
+            results.append(result)
+    return results
+
+
+def batch_call(w3, calls, block_identifier='latest', batch_size=None):
+    """Execute bound contract functions as batched ``eth_call`` requests.
+
+    ``calls`` are ``contract.functions.name(*args)`` objects. Results are
+    decoded like ``ContractFunction.call()`` would decode them; failed calls
+    come back as exception instances in their slot.
+    """
+    calls = list(calls)
+    if isinstance(block_identifier, int):
+        block_identifier = hex(block_identifier)
+    with tracing.span('abi.encode', calls=len(calls)):
+        requests = [
+            ('eth_call', [{'to': fn.address, 'data': fn._encode_transaction_data()}, block_identifier])
+            for fn in calls
+        ]
+    results = []
+    responses = batch_request(w3, requests, batch_size)
+    with tracing.span('abi.decode', calls=len(calls)):
+        for fn, result in zip(calls, responses):
+            if isinstance(result, Exception):
+                results.append(result)
+                continue
+            try:
+                results.append(_decode_output(w3, fn, result))
+            except Exception as e:
+                results.append(e)
+    return results
+
+
+def raise_errors(results):
+    """Raise the first error in a ``batch_call`` result list, otherwise return it."""
+    for result in results:
+        if isinstance(result, Exception):
+            raise result
+    return results
+
+
+def _post(provider, body):
+    with SCHEDULER.slot():
+        return make_post_request(provider.endpoint_uri, body, **provider.get_request_kwargs())
+
+
+def _single_request(provider, method, params):
+    # Straight to the provider, so record it here rather than in the middleware
+    started = time.perf_counter()
+    try:
+        with tracing.span('rpc', method):
+            result = _unwrap(SCHEDULER.request(method, params, lambda: provider.make_request(method, params)))
+    except Exception as e:
+        result = e
+    metrics.RPC_LATENCY.observe(time.perf_counter() - started, method)
+    metrics.record_rpc(method, params, error=result if isinstance(result, Exception) else None)
+    return result
+
+
+def _unwrap(response):
+    if response is None:
+        return BatchCallError('No response for batched request')
+    if response.get('error'):
+        error = response['error']
+        message = error.get('message', str(error)) if isinstance(error, dict) else str(error)
+        return BatchCallError(message)
+    return response.get('result')
+
+
+def _decode_output(w3, fn, result):
+    output_types = [output['type'] for output in fn.abi['outputs']]
+    data = HexBytes(result)
+    if not data and output_types:
+        raise BatchCallError(f"Empty response for {fn.fn_name}, is the contract deployed?")
+    values = [
+        checksum_address(value) if output_type == 'address' else value
+        for output_type, value in zip(output_types, w3.codec.decode_abi(output_types, data))
+    ]
+    if len(values) == 1:
+        return values[0]
+    return values
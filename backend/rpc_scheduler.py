@@ -0,0 +1,227 @@
+"""One queue in front of the node for every JSON-RPC request this process sends.
+
+Request threads, the indexer, the chain-head poller, the transaction watcher
+and analytics all share one node. Left alone, a backfill or a burst of
+background batches takes the connections a customer request is waiting for.
+Every request, whether it goes through web3 or is a JSON-RPC batch, first
+takes a slot here. At most ``max_concurrency`` requests are out at once, and
+with a ``rate`` no more than that many start per second (a token bucket
+holding ``burst`` tokens). Waiting requests get slots by priority class:
+transaction submission, then reads serving an HTTP request, then background
+work. Within a class they go first come, first served.
+
+Identical idempotent reads issued concurrently, such as many requests asking
+for the same ``eth_call`` at ``latest``, share the response of whichever
+one went to the node first.
+"""
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import has_request_context
+
+import metrics
+import tracing
+
+TRANSACTION = 0
+READ = 1
+BACKGROUND = 2
+PRIORITY_NAMES = ('transaction', 'read', 'background')
+
+SEND_METHODS = {'eth_sendTransaction', 'eth_sendRawTransaction', 'personal_sendTransaction'}
+
+# Answered the same for every caller in flight at the same time
+COALESCED_METHODS = {
+    'eth_call', 'eth_blockNumber', 'eth_chainId', 'net_version', 'eth_getBalance', 'eth_getCode',
+    'eth_getBlockByNumber', 'eth_getTransactionReceipt', 'eth_gasPrice', 'eth_maxPriorityFeePerGas'
+}
+
+_local = threading.local()
+
+
+def current_priority():
+    """The class of requests sent from this thread: set by ``rpc_priority``, else read or background."""
+    priority = getattr(_local, 'priority', None)
+    if priority is not None:
+        return priority
+    return READ if has_request_context() else BACKGROUND
+
+
+@contextmanager
+def rpc_priority(priority):
+    """Send this thread's requests as ``priority`` while inside the block."""
+    previous = getattr(_local, 'priority', None)
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+
+class _InFlight:
+    __slots__ = ('done', 'response', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.response = None
+        self.error = None
+
+
+class RpcScheduler:
+    """Priority queue, concurrency limit and rate limit for requests to the node."""
+
+    def __init__(self, max_concurrency=32, rate=0.0, burst=None, coalesce=True):
+        self.max_concurrency = max(1, max_concurrency)
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.coalesce = coalesce
+        self._tokens = self.burst
+        self._refilled = time.monotonic()
+        self._cond = threading.Condition()
+        self._waiting = []
+        self._tickets = itertools.count()
+        self._running = 0
+        self._flights = {}
+        self._flights_lock = threading.Lock()
+        self.granted = [0, 0, 0]
+        self.wait_seconds = [0.0, 0.0, 0.0]
+        self.max_wait = [0.0, 0.0, 0.0]
+        self.coalesced = 0
+
+    @contextmanager
+    def slot(self, priority=None):
+        """Hold one of the node's request slots for the duration of the block."""
+        self._acquire(current_priority() if priority is None else priority)
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._running -= 1
+                self._cond.notify_all()
+
+    def _acquire(self, priority):
+        name = PRIORITY_NAMES[priority]
+        started = time.perf_counter()
+        with self._cond:
+            ticket = (priority, next(self._tickets))
+            heapq.heappush(self._waiting, ticket)
+            metrics.RPC_QUEUE_DEPTH.inc(name)
+            try:
+                while True:
+                    if self._waiting[0] == ticket and self._running < self.max_concurrency:
+                        delay = self._take_token()
+                        if not delay:
+                            break
+                        self._cond.wait(delay)
+                    else:
+                        self._cond.wait()
+            except BaseException:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                self._cond.notify_all()
+                raise
+            finally:
+                metrics.RPC_QUEUE_DEPTH.dec(name)
+            heapq.heappop(self._waiting)
+            self._running += 1
+            # The next ticket may fit in another free slot
+            self._cond.notify_all()
+            waited = time.perf_counter() - started
+            self.granted[priority] += 1
+            self.wait_seconds[priority] += waited
+            self.max_wait[priority] = max(self.max_wait[priority], waited)
+        metrics.RPC_QUEUE_WAIT.observe(waited, name)
+        if waited >= 0.001:
+            tracing.annotate(queued_ms=round(waited * 1000, 1))
+
+    def _take_token(self):
+        """Spend a token and return 0, or return the seconds until one is available."""
+        if self.rate <= 0:
+            return 0
+        now = time.monotonic()
+        self._tokens = min(self.burst, self._tokens + (now - self._refilled) * self.rate)
+        self._refilled = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return 0
+        return (1 - self._tokens) / self.rate
+
+    def request(self, method, params, send):
+        """``send()`` under a slot, sharing the response with identical reads already in flight."""
+        priority = TRANSACTION if method in SEND_METHODS else current_priority()
+        if not self.coalesce or method not in COALESCED_METHODS:
+            with self.slot(priority):
+                return send()
+
+        key = (method, json.dumps(params, sort_keys=True, default=repr))
+        with self._flights_lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _InFlight()
+            else:
+                self.coalesced += 1
+        if not leader:
+            metrics.RPC_COALESCED.inc(method)
+            tracing.annotate(coalesced=True)
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            # Each caller gets its own top-level dict; outer middlewares may rewrite it
+            return dict(flight.response)
+        try:
+            with self.slot(priority):
+                flight.response = send()
+            return flight.response
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._flights_lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def middleware(self, make_request, w3):
+        def middleware_fn(method, params):
+            return self.request(method, params, lambda: make_request(method, params))
+        return middleware_fn
+
+    def stats(self):
+        with self._cond:
+            queued = [0, 0, 0]
+            for priority, _ in self._waiting:
+                queued[priority] += 1
+            running = self._running
+        return {
+            'max_concurrency': self.max_concurrency,
+            'rate': self.rate or None,
+            'running': running,
+            'queued': dict(zip(PRIORITY_NAMES, queued)),
+            'granted': dict(zip(PRIORITY_NAMES, self.granted)),
+            'avg_wait_ms': {
+                name: round(self.wait_seconds[priority] / self.granted[priority] * 1000, 3)
+                if self.granted[priority] else None
+                for priority, name in enumerate(PRIORITY_NAMES)
+            },
+            'max_wait_ms': {name: round(self.max_wait[priority] * 1000, 3)
+                            for priority, name in enumerate(PRIORITY_NAMES)},
+            'coalesced': self.coalesced
+        }
+
+
+def create_scheduler():
+    """An ``RpcScheduler`` configured from the RPC_MAX_CONCURRENCY, RPC_RATE_* and RPC_COALESCE variables."""
+    return RpcScheduler(
+        max_concurrency=int(os.getenv('RPC_MAX_CONCURRENCY', os.getenv('RPC_POOL_SIZE', '32'))),
+        rate=float(os.getenv('RPC_RATE_LIMIT', '0')),
+        burst=float(os.getenv('RPC_RATE_BURST', '0')) or None,
+        coalesce=os.getenv('RPC_COALESCE', 'true').lower() == 'true'
+    )
+
+
+# Shared by web3 and JSON-RPC batches, since both go to the same node
+SCHEDULER = create_scheduler()
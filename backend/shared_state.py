@@ -0,0 +1,201 @@
+"""State shared by the worker processes of one deployment.
+
+Under ``gunicorn -w N`` every worker imports the app by itself, so anything
+generated or held per process diverges. A JWT signed by one worker is
+rejected by another, a transaction submitted through one worker cannot be
+polled through another, two workers hand out the same nonce, and each runs
+its own indexer against the same database. ``load_secrets`` takes the
+signing secret and admin password from the environment, or from a keyfile
+the first worker creates. ``SharedState`` keeps transaction records, nonce
+counters and leases in one SQLite database in WAL mode, which every worker
+on the host opens.
+"""
+import json
+import os
+import secrets
+import sqlite3
+import tempfile
+import threading
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS transactions (
+    id TEXT PRIMARY KEY,
+    owner TEXT,
+    record TEXT NOT NULL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS transactions_finished ON transactions (finished_at);
+CREATE TABLE IF NOT EXISTS nonces (
+    address TEXT PRIMARY KEY,
+    next_nonce INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS released_nonces (
+    address TEXT NOT NULL,
+    nonce INTEGER NOT NULL,
+    PRIMARY KEY (address, nonce)
+);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+# Environment variable overriding each secret
+SECRET_ENV = {
+    'jwt_secret': 'JWT_SECRET',
+    'admin_password': 'ADMIN_PASSWORD'
+}
+
+
+def _generate_secrets():
+    return {'jwt_secret': secrets.token_hex(32), 'admin_password': secrets.token_hex(8)}
+
+
+def _read_or_create_keyfile(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        pass
+    # Written aside and linked into place, so racing workers all end up reading one file
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix='.secrets-')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(_generate_secrets(), f)
+        try:
+            os.link(temp_path, path)
+            print(f"Generated shared secrets in {path}")
+        except FileExistsError:
+            pass
+    finally:
+        os.unlink(temp_path)
+    with open(path) as f:
+        return json.load(f)
+
+
+def load_secrets(path=None):
+    """The JWT secret and admin password, as ``{'jwt_secret': ..., 'admin_password': ...}``.
+
+    JWT_SECRET and ADMIN_PASSWORD in the environment take precedence. Otherwise
+    the values come from the JSON keyfile at ``path``, created with random
+    values by whichever worker gets there first. Without a keyfile they are
+    random per process, which only suits a single process.
+    """
+    stored = _read_or_create_keyfile(path) if path else _generate_secrets()
+    return {key: os.getenv(env) or stored[key] for key, env in SECRET_ENV.items()}
+
+
+class StoredTx:
+    """A transaction record read back from the shared database."""
+
+    def __init__(self, owner, record):
+        self.owner = owner
+        self.record = record
+
+    def to_dict(self):
+        return self.record
+
+
+class SharedState:
+    """Transaction records, nonce counters and leases shared through one SQLite file."""
+
+    def __init__(self, db_path='state.db'):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._conn().executescript(SCHEMA)
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            # Autocommit, so _write can take the write lock up front with BEGIN IMMEDIATE
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute('PRAGMA synchronous=NORMAL')
+            self._local.conn = conn
+        return conn
+
+    @contextmanager
+    def _write(self):
+        """A transaction holding the database write lock from its first statement."""
+        conn = self._conn()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            yield conn
+        except BaseException:
+            conn.execute('ROLLBACK')
+            raise
+        conn.execute('COMMIT')
+
+    # Transaction records
+
+    def save_tx(self, tracked):
+        owner = None
+        if tracked.owner is not None:
+            owner = json.dumps({'role': tracked.owner['role'], 'username': tracked.owner['username']})
+        self._conn().execute(
+            'INSERT OR REPLACE INTO transactions (id, owner, record, finished_at) VALUES (?, ?, ?, ?)',
+            (tracked.id, owner, json.dumps(tracked.to_dict()), tracked.finished_at)
+        )
+
+    def get_tx(self, tx_id):
+        row = self._conn().execute('SELECT owner, record FROM transactions WHERE id = ?', (tx_id,)).fetchone()
+        if row is None:
+            return None
+        return StoredTx(json.loads(row['owner']) if row['owner'] else None, json.loads(row['record']))
+
+    def expire_txs(self, finished_before):
+        self._conn().execute('DELETE FROM transactions WHERE finished_at < ?', (finished_before,))
+
+    # Nonces
+
+    def allocate_nonce(self, address, pending_count):
+        """The next nonce for ``address``; ``pending_count()`` seeds the counter on first use."""
+        with self._write() as conn:
+            row = conn.execute('SELECT MIN(nonce) AS nonce FROM released_nonces WHERE address = ?',
+                               (address,)).fetchone()
+            if row['nonce'] is not None:
+                conn.execute('DELETE FROM released_nonces WHERE address = ? AND nonce = ?', (address, row['nonce']))
+                return row['nonce']
+            row = conn.execute('SELECT next_nonce FROM nonces WHERE address = ?', (address,)).fetchone()
+            nonce = row['next_nonce'] if row else pending_count()
+            conn.execute('INSERT OR REPLACE INTO nonces (address, next_nonce) VALUES (?, ?)', (address, nonce + 1))
+            return nonce
+
+    def release_nonce(self, address, nonce):
+        self._conn().execute('INSERT OR IGNORE INTO released_nonces (address, nonce) VALUES (?, ?)',
+                             (address, nonce))
+
+    def reset_nonce(self, address, next_nonce):
+        with self._write() as conn:
+            conn.execute('DELETE FROM released_nonces WHERE address = ?', (address,))
+            conn.execute('INSERT OR REPLACE INTO nonces (address, next_nonce) VALUES (?, ?)', (address, next_nonce))
+
+    # Leases
+
+    def hold_lease(self, name, holder, ttl):
+        """Take or renew the lease ``name`` for ``ttl`` seconds; False while another holder has it."""
+        now = time.time()
+        with self._write() as conn:
+            row = conn.execute('SELECT holder, expires_at FROM leases WHERE name = ?', (name,)).fetchone()
+            if row is not None and row['holder'] != holder and row['expires_at'] > now:
+                return False
+            if row is None or row['holder'] != holder:
+                print(f"Shared state: {holder} took the {name} lease")
+            conn.execute('INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)',
+                         (name, holder, now + ttl))
+            return True
+
+    def lease_holder(self, name):
+        row = self._conn().execute('SELECT holder, expires_at FROM leases WHERE name = ?', (name,)).fetchone()
+        return row['holder'] if row is not None and row['expires_at'] > time.time() else None
+
+
+def create_shared_state():
+    """A ``SharedState`` on SHARED_STATE_DB, or None when running as a single process."""
+    db_path = os.getenv('SHARED_STATE_DB', '')
+    return SharedState(db_path) if db_path else None
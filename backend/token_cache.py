@@ -0,0 +1,75 @@
+"""Cache of verified JWTs for ``token_required``.
+
+Verifying a token costs an HMAC plus claim parsing on every authenticated
+request. Once a token has verified, the resulting user is kept under the
+SHA-256 digest of the token until the token's ``exp``, so repeat requests
+with the same token only cost a dictionary lookup.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+# Lifetime for tokens that carry no exp claim
+DEFAULT_TTL = 300
+
+
+class TokenCache:
+    """Bounded LRU of token digest -> (user, expiry)."""
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.hit_seconds = 0.0
+        self.miss_seconds = 0.0
+
+    @staticmethod
+    def key(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, key):
+        """Cached user for ``key``, or None if absent or expired."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            user, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return user
+
+    def put(self, key, user, exp=None):
+        expires_at = exp if exp is not None else time.time() + DEFAULT_TTL
+        with self._lock:
+            self._entries[key] = (user, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def record(self, hit, seconds):
+        """Count one authentication and the time it took."""
+        with self._lock:
+            if hit:
+                self.hits += 1
+                self.hit_seconds += seconds
+            else:
+                self.misses += 1
+                self.miss_seconds += seconds
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': round(self.hits / lookups, 4) if lookups else None,
+                'avg_hit_us': round(self.hit_seconds / self.hits * 1e6, 2) if self.hits else None,
+                'avg_miss_us': round(self.miss_seconds / self.misses * 1e6, 2) if self.misses else None
+            }
@@ -0,0 +1,222 @@
+"""Per-request trace spans and the slow-request log.
+
+Every HTTP request gets a trace, a tree of timed spans held by the thread
+serving it. The layers everything goes through open spans: each JSON-RPC
+request and batch, contract calls and ABI decoding, transaction submission,
+preflight, receipt waits, password hashing and index waits. Outside a
+request, or with tracing off, ``span`` costs one thread-local lookup.
+
+Requests slower than the threshold are printed with their span tree, where
+repeated siblings such as a hundred ``getVoucherDetails`` calls are folded
+into one line with a count. The most recent ones are kept for
+``/api/admin/slow-requests``.
+"""
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+from flask import g, request
+
+import metrics
+
+# Spans recorded per request; later ones only add to the dropped count
+MAX_SPANS = 2000
+
+_local = threading.local()
+
+
+class Span:
+    __slots__ = ('name', 'label', 'attrs', 'start', 'seconds', 'children')
+
+    def __init__(self, name, label=None, attrs=None):
+        self.name = name
+        self.label = label
+        self.attrs = attrs
+        self.start = time.perf_counter()
+        self.seconds = None
+        self.children = []
+
+
+class _Trace:
+    __slots__ = ('root', 'stack', 'spans', 'dropped')
+
+    def __init__(self, root):
+        self.root = root
+        self.stack = [root]
+        self.spans = 1
+        self.dropped = 0
+
+
+@contextmanager
+def span(name, label=None, **attrs):
+    """Time the enclosed block as a child of the current span, if this thread is tracing."""
+    trace = getattr(_local, 'trace', None)
+    if trace is None:
+        yield None
+        return
+    if trace.spans >= MAX_SPANS:
+        trace.dropped += 1
+        yield None
+        return
+    child = Span(name, label, attrs or None)
+    trace.stack[-1].children.append(child)
+    trace.stack.append(child)
+    trace.spans += 1
+    try:
+        yield child
+    finally:
+        child.seconds = time.perf_counter() - child.start
+        trace.stack.pop()
+
+
+def active():
+    """True if this thread is recording a trace."""
+    return getattr(_local, 'trace', None) is not None
+
+
+@contextmanager
+def collect(name, enabled=True):
+    """Trace the enclosed block, run on a worker thread, as a span of its own to ``attach`` later."""
+    if not enabled:
+        yield None
+        return
+    previous = getattr(_local, 'trace', None)
+    trace = _local.trace = _Trace(Span(name))
+    try:
+        yield trace.root
+    finally:
+        trace.root.seconds = time.perf_counter() - trace.root.start
+        _local.trace = previous
+
+
+def attach(child):
+    """Add a span from ``collect`` under the innermost open span of this thread's trace."""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None and child is not None:
+        trace.stack[-1].children.append(child)
+
+
+def annotate(**attrs):
+    """Add attributes to the innermost open span of this thread's trace."""
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        current = trace.stack[-1]
+        current.attrs = dict(current.attrs or {}, **attrs)
+
+
+def rpc_middleware(make_request, w3):
+    """web3 middleware opening an ``rpc`` span per request, labelled with the contract function."""
+    def middleware(method, params):
+        if getattr(_local, 'trace', None) is None:
+            return make_request(method, params)
+        function = metrics.contract_function(method, params)
+        with span('rpc', f'{method} {function[0]}.{function[1]}' if function else method):
+            return make_request(method, params)
+    return middleware
+
+
+def _fold(spans):
+    """Siblings grouped by name and label, in first-seen order, with their children folded together."""
+    groups = {}
+    for child in spans:
+        group = groups.get((child.name, child.label))
+        if group is None:
+            group = groups[(child.name, child.label)] = {
+                'name': child.name, 'label': child.label, 'count': 0, 'ms': 0.0, 'max_ms': 0.0,
+                'attrs': child.attrs, 'children': []
+            }
+        ms = (child.seconds or 0.0) * 1000
+        group['count'] += 1
+        group['ms'] += ms
+        group['max_ms'] = max(group['max_ms'], ms)
+        group['children'].extend(child.children)
+    for group in groups.values():
+        group['ms'] = round(group['ms'], 3)
+        group['max_ms'] = round(group['max_ms'], 3)
+        if group['count'] > 1:
+            # Attributes of one of many calls would mislead
+            group['attrs'] = None
+        group['children'] = _fold(group['children'])
+    return list(groups.values())
+
+
+def _format(groups, depth, lines):
+    for group in groups:
+        text = f"{'  ' * depth}{group['name']}"
+        if group['label']:
+            text += f" {group['label']}"
+        if group['count'] > 1:
+            text += f" x{group['count']} {group['ms']:.1f} ms (max {group['max_ms']:.1f})"
+        else:
+            text += f" {group['ms']:.1f} ms"
+        if group['attrs']:
+            text += ' ' + ' '.join(f'{key}={value}' for key, value in group['attrs'].items())
+        lines.append(text)
+        _format(group['children'], depth + 1, lines)
+
+
+class SlowRequestLog:
+    """Traces requests and keeps the span trees of those slower than ``threshold_ms``."""
+
+    def __init__(self, threshold_ms=500, size=100):
+        self.threshold_ms = threshold_ms
+        self.entries = deque(maxlen=size)
+        self.traced = 0
+        self.slow = 0
+
+    def instrument(self, app):
+        @app.before_request
+        def start_trace():
+            _local.trace = _Trace(Span('request'))
+
+        @app.after_request
+        def record_status(response):
+            g.trace_status = response.status_code
+            return response
+
+        @app.teardown_request
+        def finish_trace(error):
+            trace = getattr(_local, 'trace', None)
+            _local.trace = None
+            if trace is None:
+                return
+            self.traced += 1
+            seconds = time.perf_counter() - trace.root.start
+            if seconds * 1000 >= self.threshold_ms:
+                trace.root.seconds = seconds
+                self._record(trace, g.pop('trace_status', 500))
+
+    def _record(self, trace, status):
+        self.slow += 1
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        ms = round(trace.root.seconds * 1000, 3)
+        spans = _fold(trace.root.children)
+        lines = [f"Slow request: {request.method} {request.path} ({route}) {status} {ms:.1f} ms"]
+        _format(spans, 1, lines)
+        if trace.dropped:
+            lines.append(f"  ... {trace.dropped} more spans not recorded")
+        print('\n'.join(lines))
+        self.entries.append({
+            'at': datetime.utcnow().isoformat() + 'Z',
+            'method': request.method,
+            'path': request.path,
+            'route': route,
+            'status': status,
+            'ms': ms,
+            'spans': spans,
+            'dropped_spans': trace.dropped
+        })
+
+    def recent(self, limit=None):
+        entries = list(self.entries)[::-1]
+        return entries[:limit] if limit is not None else entries
+
+    def stats(self):
+        return {
+            'threshold_ms': self.threshold_ms,
+            'traced': self.traced,
+            'slow': self.slow,
+            'kept': len(self.entries)
+        }
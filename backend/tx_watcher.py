@@ -0,0 +1,197 @@
+"""Shared receipt watcher for transactions submitted by the write routes.
+
+Routes hand their transaction hash to the watcher instead of each polling
+``wait_for_transaction_receipt``. On every new block the watcher fetches the
+receipts of all pending transactions in one JSON-RPC batch, runs the
+post-processing registered for the transaction kind and wakes any request
+still waiting on it. Finished records stay queryable for ``record_ttl``
+seconds so clients can poll ``/api/tx/<id>``. Given a ``SharedState``,
+records are also written there, so any worker process can answer the poll.
+"""
+import threading
+import time
+import uuid
+
+from web3._utils.method_formatters import receipt_formatter
+from web3.datastructures import AttributeDict
+from web3.exceptions import TimeExhausted
+
+import metrics
+import tracing
+from rpc_batch import batch_request
+from rpc_scheduler import READ, rpc_priority
+
+
+class TrackedTx:
+    """A submitted transaction and, once mined, its receipt and results."""
+
+    def __init__(self, tx_hash, kind, owner=None, context=None):
+        self.id = uuid.uuid4().hex
+        self.tx_hash = tx_hash
+        self.kind = kind
+        self.owner = owner
+        self.context = context or {}
+        self.status = 'pending'
+        self.receipt = None
+        self.result = {}
+        self.error = None
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._done = threading.Event()
+
+    def to_dict(self):
+        data = {
+            'tx_id': self.id,
+            'tx_hash': self.tx_hash,
+            'kind': self.kind,
+            'status': self.status,
+            'submitted_at': self.submitted_at,
+            'finished_at': self.finished_at
+        }
+        if self.receipt is not None:
+            data['block_number'] = self.receipt.blockNumber
+            data['gas_used'] = self.receipt.gasUsed
+        if self.error:
+            data['error'] = self.error
+        data.update(self.result)
+        return data
+
+
+class TxWatcher:
+    """Resolves the receipts of all pending transactions once per new block."""
+
+    def __init__(self, w3, head, timeout=120, record_ttl=3600, store=None):
+        self.w3 = w3
+        self.head = head
+        self.timeout = timeout
+        self.record_ttl = record_ttl
+        self.store = store
+        self._handlers = {}
+        self._drop_handlers = []
+        self._receipt_listeners = []
+        self._records = {}
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._subscribed = False
+
+    def register_handler(self, kind, handler):
+        """Run ``handler(receipt, tracked)`` for mined transactions of ``kind``.
+
+        The returned dict is merged into the tracked transaction's result.
+        """
+        self._handlers[kind] = handler
+
+    def register_drop_handler(self, handler):
+        """Run ``handler(tracked)`` when a transaction is given up on as dropped."""
+        self._drop_handlers.append(handler)
+
+    def register_receipt_listener(self, listener):
+        """Run ``listener(receipt)`` for every mined transaction, successful or not.
+
+        A listener may return a message explaining why a failed transaction failed, used as its error.
+        """
+        self._receipt_listeners.append(listener)
+
+    def track(self, tx_hash, kind, owner=None, **context):
+        if not isinstance(tx_hash, str):
+            tx_hash = tx_hash.hex()
+        tracked = TrackedTx(tx_hash, kind, owner, context)
+        with self._lock:
+            self._records[tracked.id] = tracked
+            self._pending[tracked.id] = tracked
+            if not self._subscribed:
+                self.head.subscribe(self._on_block)
+                self._subscribed = True
+        self._save(tracked)
+        self.head.poke()
+        return tracked
+
+    def get(self, tx_id):
+        tracked = self._records.get(tx_id)
+        if tracked is None and self.store is not None:
+            # Submitted through another worker process
+            return self.store.get_tx(tx_id)
+        return tracked
+
+    def _save(self, tracked):
+        if self.store is None:
+            return
+        try:
+            self.store.save_tx(tracked)
+        except Exception as e:
+            print(f"Tx watcher: could not save {tracked.tx_hash} to shared state: {e}")
+
+    def wait(self, tracked, timeout=None):
+        """Block until ``tracked`` is mined and return its receipt."""
+        with tracing.span('tx.wait_receipt', tracked.kind):
+            mined = tracked._done.wait(timeout or self.timeout)
+        if not mined:
+            raise TimeExhausted(f"Transaction {tracked.tx_hash} is not in the chain after {timeout or self.timeout} seconds")
+        if tracked.receipt is None:
+            raise TimeExhausted(f"Transaction {tracked.tx_hash} was not mined: {tracked.error}")
+        return tracked.receipt
+
+    def _on_block(self, block_number):
+        with self._lock:
+            pending = list(self._pending.values())
+        if pending:
+            # Write routes may be blocked on these receipts, so they queue as reads rather than background work
+            with rpc_priority(READ):
+                results = batch_request(self.w3, [
+                    ('eth_getTransactionReceipt', [tracked.tx_hash]) for tracked in pending
+                ])
+            now = time.time()
+            for tracked, result in zip(pending, results):
+                if isinstance(result, Exception):
+                    print(f"Tx watcher: error fetching receipt for {tracked.tx_hash}: {result}")
+                elif result is not None:
+                    self._resolve(tracked, AttributeDict.recursive(receipt_formatter(result)))
+                elif now - tracked.submitted_at > self.timeout:
+                    self._finish(tracked, 'timeout', error='Transaction was not mined in time')
+                    for handler in self._drop_handlers:
+                        try:
+                            handler(tracked)
+                        except Exception as e:
+                            print(f"Tx watcher: drop handler failed for {tracked.tx_hash}: {e}")
+        self._expire()
+
+    def _resolve(self, tracked, receipt):
+        tracked.receipt = receipt
+        error = 'Transaction reverted'
+        for listener in self._receipt_listeners:
+            try:
+                error = listener(receipt) or error
+            except Exception as e:
+                print(f"Tx watcher: receipt listener failed for {tracked.tx_hash}: {e}")
+        if receipt.status != 1:
+            self._finish(tracked, 'failed', error=error)
+            return
+        handler = self._handlers.get(tracked.kind)
+        if handler is not None:
+            try:
+                tracked.result.update(handler(receipt, tracked) or {})
+            except Exception as e:
+                print(f"Tx watcher: post-processing {tracked.kind} {tracked.tx_hash} failed: {e}")
+        self._finish(tracked, 'confirmed')
+
+    def _finish(self, tracked, status, error=None):
+        tracked.status = status
+        tracked.error = error
+        tracked.finished_at = time.time()
+        with self._lock:
+            self._pending.pop(tracked.id, None)
+        self._save(tracked)
+        metrics.record_transaction(tracked)
+        tracked._done.set()
+
+    def _expire(self):
+        cutoff = time.time() - self.record_ttl
+        with self._lock:
+            for tx_id, tracked in list(self._records.items()):
+                if tracked.finished_at is not None and tracked.finished_at < cutoff:
+                    del self._records[tx_id]
+        if self.store is not None:
+            try:
+                self.store.expire_txs(cutoff)
+            except Exception as e:
+                print(f"Tx watcher: could not expire shared records: {e}")
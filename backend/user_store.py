@@ -0,0 +1,125 @@
+"""Persistent storage for customer and business accounts.
+
+``SQLiteUserStore`` keeps them in a local SQLite file. Usernames and
+checksum addresses are unique per role and both are indexed, so logins and
+address-to-account lookups (e.g. resolving the customer of a
+``VoucherRedeemed`` event) are single index seeks. Listing is
+keyset-paginated on the row id so a page costs the same at any offset.
+"""
+import os
+import queue
+import sqlite3
+import time
+from contextlib import contextmanager
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS users (
+    id INTEGER PRIMARY KEY,
+    role TEXT NOT NULL,
+    username TEXT NOT NULL,
+    address TEXT NOT NULL,
+    password_hash TEXT NOT NULL,
+    name TEXT,
+    created_at REAL NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS users_role_username ON users (role, username);
+CREATE UNIQUE INDEX IF NOT EXISTS users_role_address ON users (role, address);
+CREATE INDEX IF NOT EXISTS users_role_id ON users (role, id);
+"""
+
+COLUMNS = 'id, role, username, address, password_hash, name, created_at'
+
+
+class DuplicateUserError(ValueError):
+    """Raised when a username or address is already registered for the role."""
+
+    def __init__(self, field):
+        super().__init__(f'{field} already registered')
+        self.field = field
+
+
+class SQLiteUserStore:
+    """Account storage in a SQLite file, with a small connection pool.
+
+    Users are returned as dicts with ``id``, ``role``, ``username``,
+    ``address``, ``password_hash``, ``name`` and ``created_at``.
+    """
+
+    def __init__(self, db_path='users.db', pool_size=8):
+        self.db_path = db_path
+        self._pool = queue.LifoQueue()
+        for _ in range(pool_size):
+            self._pool.put(self._connect())
+        with self._connection() as conn:
+            conn.executescript(SCHEMA)
+
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        return conn
+
+    @contextmanager
+    def _connection(self):
+        conn = self._pool.get()
+        try:
+            with conn:
+                yield conn
+        finally:
+            self._pool.put(conn)
+
+    def add(self, role, username, password_hash, address, name=None):
+        """Insert a user and return its id, or raise ``DuplicateUserError``."""
+        try:
+            with self._connection() as conn:
+                cursor = conn.execute(
+                    'INSERT INTO users (role, username, address, password_hash, name, created_at) '
+                    'VALUES (?, ?, ?, ?, ?, ?)',
+                    (role, username, address, password_hash, name, time.time())
+                )
+                return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            # Report the username first when both are taken
+            raise DuplicateUserError('Username' if self.get(role, username) else 'Address') from None
+
+    def get(self, role, username):
+        with self._connection() as conn:
+            row = conn.execute(
+                f'SELECT {COLUMNS} FROM users WHERE role = ? AND username = ?', (role, username)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def get_by_address(self, role, address):
+        with self._connection() as conn:
+            row = conn.execute(
+                f'SELECT {COLUMNS} FROM users WHERE role = ? AND address = ?', (role, address)
+            ).fetchone()
+        return dict(row) if row else None
+
+    def update_password_hash(self, role, username, password_hash):
+        with self._connection() as conn:
+            conn.execute(
+                'UPDATE users SET password_hash = ? WHERE role = ? AND username = ?',
+                (password_hash, role, username)
+            )
+
+    def list_users(self, role, after_id=0, limit=100):
+        """Users of ``role`` with an id greater than ``after_id``, in id order."""
+        with self._connection() as conn:
+            rows = conn.execute(
+                f'SELECT {COLUMNS} FROM users WHERE role = ? AND id > ? ORDER BY id LIMIT ?',
+                (role, after_id, limit)
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+
+def create_user_store():
+    """Build the user store selected by the USER_STORE_* environment variables."""
+    backend = os.getenv('USER_STORE_BACKEND', 'sqlite')
+    if backend == 'sqlite':
+        return SQLiteUserStore(
+            db_path=os.getenv('USER_DB_PATH', 'users.db'),
+            pool_size=int(os.getenv('USER_DB_POOL_SIZE', '8'))
+        )
+    raise ValueError(f'Unknown USER_STORE_BACKEND: {backend}')
@@ -0,0 +1,202 @@
+"""Read-through cache for contract view calls, keyed on the block number.
+
+A view call's result cannot change within a block, so results are cached
+under ``(contract, function, args, block)`` and every call is pinned to the
+block the shared ``ChainHead`` last saw, re-read if older than
+``max_head_age`` seconds. When a new block arrives, older entries stop being
+read and are dropped. Concurrent lookups of the same key, single or batched,
+wait for the one RPC already in flight instead of issuing their own. The
+cache is bounded by an entry count and an approximate memory budget, with
+LRU eviction.
+"""
+import sys
+import threading
+from collections import OrderedDict
+
+from rpc_batch import batch_call
+
+
+class _InFlight:
+    __slots__ = ('event', 'value', 'error')
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.value = None
+        self.error = None
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((key, _freeze(item)) for key, item in value.items()))
+    return value
+
+
+def _sizeof(value):
+    size = sys.getsizeof(value)
+    if isinstance(value, (list, tuple)):
+        size += sum(_sizeof(item) for item in value)
+    return size
+
+
+class ViewCache:
+    """Memoizes contract view calls per block with LRU eviction."""
+
+    def __init__(self, head, max_entries=50000, max_bytes=64 * 1024 * 1024, max_head_age=0.5):
+        self.head = head
+        self.max_head_age = max_head_age
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._in_flight = {}
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self.uncached = 0
+        head.subscribe(self._on_block)
+
+    @staticmethod
+    def key(fn, block_number):
+        return (fn.address, fn.fn_name, _freeze(fn.args), block_number)
+
+    def call(self, fn):
+        """``fn.call()`` for a bound contract function, served from cache when possible."""
+        block_number = self.head.current(self.max_head_age)
+        if block_number is None:
+            # Head not known yet, nothing to key on
+            self.uncached += 1
+            return fn.call()
+
+        key = self.key(fn, block_number)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0]
+            waiter = self._in_flight.get(key)
+            leader = waiter is None
+            if leader:
+                waiter = self._in_flight[key] = _InFlight()
+                self.misses += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            waiter.event.wait()
+            if waiter.error is not None:
+                raise waiter.error
+            return waiter.value
+
+        try:
+            waiter.value = fn.call(block_identifier=block_number)
+            self._store(key, waiter.value)
+            return waiter.value
+        except Exception as e:
+            waiter.error = e
+            raise
+        finally:
+            with self._lock:
+                self._in_flight.pop(key, None)
+            waiter.event.set()
+
+    def call_many(self, w3, fns):
+        """Like ``batch_call`` but only misses nobody is fetching yet go to the node."""
+        fns = list(fns)
+        block_number = self.head.current(self.max_head_age)
+        if block_number is None:
+            self.uncached += len(fns)
+            return batch_call(w3, fns)
+
+        results = [None] * len(fns)
+        # key -> (in-flight entry this call fetches, positions it fills)
+        owned = {}
+        # (position, in-flight entry another call is fetching)
+        waiting = []
+        with self._lock:
+            for i, fn in enumerate(fns):
+                key = self.key(fn, block_number)
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    results[i] = self._entries[key][0]
+                    self.hits += 1
+                elif key in owned:
+                    owned[key][1].append(i)
+                    self.coalesced += 1
+                elif key in self._in_flight:
+                    waiting.append((i, self._in_flight[key]))
+                    self.coalesced += 1
+                else:
+                    owned[key] = (self._in_flight.setdefault(key, _InFlight()), [i])
+                    self.misses += 1
+
+        # Fetched before waiting on anyone else, so two batches never wait on each other
+        if owned:
+            keys = list(owned)
+            try:
+                fetched = batch_call(w3, [fns[owned[key][1][0]] for key in keys], block_identifier=block_number)
+            except Exception as e:
+                for key in keys:
+                    owned[key][0].error = e
+                raise
+            else:
+                for key, value in zip(keys, fetched):
+                    waiter, positions = owned[key]
+                    if isinstance(value, Exception):
+                        waiter.error = value
+                    else:
+                        waiter.value = value
+                        self._store(key, value)
+                    for i in positions:
+                        results[i] = value
+            finally:
+                with self._lock:
+                    for key in keys:
+                        self._in_flight.pop(key, None)
+                for waiter, _ in owned.values():
+                    waiter.event.set()
+
+        for i, waiter in waiting:
+            waiter.event.wait()
+            results[i] = waiter.error if waiter.error is not None else waiter.value
+        return results
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses + self.coalesced
+            return {
+                'entries': len(self._entries),
+                'approx_bytes': self._bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'uncached': self.uncached,
+                'evictions': self.evictions,
+                'hit_ratio': round((self.hits + self.coalesced) / lookups, 4) if lookups else None,
+                'block_number': self.head.block_number
+            }
+
+    def _store(self, key, value):
+        size = _sizeof(value) + _sizeof(key)
+        with self._lock:
+            if key in self._entries:
+                return
+            self._entries[key] = (value, size)
+            self._bytes += size
+            while self._entries and (len(self._entries) > self.max_entries or self._bytes > self.max_bytes):
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.evictions += 1
+
+    def _on_block(self, block_number):
+        # Entries for earlier blocks can never be hit again
+        with self._lock:
+            stale = [key for key in self._entries if key[3] < block_number]
+            for key in stale:
+                _, size = self._entries.pop(key)
+                self._bytes -= size
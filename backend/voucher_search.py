@@ -0,0 +1,228 @@
+"""In-process search over the voucher catalog.
+
+Kept in memory next to the event indexer and updated from it: every voucher
+created or toggled is pushed here once its block is indexed, and a reorg
+rollback reloads everything from the index database. Words of ``title`` and
+``description`` map to the ids containing them (an inverted index), vouchers
+are grouped per business, and point costs sit in two parallel arrays sorted
+by ``(pointCost, id)`` so a cost range is a pair of bisections. A query
+intersects the smallest of these sets first and never touches the chain.
+"""
+import heapq
+import re
+import threading
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+
+# The cost index holds signed 64-bit integers; larger costs sort as this
+MAX_INDEXED_COST = 2 ** 63 - 1
+
+SORT_ORDERS = ('id', 'pointCost')
+
+_WORD = re.compile(r'[a-z0-9]+')
+
+
+def tokenize(text):
+    """Lower-cased alphanumeric words of ``text``."""
+    return _WORD.findall(text.lower())
+
+
+class _Voucher:
+    __slots__ = ('id', 'business', 'title', 'description', 'point_cost', 'is_active')
+
+    def __init__(self, voucher):
+        self.id = voucher['id']
+        self.business = voucher['businessAddress']
+        self.title = voucher['title']
+        self.description = voucher['description']
+        self.point_cost = voucher['pointCost']
+        self.is_active = voucher['isActive']
+
+    def as_dict(self):
+        return {
+            'id': self.id,
+            'title': self.title,
+            'description': self.description,
+            'pointCost': self.point_cost,
+            'businessAddress': self.business,
+            'isActive': self.is_active
+        }
+
+
+class VoucherSearch:
+    """Inverted, cost and per-business indexes over the vouchers the event indexer has seen."""
+
+    def __init__(self):
+        self._vouchers = {}
+        self._active = set()
+        self._terms = {}
+        self._by_business = {}
+        self._approved = set()
+        self._costs = array('q')
+        self._cost_ids = array('q')
+        self._indexer = None
+        self._lock = threading.Lock()
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def attach(self, indexer):
+        """Follow ``indexer`` from now on, starting from what it has already stored."""
+        self._indexer = indexer
+        indexer.voucher_listeners.append(self.upsert)
+        indexer.approval_listeners.append(self.business_approved)
+        indexer.rollback_listeners.append(self.reload)
+        self.reload()
+
+    def reload(self):
+        """Rebuild every index from the event indexer's database."""
+        with self._lock:
+            # Read under the lock so updates pushed meanwhile are applied after, not overwritten
+            vouchers = self._indexer.all_vouchers()
+            approved = self._indexer.approved_businesses()
+            self._vouchers = {}
+            self._active = set()
+            self._terms = {}
+            self._by_business = {}
+            self._approved = set(approved)
+            for voucher in vouchers:
+                self._add(_Voucher(voucher), sorted_insert=False)
+            # Sorted once at the end rather than shifting the arrays on every insert
+            order = sorted((min(record.point_cost, MAX_INDEXED_COST), record.id)
+                           for record in self._vouchers.values())
+            self._costs = array('q', (point_cost for point_cost, _ in order))
+            self._cost_ids = array('q', (voucher_id for _, voucher_id in order))
+
+    def upsert(self, voucher):
+        """Index a voucher dict, replacing an earlier version with the same id."""
+        with self._lock:
+            current = self._vouchers.get(voucher['id'])
+            if current is not None:
+                if (current.title, current.description, current.point_cost) == \
+                        (voucher['title'], voucher['description'], voucher['pointCost']):
+                    # Only the status changed, which is all VoucherStatusChanged can do
+                    current.is_active = voucher['isActive']
+                    if current.is_active:
+                        self._active.add(current.id)
+                    else:
+                        self._active.discard(current.id)
+                    return
+                self._remove(current)
+            self._add(_Voucher(voucher))
+
+    def business_approved(self, address):
+        with self._lock:
+            self._approved.add(address)
+
+    def _add(self, record, sorted_insert=True):
+        self._vouchers[record.id] = record
+        if record.is_active:
+            self._active.add(record.id)
+        for term in set(tokenize(record.title) + tokenize(record.description)):
+            self._terms.setdefault(term, set()).add(record.id)
+        self._by_business.setdefault(record.business, set()).add(record.id)
+        if not sorted_insert:
+            return
+        position = self._cost_position(record.point_cost, record.id)
+        self._costs.insert(position, min(record.point_cost, MAX_INDEXED_COST))
+        self._cost_ids.insert(position, record.id)
+
+    def _remove(self, record):
+        del self._vouchers[record.id]
+        self._active.discard(record.id)
+        for term in set(tokenize(record.title) + tokenize(record.description)):
+            ids = self._terms[term]
+            ids.discard(record.id)
+            if not ids:
+                del self._terms[term]
+        self._by_business[record.business].discard(record.id)
+        position = self._cost_position(record.point_cost, record.id)
+        del self._costs[position]
+        del self._cost_ids[position]
+
+    def _cost_position(self, point_cost, voucher_id):
+        # Ids ascend within a run of equal costs
+        point_cost = min(point_cost, MAX_INDEXED_COST)
+        lo = bisect_left(self._costs, point_cost)
+        hi = bisect_right(self._costs, point_cost, lo)
+        return bisect_left(self._cost_ids, voucher_id, lo, hi)
+
+    # Queries
+
+    def match(self, text='', min_cost=None, max_cost=None, business=None, approved_only=False):
+        """Ids of active vouchers with every word of ``text`` and the other filters."""
+        start = time.perf_counter()
+        with self._lock:
+            sets = [self._active]
+            for term in set(tokenize(text)):
+                sets.append(self._terms.get(term, set()))
+            if business is not None:
+                sets.append(self._by_business.get(business, set()))
+            sets.sort(key=len)
+
+            cost_range = min_cost is not None or max_cost is not None
+            if cost_range:
+                lo = 0 if min_cost is None else bisect_left(self._costs, min(min_cost, MAX_INDEXED_COST))
+                hi = len(self._costs) if max_cost is None else \
+                    bisect_right(self._costs, min(max_cost, MAX_INDEXED_COST))
+                if hi - lo < len(sets[0]):
+                    # The cost slice is the most selective filter, so it goes first
+                    sets.insert(0, set(self._cost_ids[lo:hi]))
+                    cost_range = False
+            ids = sets[0].intersection(*sets[1:]) if len(sets) > 1 else set(sets[0])
+
+            if ids and cost_range:
+                low = -1 if min_cost is None else min_cost
+                ids = {voucher_id for voucher_id in ids
+                       if low <= self._vouchers[voucher_id].point_cost and
+                       (max_cost is None or self._vouchers[voucher_id].point_cost <= max_cost)}
+            if approved_only:
+                ids = {voucher_id for voucher_id in ids if self._vouchers[voucher_id].business in self._approved}
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - start
+        return ids
+
+    def page(self, ids, after_id=0, limit=None, sort='id'):
+        """Up to ``limit`` of the vouchers in ``ids`` after the one with id ``after_id``, in ``sort`` order.
+
+        Sorted by point cost, the cursor is still a voucher id: the page
+        resumes after that voucher's ``(pointCost, id)``, and is empty if
+        that voucher is not indexed (see ``has_voucher``).
+        """
+        with self._lock:
+            vouchers = self._vouchers
+            # A reload may have replaced the vouchers since ``ids`` was matched
+            ids = (voucher_id for voucher_id in ids if voucher_id in vouchers)
+            if sort == 'id':
+                candidates = (voucher_id for voucher_id in ids if voucher_id > after_id)
+                key = None
+            else:
+                def key(voucher_id):
+                    return vouchers[voucher_id].point_cost, voucher_id
+                if not after_id:
+                    candidates = ids
+                elif after_id in vouchers:
+                    cursor = key(after_id)
+                    candidates = (voucher_id for voucher_id in ids if key(voucher_id) > cursor)
+                else:
+                    # Starting over would repeat the pages already served
+                    return []
+            if limit is None:
+                chosen = sorted(candidates, key=key)
+            else:
+                chosen = heapq.nsmallest(limit, candidates, key=key)
+            return [vouchers[voucher_id].as_dict() for voucher_id in chosen]
+
+    def has_voucher(self, voucher_id):
+        """Whether ``voucher_id`` is indexed, and so usable as a ``pointCost`` cursor."""
+        return voucher_id in self._vouchers
+
+    def stats(self):
+        return {
+            'vouchers': len(self._vouchers),
+            'active': len(self._active),
+            'terms': len(self._terms),
+            'businesses': len(self._by_business),
+            'queries': self.queries,
+            'avg_query_us': round(self.query_seconds / self.queries * 1e6, 2) if self.queries else None
+        }
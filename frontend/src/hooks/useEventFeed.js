@@ -0,0 +1,68 @@
+import { useEffect, useRef } from 'react';
+import axios from 'axios';
+
+// Subscribes to the backend's server-sent event feed while the component is mounted.
+// `handlers` maps event types (e.g. 'balance', 'voucher_created') to callbacks taking the event data.
+const useEventFeed = (handlers) => {
+  const handlersRef = useRef(handlers);
+  handlersRef.current = handlers;
+
+  useEffect(() => {
+    if (!localStorage.getItem('token')) {
+      return undefined;
+    }
+
+    let source = null;
+    let retryTimer = null;
+    let closed = false;
+
+    const retry = () => {
+      if (!closed) {
+        retryTimer = setTimeout(connect, 3000);
+      }
+    };
+
+    // EventSource cannot send an Authorization header, so each connection opens with a
+    // short-lived, single-use ticket instead of the login token
+    const connect = async () => {
+      let ticket;
+      try {
+        const response = await axios.post('/api/events/ticket');
+        ticket = response.data.ticket;
+      } catch (error) {
+        retry();
+        return;
+      }
+      if (closed) {
+        return;
+      }
+
+      source = new EventSource(`/api/events?ticket=${encodeURIComponent(ticket)}`);
+      Object.keys(handlersRef.current).forEach(type => {
+        source.addEventListener(type, (event) => {
+          const handler = handlersRef.current[type];
+          if (handler) {
+            handler(JSON.parse(event.data));
+          }
+        });
+      });
+      // A reconnect would reuse the spent ticket, so reconnect with a new one instead
+      source.onerror = () => {
+        source.close();
+        retry();
+      };
+    };
+
+    connect();
+
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      if (source) {
+        source.close();
+      }
+    };
+  }, []);
+};
+
+export default useEventFeed;
@@ -2,12 +2,16 @@ import React, { useState, useEffect } from 'react';
 import { Card, Row, Col, Button, Alert, Spinner, Table, Badge } from 'react-bootstrap';
 import axios from 'axios';
 import { useAuth } from '../../context/AuthContext';
+import useEventFeed from '../../hooks/useEventFeed';
+import { fetchAllPages } from '../../utils/pagination';
 
 const AdminDashboard = () => {
   const [businesses, setBusinesses] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
+  const [approved, setApproved] = useState({});
+  const [reloadKey, setReloadKey] = useState(0);
   
   const { user } = useAuth();
   
@@ -17,8 +21,7 @@ const AdminDashboard = () => {
       setError('');
       
       try {
-        const response = await axios.get('/api/admin/businesses');
-        setBusinesses(response.data);
+        setBusinesses(await fetchAllPages('/api/admin/businesses'));
       } catch (error) {
         setError('Error fetching businesses: ' + (error.response?.data?.message || error.message));
       } finally {
@@ -27,7 +30,16 @@ const AdminDashboard = () => {
     };
     
     fetchBusinesses();
-  }, []);
+  }, [reloadKey]);
+  
+  // New sign-ups and approvals are pushed by the server instead of refetched
+  useEventFeed({
+    business_signed_up: (business) => {
+      setBusinesses(current => (current.some(b => b.id === business.id) ? current : [...current, business]));
+    },
+    business_approved: (data) => setApproved(current => ({ ...current, [data.address]: true })),
+    resync: () => setReloadKey(key => key + 1)
+  });
   
   const handleApproveBusiness = async (businessAddress) => {
     try {
@@ -36,9 +48,7 @@ const AdminDashboard = () => {
       
       await axios.post('/api/admin/approve-business', { address: businessAddress });
       
-      // Refresh businesses list
-      const response = await axios.get('/api/admin/businesses');
-      setBusinesses(response.data);
+      // The approval shows up through the event feed
       
       setSuccess('Business approved successfully!');
     } catch (error) {
@@ -96,7 +106,11 @@ const AdminDashboard = () => {
                           </small>
                         </td>
                         <td>
-                          <Badge bg="primary">Registered</Badge>
+                          {approved[business.address] ? (
+                            <Badge bg="success">Approved</Badge>
+                          ) : (
+                            <Badge bg="primary">Registered</Badge>
+                          )}
                         </td>
                         <td>
                           <Button 
@@ -2,6 +2,8 @@ import React, { useState, useEffect } from 'react';
 import { Card, Row, Col, Button, Alert, Spinner, Badge, Form, Modal } from 'react-bootstrap';
 import axios from 'axios';
 import { useAuth } from '../../context/AuthContext';
+import useEventFeed from '../../hooks/useEventFeed';
+import { fetchAllPages } from '../../utils/pagination';
 
 const BusinessDashboard = () => {
   const [vouchers, setVouchers] = useState([]);
@@ -51,8 +53,7 @@ const BusinessDashboard = () => {
     
     const fetchVouchers = async () => {
       try {
-        const response = await axios.get('/api/business/vouchers');
-        setVouchers(response.data);
+        setVouchers(await fetchAllPages('/api/business/vouchers'));
         setLoading(false);
       } catch (error) {
         setError('Error fetching vouchers: ' + (error.response?.data?.message || error.message));
@@ -63,6 +64,25 @@ const BusinessDashboard = () => {
     fetchBusinessStatus();
   }, []);
   
+  // Voucher changes are pushed by the server instead of refetched after every action
+  const upsertVoucher = (voucher) => {
+    setVouchers(current => current.some(v => v.id === voucher.id)
+      ? current.map(v => (v.id === voucher.id ? voucher : v))
+      : [...current, voucher]);
+  };
+  
+  useEventFeed({
+    voucher_created: upsertVoucher,
+    voucher_status_changed: upsertVoucher,
+    business_approved: () => {
+      setIsRegistered(true);
+      setIsApproved(true);
+    },
+    resync: async () => {
+      setVouchers(await fetchAllPages('/api/business/vouchers'));
+    }
+  });
+  
   const handleRegisterBusiness = async () => {
     try {
       setError('');
@@ -90,15 +110,13 @@ const BusinessDashboard = () => {
         return;
       }
       
-      const response = await axios.post('/api/business/create-voucher', {
+      await axios.post('/api/business/create-voucher', {
         title,
         description,
         pointCost
       });
       
-      // Refresh vouchers list
-      const vouchersResponse = await axios.get('/api/business/vouchers');
-      setVouchers(vouchersResponse.data);
+      // The new voucher arrives over the event feed
       
       // Clear form and close modal
       setTitle('');
@@ -119,9 +137,7 @@ const BusinessDashboard = () => {
       
       await axios.post(`/api/business/toggle-voucher/${voucherId}`);
       
-      // Refresh vouchers list
-      const response = await axios.get('/api/business/vouchers');
-      setVouchers(response.data);
+      // The updated status arrives over the event feed
       
       setSuccess('Voucher status updated successfully!');
     } catch (error) {
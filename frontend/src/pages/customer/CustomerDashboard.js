@@ -2,6 +2,8 @@ import React, { useState, useEffect } from 'react';
 import { Card, Row, Col, Button, Alert, Spinner, Badge } from 'react-bootstrap';
 import axios from 'axios';
 import { useAuth } from '../../context/AuthContext';
+import useEventFeed from '../../hooks/useEventFeed';
+import { fetchAllPages } from '../../utils/pagination';
 
 const CustomerDashboard = () => {
   const [balance, setBalance] = useState(0);
@@ -10,6 +12,7 @@ const CustomerDashboard = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [redeemSuccess, setRedeemSuccess] = useState('');
+  const [reloadKey, setReloadKey] = useState(0);
   
   const { user } = useAuth();
   
@@ -19,17 +22,19 @@ const CustomerDashboard = () => {
       setError('');
       
       try {
-        // Fetch balance
-        const balanceResponse = await axios.get('/api/customer/balance');
-        setBalance(balanceResponse.data.balance);
-        
-        // Fetch available vouchers
-        const vouchersResponse = await axios.get('/api/customer/available-vouchers');
-        setAvailableVouchers(vouchersResponse.data);
-        
-        // Fetch customer's redemptions
-        const redemptionsResponse = await axios.get('/api/customer/redemptions');
-        setMyRedemptions(redemptionsResponse.data);
+        // Balance and the first page of available vouchers and of the customer's redemptions in one
+        // request; longer lists continue on their own routes
+        const response = await axios.get('/api/customer/dashboard');
+        const { balance, availableVouchers, redemptions, nextAfterId } = response.data;
+        setBalance(balance);
+        setAvailableVouchers(nextAfterId.availableVouchers === null ? availableVouchers : [
+          ...availableVouchers,
+          ...await fetchAllPages('/api/customer/available-vouchers', nextAfterId.availableVouchers)
+        ]);
+        setMyRedemptions(nextAfterId.redemptions === null ? redemptions : [
+          ...redemptions,
+          ...await fetchAllPages('/api/customer/redemptions', nextAfterId.redemptions)
+        ]);
         
       } catch (error) {
         setError('Error fetching data: ' + (error.response?.data?.message || error.message));
@@ -39,7 +44,30 @@ const CustomerDashboard = () => {
     };
     
     fetchData();
-  }, []);
+  }, [reloadKey]);
+  
+  // Apply changes pushed by the server instead of refetching after every action
+  const upsertRedemption = (redemption) => {
+    setMyRedemptions(current => current.some(r => r.id === redemption.id)
+      ? current.map(r => (r.id === redemption.id ? { ...r, ...redemption } : r))
+      : [...current, redemption]);
+  };
+  
+  const applyVoucher = (voucher) => {
+    setAvailableVouchers(current => {
+      const others = current.filter(v => v.id !== voucher.id);
+      return voucher.isActive ? [...others, voucher].sort((a, b) => a.id - b.id) : others;
+    });
+  };
+  
+  useEventFeed({
+    balance: (data) => setBalance(data.balance),
+    voucher_created: applyVoucher,
+    voucher_status_changed: applyVoucher,
+    voucher_redeemed: upsertRedemption,
+    redemption_fulfilled: upsertRedemption,
+    resync: () => setReloadKey(key => key + 1)
+  });
   
   const handleRedeemVoucher = async (voucherId) => {
     try {
@@ -48,12 +76,7 @@ const CustomerDashboard = () => {
       
       const response = await axios.post(`/api/customer/redeem-voucher/${voucherId}`);
       
-      // Refresh data after redemption
-      const balanceResponse = await axios.get('/api/customer/balance');
-      setBalance(balanceResponse.data.balance);
-      
-      const redemptionsResponse = await axios.get('/api/customer/redemptions');
-      setMyRedemptions(redemptionsResponse.data);
+      // The new balance and redemption arrive over the event feed
       
       setRedeemSuccess(`Voucher redeemed successfully! Redemption ID: ${response.data.redemption_id}`);
     } catch (error) {
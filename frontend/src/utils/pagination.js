@@ -0,0 +1,15 @@
+import axios from 'axios';
+
+// List routes return one page at a time, with the cursor of the next page in X-Next-After-Id.
+// Fetches every item of `url` after `afterId` by following that cursor to the end.
+export const fetchAllPages = async (url, afterId = 0) => {
+  const items = [];
+  let cursor = afterId;
+  while (cursor !== null) {
+    const response = await axios.get(url, { params: cursor ? { after_id: cursor } : {} });
+    items.push(...response.data);
+    const next = response.headers['x-next-after-id'];
+    cursor = next ? Number(next) : null;
+  }
+  return items;
+};